@@ -0,0 +1,51 @@
+# This Python file uses the following encoding: utf-8
+import time
+
+
+class AnalysisResult:
+    """One analysis of a rewrite, as stored in the analyses table
+
+    latency is the wall time of the request in seconds. Token counts are
+    None when the API did not report usage, e.g. for cached responses.
+    error holds the APIError of a failed request; it is not stored.
+    """
+    # Column order used by Database when reading and writing analyses
+    COLUMNS = ('id', 'excerpt_id', 'model', 'prompt_name', 'rewrite', 'response',
+               'latency', 'prompt_tokens', 'completion_tokens', 'cached', 'created_at')
+
+    __slots__ = COLUMNS + ('error',)
+
+    def __init__(self, excerpt_id=None, model=None, prompt_name=None, rewrite=None, response=None,
+                 latency=None, prompt_tokens=None, completion_tokens=None, cached=False,
+                 created_at=None, id=None):
+        """Initialize the result"""
+        self.id = id
+        self.excerpt_id = excerpt_id
+        self.model = model
+        self.prompt_name = prompt_name
+        self.rewrite = rewrite
+        self.response = response
+        self.latency = latency
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached = bool(cached)
+        self.created_at = created_at if created_at is not None else time.time()
+        self.error = None
+
+    @classmethod
+    def from_row(cls, row):
+        """Build a result from a row selected in COLUMNS order"""
+        return cls(**dict(zip(cls.COLUMNS, row)))
+
+    @property
+    def total_tokens(self):
+        """Prompt plus completion tokens, or None if usage is unknown"""
+        if self.prompt_tokens is None and self.completion_tokens is None:
+            return None
+        return (self.prompt_tokens or 0) + (self.completion_tokens or 0)
+
+    def set_usage(self, usage):
+        """Copy token counts from an API usage object, if there is one"""
+        if usage is not None:
+            self.prompt_tokens = getattr(usage, 'prompt_tokens', None)
+            self.completion_tokens = getattr(usage, 'completion_tokens', None)
@@ -0,0 +1,162 @@
+# This Python file uses the following encoding: utf-8
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from analysis_result import AnalysisResult
+
+
+class BatchAnalyzer:
+    """Analyzes every excerpt that has a rewrite with bounded concurrency
+
+    Results are written to the batch_results table as they complete, keyed
+    by run name, so re-running the same run resumes where it stopped.
+    While the API's circuit breaker is open the run pauses instead of
+    failing every excerpt, and it stops once the API has been unavailable
+    for max_pause seconds.
+    """
+
+    # Longest time to wait for the API to recover before stopping the run
+    MAX_PAUSE = 5 * 60  # seconds
+
+    def __init__(self, db, openai_api, prompt_template, prompt_name="Basic Analysis",
+                 run_name=None, max_workers=4, flush_every=20, max_pause=MAX_PAUSE):
+        """Initialize the batch run"""
+        self.db = db
+        self.openai_api = openai_api
+        self.prompt_template = prompt_template
+        self.prompt_name = prompt_name
+        self.model = openai_api.model
+        self.run_name = run_name if run_name else f"{self.model}:{prompt_name}"
+        self.max_workers = max(1, max_workers)
+        self.flush_every = max(1, flush_every)
+        self.max_pause = max_pause
+
+    def run(self, progress_callback=None, should_cancel=None):
+        """Run the batch and return (success, message)
+
+        progress_callback receives a dict with done, failed, total, rate
+        (excerpts per second), eta (seconds, or None) and paused (seconds
+        until the API is tried again, or 0). should_cancel is polled between
+        submissions and while waiting to retry; in-flight requests are
+        allowed to finish and are saved before returning.
+        """
+        total = self.db.count_pending_batch_excerpts(self.run_name)
+        if total == 0:
+            return True, f"Nothing to analyze for run '{self.run_name}'"
+
+        done = 0
+        failed = 0
+        pending_results = []
+        started = time.monotonic()
+        # Rows are read a page at a time; rows refused while the circuit was open are retried first
+        pending = self.db.iter_pending_batch_excerpts(self.run_name)
+        requeued = []
+        cancelled = False
+        unavailable = False
+        breaker = self.openai_api.breaker
+        paused_since = None
+
+        def report():
+            if not progress_callback:
+                return
+            elapsed = time.monotonic() - started
+            rate = done / elapsed if elapsed > 0 else 0.0
+            eta = (total - done) / rate if rate > 0 else None
+            progress_callback({
+                'done': done,
+                'failed': failed,
+                'total': total,
+                'rate': rate,
+                'eta': eta,
+                'paused': breaker.retry_in() if paused_since is not None else 0
+            })
+
+        def flush():
+            if pending_results:
+                self.db.save_batch_results(self.run_name, self.model, self.prompt_name, pending_results)
+                pending_results.clear()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            in_flight = {}
+            while True:
+                if should_cancel and should_cancel():
+                    cancelled = True
+                if paused_since is not None and time.monotonic() - paused_since > self.max_pause:
+                    unavailable = True
+
+                # Keep at most two requests queued per worker, and none while the circuit is open
+                while (not cancelled and not unavailable and len(in_flight) < self.max_workers * 2
+                       and breaker.retry_in() == 0):
+                    row = requeued.pop() if requeued else next(pending, None)
+                    if row is None:
+                        break
+                    result = AnalysisResult(excerpt_id=row[0])
+                    future = pool.submit(self.openai_api.analyze_rewrite, row[1], row[2], self.prompt_template,
+                                         result=result, should_cancel=should_cancel)
+                    in_flight[future] = (row, result)
+
+                if not in_flight:
+                    if cancelled or unavailable or (not requeued and breaker.retry_in() == 0):
+                        break
+                    # Paused until the circuit breaker lets a trial request through
+                    if paused_since is None:
+                        paused_since = time.monotonic()
+                    report()
+                    time.sleep(min(breaker.retry_in(), 1.0))
+                    continue
+
+                completed, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    row, result = in_flight.pop(future)
+                    try:
+                        success, response = future.result()
+                    except Exception as e:
+                        success, response = False, str(e)
+                    error = result.error
+                    if error is not None and error.kind in ('circuit_open', 'cancelled'):
+                        # Never sent; it stays pending for later in this run or a resumed one
+                        if error.kind == 'circuit_open':
+                            requeued.append(row)
+                            if paused_since is None:
+                                paused_since = time.monotonic()
+                        continue
+                    if success:
+                        paused_since = None
+                    pending_results.append((row[0], success, response))
+                    done += 1
+                    if not success:
+                        failed += 1
+
+                if len(pending_results) >= self.flush_every:
+                    flush()
+                report()
+
+        flush()
+        report()
+
+        elapsed = time.monotonic() - started
+        status = "cancelled" if cancelled else "stopped, API unavailable" if unavailable else "finished"
+        return failed == 0 and not unavailable, (f"Batch run '{self.run_name}' {status}: {done - failed} analyzed, "
+                             f"{failed} failed in {elapsed:.1f}s")
+
+
+def format_progress(progress):
+    """Format a progress dict as a single status line"""
+    eta = progress['eta']
+    eta_text = f"{eta:.0f}s" if eta is not None else "--"
+    status = (f"{progress['done']}/{progress['total']} done, {progress['failed']} failed, "
+              f"{progress['rate']:.2f}/s, ETA {eta_text}")
+    if progress.get('paused'):
+        status += f", API unavailable, retrying in {progress['paused']:.0f}s"
+    return status
+
+
+def main(argv=None):
+    """Run a batch analysis without the GUI; same as python -m rewrites batch"""
+    from rewrites import main as cli_main
+    return cli_main(["batch"] + list(sys.argv[1:] if argv is None else argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
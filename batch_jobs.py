@@ -0,0 +1,230 @@
+# This Python file uses the following encoding: utf-8
+import json
+import time
+import tempfile
+
+from resilience import APIError, call_with_retries
+
+# Batch states after which the provider does no more work on a job
+TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class BatchJobManager:
+    """Analyzes whole corpora through the provider's Batch API
+
+    submit() renders the pending excerpts of a run into JSONL request
+    files, uploads them and creates one batch per file; poll() tracks the
+    jobs in the batch_jobs table and, once a job ends, downloads its output
+    and error files and writes every result to batch_results in a single
+    transaction. Run names are shared with BatchAnalyzer, so excerpts left
+    over by either can be finished by the other.
+    """
+
+    # Provider limits per batch: requests and input file size
+    MAX_REQUESTS_PER_JOB = 50000
+    MAX_BYTES_PER_JOB = 190 * 1024 * 1024
+
+    ENDPOINT = "/v1/chat/completions"
+    COMPLETION_WINDOW = "24h"
+
+    def __init__(self, db, openai_api):
+        """Initialize the manager"""
+        self.db = db
+        self.openai_api = openai_api
+
+    def call(self, fn):
+        """Make one provider call with the API's retry policy and circuit breaker"""
+        return call_with_retries(fn, self.openai_api.retry_policy, self.openai_api.breaker)
+
+    def default_run_name(self, prompt_name):
+        """Return the run name BatchAnalyzer would use for the same model and prompt"""
+        return f"{self.openai_api.model}:{prompt_name}"
+
+    def build_request(self, excerpt_id, excerpt, rewrite, prompt_template):
+        """Return one line of a batch input file"""
+        return json.dumps({
+            'custom_id': f"excerpt-{excerpt_id}",
+            'method': "POST",
+            'url': self.ENDPOINT,
+            'body': {
+                'model': self.openai_api.model,
+                'messages': self.openai_api.build_messages(excerpt, rewrite, prompt_template),
+                'temperature': self.openai_api.temperature,
+            },
+        }, ensure_ascii=False) + "\n"
+
+    def submit(self, prompt_template, prompt_name="Basic Analysis", run_name=None, limit=None):
+        """Submit the pending excerpts of a run as batch jobs and return (success, message)
+
+        Refuses to submit while the run still has jobs that have not been
+        imported, so no excerpt is sent twice. limit caps the number of
+        excerpts submitted.
+        """
+        run_name = run_name if run_name else self.default_run_name(prompt_name)
+        active = self.db.get_batch_jobs(run_name=run_name, active_only=True)
+        if active:
+            return False, f"Run '{run_name}' already has {len(active)} unfinished job(s); poll them first."
+
+        submitted = 0
+        jobs = 0
+        last_id = 0
+        try:
+            client = self.openai_api.require_client()
+            while limit is None or submitted < limit:
+                with tempfile.TemporaryFile() as file:
+                    count, last_id = self.write_requests(file, run_name, prompt_template, last_id,
+                                                         None if limit is None else limit - submitted)
+                    if count == 0:
+                        break
+                    self.create_job(client, file, run_name, prompt_name, count)
+                submitted += count
+                jobs += 1
+        except APIError as e:
+            done = f" after submitting {submitted} request(s) in {jobs} job(s)" if jobs else ""
+            return False, f"Batch submission failed{done}: {e}"
+
+        if jobs == 0:
+            return True, f"Nothing to submit for run '{run_name}'"
+        return True, f"Submitted {submitted} request(s) in {jobs} job(s) for run '{run_name}'"
+
+    def write_requests(self, file, run_name, prompt_template, after_id, limit=None):
+        """Write the next job's worth of requests to file and return (count, last excerpt id)"""
+        count = 0
+        size = 0
+        last_id = after_id
+        for excerpt_id, excerpt, rewrite in self.db.iter_pending_batch_excerpts(run_name, after_id):
+            line = self.build_request(excerpt_id, excerpt, rewrite, prompt_template).encode("utf-8")
+            if count and (count >= self.MAX_REQUESTS_PER_JOB or size + len(line) > self.MAX_BYTES_PER_JOB):
+                break
+            if limit is not None and count >= limit:
+                break
+            file.write(line)
+            count += 1
+            size += len(line)
+            last_id = excerpt_id
+        return count, last_id
+
+    def create_job(self, client, file, run_name, prompt_name, count):
+        """Upload a request file, create its batch and record the job"""
+        def upload():
+            file.seek(0)
+            return client.files.create(file=("rewrites-batch.jsonl", file), purpose="batch")
+
+        uploaded = self.call(upload)
+        batch = self.call(lambda: client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=self.ENDPOINT,
+            completion_window=self.COMPLETION_WINDOW,
+            metadata={'run_name': run_name[:512]},
+        ))
+        job_id = self.db.create_batch_job(run_name, self.openai_api.model, prompt_name, batch.id, uploaded.id,
+                                          batch.status, count)
+        if job_id is None:
+            # The batch exists but would be untracked; don't leave it running
+            self.call(lambda: client.batches.cancel(batch.id))
+            raise APIError(f"Could not record batch {batch.id}; it was cancelled.", kind='unknown')
+        return job_id
+
+    def poll(self):
+        """Refresh every unfinished job, import the finished ones and return (success, message)"""
+        jobs = self.db.get_batch_jobs(active_only=True)
+        if not jobs:
+            return True, "No unfinished batch jobs"
+        lines = []
+        success = True
+        try:
+            client = self.openai_api.require_client()
+        except APIError as e:
+            return False, str(e)
+        for job in jobs:
+            try:
+                lines.append(self.poll_job(client, job))
+            except APIError as e:
+                success = False
+                lines.append(f"Job {job['id']} ({job['batch_id']}): {e}")
+        return success, "\n".join(lines)
+
+    def poll_job(self, client, job):
+        """Refresh one job, importing its results once it has ended, and return a status line"""
+        batch = self.call(lambda: client.batches.retrieve(job['batch_id']))
+        counts = batch.request_counts
+        fields = {
+            'status': batch.status,
+            'output_file_id': batch.output_file_id,
+            'error_file_id': batch.error_file_id,
+            'completed_count': counts.completed if counts else 0,
+            'failed_count': counts.failed if counts else 0,
+        }
+        label = f"Job {job['id']} ({job['batch_id']}, run '{job['run_name']}')"
+        if batch.status not in TERMINAL_STATUSES:
+            self.db.update_batch_job(job['id'], **fields)
+            return f"{label}: {batch.status}, {fields['completed_count']}/{job['request_count']} done"
+
+        if batch.status == 'failed':
+            errors = getattr(batch, 'errors', None)
+            messages = [error.message for error in (getattr(errors, 'data', None) or []) if error.message]
+            fields['error'] = "; ".join(messages) or "Batch failed"
+        results = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                results.extend(self.read_results(client, file_id))
+        if not self.db.import_batch_job_results(job['id'], results, **fields):
+            raise APIError("Could not save the results; poll again to retry.", kind='unknown')
+        succeeded = sum(1 for _, ok, _ in results if ok)
+        return f"{label}: {batch.status}, imported {succeeded} result(s), {len(results) - succeeded} failed"
+
+    def read_results(self, client, file_id):
+        """Download an output or error file and return its (excerpt_id, success, response) results"""
+        def download():
+            with client.files.with_streaming_response.content(file_id) as response:
+                return [parse_result_line(line) for line in response.iter_lines() if line.strip()]
+        return [result for result in self.call(download) if result is not None]
+
+    def cancel(self, job_id):
+        """Ask the provider to cancel a job; results finished so far are imported by poll()"""
+        job = next((job for job in self.db.get_batch_jobs(active_only=True) if job['id'] == job_id), None)
+        if job is None:
+            return False, f"No unfinished batch job {job_id}"
+        try:
+            client = self.openai_api.require_client()
+            batch = self.call(lambda: client.batches.cancel(job['batch_id']))
+        except APIError as e:
+            return False, str(e)
+        self.db.update_batch_job(job_id, status=batch.status)
+        return True, f"Job {job_id} is {batch.status}"
+
+    def wait(self, interval=60.0, timeout=None, progress_callback=None, should_cancel=None):
+        """Poll until every job has been imported and return (success, message) of the last poll"""
+        started = time.monotonic()
+        while True:
+            success, message = self.poll()
+            if progress_callback:
+                progress_callback(message)
+            if not self.db.get_batch_jobs(active_only=True):
+                return success, message
+            if timeout is not None and time.monotonic() - started >= timeout:
+                return False, "Timed out waiting for batch jobs"
+            deadline = time.monotonic() + interval
+            while time.monotonic() < deadline:
+                if should_cancel and should_cancel():
+                    return False, "Stopped waiting; the jobs keep running, poll again later"
+                time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+
+
+def parse_result_line(line):
+    """Parse one line of a batch output or error file into (excerpt_id, success, response)"""
+    record = json.loads(line)
+    custom_id = record.get('custom_id') or ""
+    if not custom_id.startswith("excerpt-"):
+        return None
+    excerpt_id = int(custom_id[len("excerpt-"):])
+    response = record.get('response') or {}
+    body = response.get('body') or {}
+    error = record.get('error') or body.get('error')
+    if response.get('status_code') == 200 and not error:
+        try:
+            return excerpt_id, True, body['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError):
+            error = {'message': "Malformed response"}
+    message = error.get('message') if isinstance(error, dict) else str(error or "Request failed")
+    return excerpt_id, False, f"Batch request failed: {message}"
@@ -0,0 +1,279 @@
+# This Python file uses the following encoding: utf-8
+"""Benchmarks for the Database hot paths on synthetic corpora
+
+Runs headless with no network access. Each corpus size gets a fresh
+database built by import_csv from a seeded, generated CSV, after which
+the read paths are sampled and the exports timed. Results are printed
+and saved as JSON; pass --compare to check them against an earlier run.
+
+    python benchmarks/bench_database.py --sizes 100000 1000000 --output results.json
+    python benchmarks/bench_database.py --compare results.json
+"""
+import os
+import sys
+import csv
+import json
+import math
+import shutil
+import time
+import random
+import sqlite3
+import platform
+import argparse
+import resource
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+
+BENCHMARKS = ('import_csv', 'get_random_excerpt', 'get_random_excerpt_no_repeat', 'get_next_excerpt',
+              'get_previous_excerpt', 'search', 'export_to_csv', 'export_to_json')
+
+
+def reset_peak_rss():
+    """Reset the peak RSS counter where the platform allows it (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Return the peak RSS in MB since the last reset, or since process start"""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def generate_corpus(path, rows, seed):
+    """Write a CSV of rows synthetic excerpts built from a seeded vocabulary"""
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 10)))
+                  for _ in range(20000)]
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Excerpt", "Analysis", "Rewrite"])
+        for _ in range(rows):
+            excerpt = " ".join(rng.choices(vocabulary, k=rng.randint(15, 60)))
+            analysis = " ".join(rng.choices(vocabulary, k=rng.randint(0, 20)))
+            rewrite = " ".join(rng.choices(vocabulary, k=rng.randint(0, 40)))
+            writer.writerow([excerpt.capitalize() + ".", analysis, rewrite])
+    return vocabulary
+
+
+def measure_calls(name, size, call, samples):
+    """Time samples calls of call() and summarize their latency"""
+    reset_peak_rss()
+    latencies = []
+    started = time.perf_counter()
+    for index in range(samples):
+        begin = time.perf_counter_ns()
+        call(index)
+        latencies.append((time.perf_counter_ns() - begin) / 1e6)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'benchmark': name,
+        'size': size,
+        'count': samples,
+        'seconds': elapsed,
+        'p50_ms': percentile(latencies, 0.50),
+        'p99_ms': percentile(latencies, 0.99),
+        'mean_ms': sum(latencies) / len(latencies),
+        'ops_per_sec': samples / elapsed if elapsed > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def measure_bulk(name, size, call, path=None):
+    """Time one bulk operation over size rows"""
+    reset_peak_rss()
+    started = time.perf_counter()
+    success, message = call()
+    elapsed = time.perf_counter() - started
+    if not success:
+        raise RuntimeError(f"{name} failed: {message}")
+    result = {
+        'benchmark': name,
+        'size': size,
+        'count': size,
+        'seconds': elapsed,
+        'rows_per_sec': size / elapsed if elapsed > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if path and os.path.exists(path):
+        result['bytes'] = os.path.getsize(path)
+        result['mb_per_sec'] = result['bytes'] / (1024 * 1024) / elapsed if elapsed > 0 else None
+    return result
+
+
+def run_size(size, workdir, samples, seed, selected):
+    """Run the selected benchmarks against a fresh database of size rows"""
+    csv_path = os.path.join(workdir, f"corpus-{size}-{seed}.csv")
+    vocabulary_path = csv_path + ".vocabulary.json"
+    if os.path.exists(csv_path) and os.path.exists(vocabulary_path):
+        with open(vocabulary_path, encoding="utf-8") as file:
+            vocabulary = json.load(file)
+    else:
+        print(f"Generating {size} rows...", file=sys.stderr)
+        vocabulary = generate_corpus(csv_path, size, seed)
+        with open(vocabulary_path, "w", encoding="utf-8") as file:
+            json.dump(vocabulary, file)
+
+    db_path = os.path.join(workdir, f"bench-{size}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    db = Database(db_path)
+    results = []
+    rng = random.Random(seed)
+    try:
+        # The import always runs, since every other benchmark needs the data
+        print(f"[{size}] import_csv", file=sys.stderr)
+        result = measure_bulk('import_csv', size, lambda: db.import_csv(csv_path), csv_path)
+        if 'import_csv' in selected:
+            results.append(result)
+
+        low, high = db.conn.execute(
+            "SELECT (SELECT MIN(id) FROM excerpts), (SELECT MAX(id) FROM excerpts)").fetchone()
+        ids = [rng.randint(low, high) for _ in range(samples)]
+        words = rng.choices(vocabulary, k=samples)
+
+        point_benchmarks = {
+            'get_random_excerpt': lambda index: db.get_random_excerpt(),
+            'get_random_excerpt_no_repeat': lambda index: db.get_random_excerpt(no_repeat=True),
+            'get_next_excerpt': lambda index: db.get_next_excerpt(ids[index]),
+            'get_previous_excerpt': lambda index: db.get_previous_excerpt(ids[index]),
+            'search': lambda index: db.search(words[index]),
+        }
+        for name, call in point_benchmarks.items():
+            if name in selected:
+                print(f"[{size}] {name}", file=sys.stderr)
+                results.append(measure_calls(name, size, call, samples))
+
+        exports = {
+            'export_to_csv': (db.export_to_csv, "export.csv"),
+            'export_to_json': (db.export_to_json, "export.json"),
+        }
+        for name, (export, file_name) in exports.items():
+            if name in selected:
+                print(f"[{size}] {name}", file=sys.stderr)
+                path = os.path.join(workdir, file_name)
+                results.append(measure_bulk(name, size, lambda: export(path), path))
+                os.remove(path)
+    finally:
+        db.close()
+    return results
+
+
+def describe_environment(seed, samples):
+    """Collect the versions and settings a result depends on"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'seed': seed,
+        'samples': samples,
+    }
+
+
+def format_result(result):
+    """Format one result as a table row"""
+    if 'p50_ms' in result:
+        detail = (f"p50 {result['p50_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms  "
+                  f"{result['ops_per_sec']:10.0f} ops/s")
+    else:
+        detail = f"{result['seconds']:8.2f} s  {result['rows_per_sec']:10.0f} rows/s"
+    return (f"{result['size']:>10}  {result['benchmark']:<30}{detail}  "
+            f"peak RSS {result['peak_rss_mb']:.0f} MB")
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline run and return the regressions"""
+    previous = {(result['size'], result['benchmark']): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['size'], result['benchmark']))
+        if not before:
+            continue
+        # Point lookups are compared on p99 latency, bulk operations on total time
+        metric = 'p99_ms' if 'p99_ms' in result else 'seconds'
+        if not before.get(metric):
+            continue
+        ratio = result[metric] / before[metric]
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{result['size']:>10}  {result['benchmark']:<30}{metric} x{ratio:5.2f}  {flag}")
+        if flag:
+            regressions.append(result)
+    return regressions
+
+
+def main(argv=None):
+    """Run the benchmarks and save the results"""
+    parser = argparse.ArgumentParser(description="Benchmark the Database hot paths on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000], help="Corpus sizes in rows")
+    parser.add_argument("--samples", type=int, default=1000, help="Calls per point benchmark")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the corpus and the sampled ids")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Run only these benchmarks")
+    parser.add_argument("--workdir", help="Directory for corpora and databases (kept between runs)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Slowdown ratio reported as a regression (default 1.2)")
+    args = parser.parse_args(argv)
+
+    selected = set(args.only or BENCHMARKS)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rewrites-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    try:
+        for size in args.sizes:
+            for result in run_size(size, workdir, args.samples, args.seed, selected):
+                print(format_result(result))
+                results.append(result)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'environment': describe_environment(args.seed, args.samples), 'results': results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+        print(f"Results saved to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# This Python file uses the following encoding: utf-8
+"""Startup time of the GUI, measured in fresh processes
+
+Each run starts a new interpreter that imports mainwindow, shows the
+window and waits for the deferred startup work, reporting when each
+phase finished relative to the start of the process. By default Qt uses
+the offscreen platform, so no display is needed.
+
+    python benchmarks/bench_startup.py --runs 10 --output startup.json
+    python benchmarks/bench_startup.py --compare startup.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS_DIR)
+sys.path[:0] = [ROOT, BENCHMARKS_DIR]
+from bench_database import percentile, describe_environment, compare
+
+# Phases in the order they finish
+PHASES = ('imports', 'init', 'shown', 'deferred', 'settings_tab', 'process')
+
+
+def measure_child():
+    """Start the app in this process and print the phase times as JSON"""
+    started = time.perf_counter()
+    from PySide6.QtWidgets import QApplication
+    import mainwindow
+    from instrumentation import instruments
+    imported = time.perf_counter()
+    instruments.set_enabled(True)
+
+    from PySide6.QtCore import QTimer
+    app = QApplication(sys.argv)
+    window = mainwindow.MainWindow()
+    window.show()
+
+    # Run the event loop until the deferred startup work has been recorded
+    poll = QTimer()
+    poll.timeout.connect(lambda: app.quit() if "ui.startup.deferred" in instruments.snapshot() else None)
+    poll.start(1)
+    QTimer.singleShot(30000, app.quit)
+    app.exec()
+    poll.stop()
+    stats = instruments.snapshot()
+
+    # Opening the settings tab for the first time builds it
+    tab_started = time.perf_counter()
+    window.ui.Tabs.setCurrentWidget(window.ui.Settings)
+    app.processEvents()
+    tab_ms = (time.perf_counter() - tab_started) * 1000
+
+    # The window's own timers start at MainWindow.__init__, after the imports
+    offset_ms = (imported - started) * 1000
+    print(json.dumps({
+        'imports': offset_ms,
+        'init': offset_ms + stats['ui.startup.init']['total_ms'],
+        'shown': offset_ms + stats['ui.startup.shown']['total_ms'],
+        'deferred': offset_ms + stats['ui.startup.deferred']['total_ms'],
+        'settings_tab': tab_ms,
+        'modules': {name: name in sys.modules for name in ('openai', 'httpx', 'markdown')},
+    }))
+    window.close()
+    return 0
+
+
+def run_once(workdir, platform):
+    """Time one startup in a fresh interpreter"""
+    env = dict(os.environ, QT_QPA_PLATFORM=platform)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], cwd=workdir, env=env,
+                               capture_output=True, text=True, timeout=120)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"Startup failed:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process'] = elapsed_ms
+    return result
+
+
+def main(argv=None):
+    """Measure the startup phases over several runs and save the results"""
+    parser = argparse.ArgumentParser(description="Measure the GUI startup time")
+    parser.add_argument("--runs", type=int, default=10, help="Number of fresh processes to start")
+    parser.add_argument("--platform", default="offscreen", help="Qt platform plugin (default offscreen)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Slowdown ratio reported as a regression (default 1.2)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return measure_child()
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="rewrites-startup-") as workdir:
+        for _ in range(args.runs):
+            runs.append(run_once(workdir, args.platform))
+
+    results = []
+    for phase in PHASES:
+        values = sorted(run[phase] for run in runs)
+        results.append({'benchmark': f"startup.{phase}", 'size': 0, 'count': len(values),
+                        'p50_ms': percentile(values, 0.50), 'p99_ms': percentile(values, 0.99)})
+        print(f"{phase:<14}p50 {results[-1]['p50_ms']:8.1f} ms  max {values[-1]:8.1f} ms")
+    loaded = [name for name, present in runs[-1]['modules'].items() if present]
+    print(f"Loaded during startup: {', '.join(loaded) or 'none of openai, httpx, markdown'}")
+
+    report = {'environment': describe_environment(None, args.runs), 'results': results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+        print(f"Results saved to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,47 +2,173 @@
 import sqlite3
 import csv
 import os
+import json
+import gzip
+import time
+import hashlib
+import random
+import re
+import threading
+import unicodedata
+import weakref
+from contextlib import contextmanager
 from pathlib import Path
+from analysis_result import AnalysisResult
+from instrumentation import instruments
 
+# Connection management, schema setup and listener plumbing are not timed
+@instruments.instrument_class("db", exclude=(
+    'open_connection', 'connect', 'close', 'create_tables', 'create_search_index', 'create_search_triggers',
+    'check_and_add_content_hash_column', 'check_and_add_model_column', 'bulk_write_pragmas',
+    'add_change_listener', 'remove_change_listener', 'notify_change',
+    'iter_excerpt_pages', 'iter_excerpts'))
 class Database:
+    # Number of uniform id probes before get_random_excerpt falls back to an offset lookup
+    RANDOM_SAMPLE_ATTEMPTS = 8
+    
+    # Columns of the single settings row (id = 1)
+    SETTINGS_COLUMNS = ('api_key', 'model', 'font_family', 'font_size', 'random_no_repeat', 'model_filter')
+    
+    # How import_csv handles rows whose excerpt is already in the database
+    IMPORT_MODES = ('skip', 'update', 'keep-both')
+    
+    # bm25 weights of the excerpt, analysis and rewrite columns in search()
+    SEARCH_WEIGHTS = (3.0, 1.0, 2.0)
+    
+    # Columns of excerpt rows, and the filters iter_excerpts and count_excerpts accept
+    EXCERPT_COLUMNS = ('id', 'excerpt', 'analysis', 'rewrite')
+    EXCERPT_FILTERS = ('has_analysis', 'has_rewrite', 'pending_run', 'text')
+    
+    # Rows per query when walking the excerpts table
+    EXCERPT_PAGE_SIZE = 1000
+    
+    # Orders offered by get_excerpt_previews; text is ordered by an indexed
+    # case-insensitive prefix, so every page is an index range scan
+    EXCERPT_SORT_PREFIX = 32
+    EXCERPT_SORT_KEYS = {'id': "e.id", 'excerpt': f"substr(e.excerpt, 1, {EXCERPT_SORT_PREFIX}) COLLATE NOCASE"}
+    
+    # Characters of each column returned by get_excerpt_previews
+    PREVIEW_CHARS = 120
+    
+    # Columns of the batch_jobs table, and those that change as a job progresses
+    BATCH_JOB_COLUMNS = ('id', 'run_name', 'model', 'prompt_name', 'batch_id', 'input_file_id', 'output_file_id',
+                         'error_file_id', 'status', 'request_count', 'completed_count', 'failed_count', 'error',
+                         'created_at', 'updated_at', 'imported_at')
+    BATCH_JOB_UPDATE_COLUMNS = ('output_file_id', 'error_file_id', 'status', 'request_count', 'completed_count',
+                                'failed_count', 'error')
+    
+    # Connection tuning applied to every per-thread connection
+    BUSY_TIMEOUT_MS = 5000
+    CACHE_SIZE_KB = 16384
+    MMAP_SIZE = 256 * 1024 * 1024
+    
     def __init__(self, db_path="rewrites.db"):
         """Initialize the database connection"""
         self.db_path = db_path
-        self.conn = None
-        self.cursor = None
+        
+        # Each thread gets its own connection, so the GUI, imports, exports,
+        # prefetching and analysis workers can use the database concurrently
+        self.local = threading.local()
+        self.connections = {}
+        self.connections_lock = threading.Lock()
+        
+        # Response cache configuration and counters
+        self.cache_enabled = True
+        self.cache_max_entries = 1000
+        self.cache_max_bytes = 50 * 1024 * 1024
+        self.cache_max_age = 30 * 24 * 60 * 60  # seconds
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # Callbacks notified of writes to the excerpts table
+        self.change_listeners = []
+        
+        # Set by create_tables once the full-text index is available
+        self.fts_enabled = False
         self.connect()
         self.create_tables()
     
+    @property
+    def conn(self):
+        """The calling thread's connection, opened on first use"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.open_connection()
+        return conn
+    
+    def open_connection(self):
+        """Open and register a tuned connection for the calling thread"""
+        # check_same_thread is off only so close() can close every thread's connection
+        conn = sqlite3.connect(self.db_path, timeout=self.BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+        try:
+            # WAL lets readers run while another connection writes; it persists in the file
+            conn.execute("PRAGMA journal_mode = WAL")
+        except sqlite3.OperationalError as e:
+            print(f"Could not enable WAL journal mode: {e}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{self.CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {self.MMAP_SIZE}")
+        conn.create_function("excerpt_hash", 1, self.hash_excerpt, deterministic=True)
+        
+        thread = threading.current_thread()
+        with self.connections_lock:
+            # Close connections left behind by threads that have exited
+            for ident, (thread_ref, old_conn) in list(self.connections.items()):
+                if thread_ref() is None or not thread_ref().is_alive():
+                    old_conn.close()
+                    del self.connections[ident]
+            self.connections[thread.ident] = (weakref.ref(thread), conn)
+        self.local.conn = conn
+        return conn
+    
     def connect(self):
         """Connect to the SQLite database"""
         try:
-            self.conn = sqlite3.connect(self.db_path)
-            self.cursor = self.conn.cursor()
+            self.conn
             return True
         except sqlite3.Error as e:
             print(f"Database connection error: {e}")
             return False
     
     def close(self):
-        """Close the database connection"""
-        if self.conn:
-            self.conn.close()
+        """Close every thread's database connection"""
+        with self.connections_lock:
+            for thread_ref, conn in self.connections.values():
+                conn.close()
+            self.connections.clear()
+        self.local = threading.local()
     
     def create_tables(self):
         """Create the necessary tables if they don't exist"""
         try:
+            cursor = self.conn.cursor()
             # Create excerpts table
-            self.cursor.execute('''
+            cursor.execute('''
                 CREATE TABLE IF NOT EXISTS excerpts (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     excerpt TEXT NOT NULL,
                     analysis TEXT,
-                    rewrite TEXT
+                    rewrite TEXT,
+                    content_hash TEXT
                 )
             ''')
             
+            # Unique content hashes make re-imports idempotent
+            self.check_and_add_content_hash_column(cursor)
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_excerpts_content_hash
+                ON excerpts (content_hash)
+            ''')
+            
+            # The excerpt browser pages through excerpts in text order
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_excerpts_sort
+                ON excerpts (substr(excerpt, 1, {self.EXCERPT_SORT_PREFIX}) COLLATE NOCASE, id)
+            ''')
+            
             # Create prompts table
-            self.cursor.execute('''
+            cursor.execute('''
                 CREATE TABLE IF NOT EXISTS prompts (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     name TEXT NOT NULL,
@@ -50,25 +176,125 @@ class Database:
                 )
             ''')
             
+            # Prompt names are unique; keep the most recently saved of any duplicates
+            # left by older versions before adding the index
+            cursor.execute('''
+                DELETE FROM prompts WHERE id NOT IN (SELECT MAX(id) FROM prompts GROUP BY name)
+            ''')
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_prompts_name ON prompts (name)")
+            
             # Create settings table
-            self.cursor.execute('''
+            cursor.execute('''
                 CREATE TABLE IF NOT EXISTS settings (
                     id INTEGER PRIMARY KEY,
                     api_key TEXT,
                     model TEXT DEFAULT "gpt-4",
                     font_family TEXT DEFAULT "Arial",
-                    font_size INTEGER DEFAULT 10
+                    font_size INTEGER DEFAULT 10,
+                    random_no_repeat INTEGER DEFAULT 0,
+                    model_filter TEXT,
+                    models_fetched_at REAL
                 )
             ''')
             
             # Create models table
-            self.cursor.execute('''
+            cursor.execute('''
                 CREATE TABLE IF NOT EXISTS models (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     model_id TEXT UNIQUE NOT NULL
                 )
             ''')
             
+            # Create response cache table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_response_cache_last_used
+                ON response_cache (last_used_at)
+            ''')
+            
+            # Create batch results table; one row per excerpt per batch run
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS batch_results (
+                    run_name TEXT NOT NULL,
+                    excerpt_id INTEGER NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_name TEXT,
+                    success INTEGER NOT NULL,
+                    response TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (run_name, excerpt_id)
+                )
+            ''')
+            
+            # Create the Batch API jobs table; results land in batch_results under run_name
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS batch_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_name TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_name TEXT,
+                    batch_id TEXT UNIQUE NOT NULL,
+                    input_file_id TEXT NOT NULL,
+                    output_file_id TEXT,
+                    error_file_id TEXT,
+                    status TEXT NOT NULL,
+                    request_count INTEGER NOT NULL DEFAULT 0,
+                    completed_count INTEGER NOT NULL DEFAULT 0,
+                    failed_count INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    imported_at REAL
+                )
+            ''')
+            
+            # Create the analysis history table; one row per analysis request
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    excerpt_id INTEGER NOT NULL,
+                    model TEXT,
+                    prompt_name TEXT,
+                    rewrite TEXT,
+                    response TEXT NOT NULL,
+                    latency REAL,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    cached INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            
+            # History is browsed newest first, overall or for one excerpt
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analyses_created
+                ON analyses (created_at, id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analyses_excerpt_created
+                ON analyses (excerpt_id, created_at, id)
+            ''')
+            
+            # Create the shuffled deck used for random selection without repeats
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS random_deck (
+                    position INTEGER PRIMARY KEY,
+                    excerpt_id INTEGER NOT NULL
+                )
+            ''')
+            
+            # Full-text index over the excerpts table
+            self.create_search_index(cursor)
+            
             # Check if model column exists in settings table and add it if it doesn't
             self.check_and_add_model_column()
             
@@ -78,64 +304,554 @@ class Database:
             print(f"Table creation error: {e}")
             return False
     
-    def import_csv(self, csv_path):
-        """Import excerpts from a CSV file"""
+    @staticmethod
+    def hash_excerpt(text):
+        """Hash an excerpt after normalizing Unicode form, case and whitespace"""
+        normalized = " ".join(unicodedata.normalize("NFC", text or "").casefold().split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    
+    def check_and_add_content_hash_column(self, cursor):
+        """Add and backfill the content_hash column of databases created before it existed
+
+        Only the oldest copy of each excerpt gets a hash; any duplicates
+        already stored keep a NULL hash, like rows imported with keep-both.
+        """
+        columns = [column[1] for column in cursor.execute("PRAGMA table_info(excerpts)").fetchall()]
+        if 'content_hash' in columns:
+            return
+        cursor.execute("ALTER TABLE excerpts ADD COLUMN content_hash TEXT")
+        cursor.execute('''
+            UPDATE excerpts SET content_hash = excerpt_hash(excerpt)
+            WHERE id IN (SELECT MIN(id) FROM excerpts GROUP BY excerpt_hash(excerpt))
+        ''')
+        print("Added missing 'content_hash' column to excerpts table")
+    
+    def create_search_index(self, cursor):
+        """Create the FTS5 mirror of the excerpts table and the triggers that keep it in sync
+
+        The index is external-content, so it stores only the inverted index
+        and reads the text back from excerpts. If the SQLite build lacks
+        FTS5, search() falls back to a LIKE scan.
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'excerpts_fts'").fetchone()
         try:
-            with open(csv_path, 'r', encoding='utf-8') as file:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS excerpts_fts USING fts5(
+                    excerpt, analysis, rewrite,
+                    content='excerpts', content_rowid='id'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search unavailable: {e}")
+            self.fts_enabled = False
+            return
+        self.fts_enabled = True
+        self.create_search_triggers(cursor)
+        
+        # Index excerpts stored before the index existed
+        if not exists:
+            cursor.execute("INSERT INTO excerpts_fts (excerpts_fts) VALUES ('rebuild')")
+    
+    def create_search_triggers(self, cursor):
+        """Create the triggers that mirror excerpt writes into excerpts_fts"""
+        # Holds a row only inside an import transaction; see _pause_search_indexing()
+        cursor.execute("CREATE TABLE IF NOT EXISTS fts_paused (id INTEGER PRIMARY KEY CHECK (id = 1))")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS excerpts_fts_insert AFTER INSERT ON excerpts
+            WHEN NOT EXISTS (SELECT 1 FROM fts_paused) BEGIN
+                INSERT INTO excerpts_fts (rowid, excerpt, analysis, rewrite)
+                VALUES (new.id, new.excerpt, new.analysis, new.rewrite);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS excerpts_fts_delete AFTER DELETE ON excerpts BEGIN
+                INSERT INTO excerpts_fts (excerpts_fts, rowid, excerpt, analysis, rewrite)
+                VALUES ('delete', old.id, old.excerpt, old.analysis, old.rewrite);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS excerpts_fts_update
+            AFTER UPDATE OF excerpt, analysis, rewrite ON excerpts BEGIN
+                INSERT INTO excerpts_fts (excerpts_fts, rowid, excerpt, analysis, rewrite)
+                VALUES ('delete', old.id, old.excerpt, old.analysis, old.rewrite);
+                INSERT INTO excerpts_fts (rowid, excerpt, analysis, rewrite)
+                VALUES (new.id, new.excerpt, new.analysis, new.rewrite);
+            END
+        ''')
+    
+    def import_csv(self, csv_path, mode="skip", chunk_size=1000, single_transaction=True, progress_callback=None):
+        """Import excerpts from a CSV file
+
+        Excerpts are matched by content hash. mode decides what happens to a
+        row whose excerpt is already stored: "skip" leaves the stored row
+        alone, "update" overwrites its analysis and rewrite with the
+        non-empty values from the file, and "keep-both" inserts the row as
+        a separate excerpt. Repeats within the file are handled the same way.
+
+        Rows are streamed from the file in chunks of chunk_size, staged in a
+        temporary table and merged with set-based SQL. With
+        single_transaction the whole import is committed at once (and rolled
+        back on error) and holds the write lock throughout; otherwise each
+        chunk is committed as it is written, so other connections can write
+        between chunks.
+        progress_callback, if given, is called after every chunk with
+        (rows_processed, bytes_read, total_bytes).
+        """
+        if mode not in self.IMPORT_MODES:
+            return False, f"Unknown import mode: {mode}"
+        
+        counts = {'new': 0, 'updated': 0, 'skipped': 0}
+        try:
+            total_bytes = os.path.getsize(csv_path)
+            with open(csv_path, 'r', encoding='utf-8', newline='') as file:
                 csv_reader = csv.DictReader(file)
                 
                 # Check if the CSV has the required fields
                 required_fields = ['Excerpt', 'Analysis', 'Rewrite']
-                if not all(field in csv_reader.fieldnames for field in required_fields):
+                if not csv_reader.fieldnames or not all(field in csv_reader.fieldnames for field in required_fields):
                     return False, "CSV file must contain Excerpt, Analysis, and Rewrite columns"
                 
-                # Insert data into the database
-                for row in csv_reader:
-                    self.cursor.execute('''
-                        INSERT INTO excerpts (excerpt, analysis, rewrite)
-                        VALUES (?, ?, ?)
-                    ''', (row['Excerpt'], row.get('Analysis', ''), row.get('Rewrite', '')))
+                with self.bulk_write_pragmas():
+                    cursor = self.conn.cursor()
+                    cursor.execute('''
+                        CREATE TEMP TABLE IF NOT EXISTS import_staging (
+                            content_hash TEXT,
+                            excerpt TEXT,
+                            analysis TEXT,
+                            rewrite TEXT
+                        )
+                    ''')
+                    chunk = []
+                    processed = 0
+                    try:
+                        for row in csv_reader:
+                            excerpt = row['Excerpt'] or ''
+                            chunk.append((self.hash_excerpt(excerpt), excerpt,
+                                          row.get('Analysis') or '', row.get('Rewrite') or ''))
+                            if len(chunk) >= chunk_size:
+                                self._import_excerpt_chunk(cursor, chunk, mode, counts, single_transaction)
+                                processed += len(chunk)
+                                chunk = []
+                                if progress_callback:
+                                    # Position of the underlying byte stream (includes read-ahead)
+                                    progress_callback(processed, file.buffer.tell(), total_bytes)
+                        if chunk:
+                            self._import_excerpt_chunk(cursor, chunk, mode, counts, single_transaction)
+                            processed += len(chunk)
+                        self._commit_import(cursor)
+                    except Exception:
+                        self.conn.rollback()
+                        if single_transaction:
+                            counts = dict.fromkeys(counts, 0)
+                        raise
+                    finally:
+                        cursor.execute("DELETE FROM import_staging")
+                        self.conn.commit()
                 
-                self.conn.commit()
-                return True, f"Successfully imported {csv_reader.line_num - 1} excerpts"
+                if progress_callback:
+                    progress_callback(processed, total_bytes, total_bytes)
+                self.notify_change("import")
+                return True, f"Import complete: {self.format_import_counts(counts)}"
         except Exception as e:
+            if counts['new'] or counts['updated']:
+                self.notify_change("import")
+                return False, (f"Error importing CSV after {self.format_import_counts(counts)}: "
+                               f"{str(e)}")
             return False, f"Error importing CSV: {str(e)}"
     
-    def get_all_excerpts(self):
-        """Get all excerpts from the database"""
+    @staticmethod
+    def format_import_counts(counts):
+        """Describe import counts, e.g. '10 new, 2 updated, 5 skipped'"""
+        return f"{counts['new']} new, {counts['updated']} updated, {counts['skipped']} skipped"
+    
+    def _import_excerpt_chunk(self, cursor, chunk, mode, counts, single_transaction):
+        """Merge a chunk of (content_hash, excerpt, analysis, rewrite) rows and add to counts"""
+        if not self.conn.in_transaction:
+            # Take the write lock before reading MAX(id); upgrading a read
+            # transaction fails at once if another connection wrote meanwhile
+            cursor.execute("BEGIN IMMEDIATE")
+            self._pause_search_indexing(cursor)
+        cursor.execute("DELETE FROM import_staging")
+        cursor.executemany("INSERT INTO import_staging VALUES (?, ?, ?, ?)", chunk)
+        last_id = cursor.execute("SELECT MAX(id) FROM excerpts").fetchone()[0] or 0
+        
+        if mode == "keep-both":
+            # Only the first copy of an excerpt carries the hash; the rest are stored unhashed
+            cursor.execute('''
+                UPDATE import_staging SET content_hash = NULL
+                WHERE content_hash IN (SELECT content_hash FROM excerpts WHERE content_hash IS NOT NULL)
+                   OR rowid NOT IN (SELECT MIN(rowid) FROM import_staging GROUP BY content_hash)
+            ''')
+        else:
+            # Collapse repeats within the chunk; skip keeps the first, update the last
+            keep = "MIN" if mode == "skip" else "MAX"
+            cursor.execute(f'''
+                DELETE FROM import_staging
+                WHERE rowid NOT IN (SELECT {keep}(rowid) FROM import_staging GROUP BY content_hash)
+            ''')
+        
+        if mode == "update":
+            cursor.execute('''
+                UPDATE excerpts
+                SET analysis = COALESCE(NULLIF(staged.analysis, ''), excerpts.analysis),
+                    rewrite = COALESCE(NULLIF(staged.rewrite, ''), excerpts.rewrite)
+                FROM import_staging AS staged
+                WHERE excerpts.content_hash = staged.content_hash
+                  AND (excerpts.analysis IS NOT COALESCE(NULLIF(staged.analysis, ''), excerpts.analysis)
+                       OR excerpts.rewrite IS NOT COALESCE(NULLIF(staged.rewrite, ''), excerpts.rewrite))
+            ''')
+            updated = cursor.rowcount
+        else:
+            updated = 0
+        
+        # Existing excerpts are filtered out first so they don't use up AUTOINCREMENT ids
+        cursor.execute('''
+            INSERT INTO excerpts (excerpt, analysis, rewrite, content_hash)
+            SELECT excerpt, analysis, rewrite, content_hash FROM import_staging AS staged
+            WHERE NOT EXISTS (SELECT 1 FROM excerpts WHERE excerpts.content_hash = staged.content_hash)
+            ON CONFLICT (content_hash) DO NOTHING
+        ''')
+        inserted = cursor.rowcount
+        if inserted:
+            self._add_to_random_deck(cursor, last_id)
+        counts['new'] += inserted
+        counts['updated'] += updated
+        counts['skipped'] += len(chunk) - inserted - updated
+        
+        if self.fts_enabled:
+            # Index the new rows in one statement; the insert trigger is paused during imports
+            cursor.execute('''
+                INSERT INTO excerpts_fts (rowid, excerpt, analysis, rewrite)
+                SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id > ?
+            ''', (last_id,))
+        if not single_transaction:
+            self._commit_import(cursor)
+    
+    def _commit_import(self, cursor):
+        """Resume the full-text insert trigger and commit the import transaction"""
+        if self.fts_enabled:
+            cursor.execute("DELETE FROM fts_paused")
+        self.conn.commit()
+    
+    @contextmanager
+    def bulk_write_pragmas(self):
+        """Temporarily tune the calling thread's connection for large bulk writes
+
+        Connections already run in WAL mode with synchronous=NORMAL; this
+        additionally raises the page cache to 64 MB for the duration.
+        """
+        cache_size = self.conn.execute("PRAGMA cache_size").fetchone()[0]
+        self.conn.execute("PRAGMA cache_size = -65536")
         try:
-            self.cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts")
-            return self.cursor.fetchall()
+            yield
+        finally:
+            self.conn.execute(f"PRAGMA cache_size = {int(cache_size)}")
+    
+    def _pause_search_indexing(self, cursor):
+        """Stop the full-text insert trigger for the rest of the current transaction
+
+        An import then indexes each chunk with one INSERT ... SELECT, about
+        twice as fast as firing the trigger for every row. The flag row is
+        uncommitted, so other connections keep indexing their own inserts,
+        and a rollback or crash leaves the trigger active.
+        """
+        if self.fts_enabled:
+            cursor.execute("INSERT OR IGNORE INTO fts_paused VALUES (1)")
+    
+    def add_change_listener(self, listener):
+        """Register listener(event, excerpt_id) to be called after writes
+
+        event is one of "update", "import" or "clear" for the excerpts table,
+        or "prompts" after prompt templates change; excerpt_id is only set for
+        single-row updates.
+        """
+        self.change_listeners.append(listener)
+    
+    def remove_change_listener(self, listener):
+        """Unregister a change listener"""
+        if listener in self.change_listeners:
+            self.change_listeners.remove(listener)
+    
+    def notify_change(self, event, excerpt_id=None):
+        """Call every change listener"""
+        for listener in list(self.change_listeners):
+            try:
+                listener(event, excerpt_id)
+            except Exception as e:
+                print(f"Error in change listener: {e}")
+    
+    def build_excerpt_filters(self, filters, alias="e"):
+        """Return (where clause, params) for a dict of excerpt filters
+
+        has_analysis and has_rewrite keep excerpts with (True) or without
+        (False) a non-empty analysis or rewrite; pending_run keeps excerpts
+        without a successful result in that batch run; text keeps excerpts
+        whose excerpt, analysis or rewrite contains every word, as search()
+        matches them. None values are ignored.
+        """
+        clauses = []
+        params = []
+        for name, value in (filters or {}).items():
+            if name not in self.EXCERPT_FILTERS:
+                raise ValueError(f"Unknown excerpt filter: {name}")
+            if value is None:
+                continue
+            if name == 'text':
+                query = self.build_search_query(value)
+                if query is None:
+                    continue
+                if self.fts_enabled:
+                    clauses.append(f"{alias}.id IN (SELECT rowid FROM excerpts_fts WHERE excerpts_fts MATCH ?)")
+                    params.append(query)
+                else:
+                    pattern = self.like_pattern(value.strip())
+                    clauses.append(f"({alias}.excerpt LIKE ? ESCAPE '\\' OR {alias}.analysis LIKE ? ESCAPE '\\' "
+                                   f"OR {alias}.rewrite LIKE ? ESCAPE '\\')")
+                    params.extend((pattern, pattern, pattern))
+            elif name == 'pending_run':
+                clauses.append(f"NOT EXISTS (SELECT 1 FROM batch_results b WHERE b.run_name = ? "
+                               f"AND b.excerpt_id = {alias}.id AND b.success = 1)")
+                params.append(value)
+            else:
+                column = f"{alias}.{name[len('has_'):]}"
+                clauses.append(f"({column} IS NOT NULL AND {column} != '')" if value
+                               else f"({column} IS NULL OR {column} = '')")
+        return " AND ".join(clauses), params
+    
+    def get_excerpt_page(self, after_id=0, limit=EXCERPT_PAGE_SIZE, filters=None, columns=EXCERPT_COLUMNS):
+        """Get up to limit excerpt rows with an id above after_id, in id order
+
+        Rows are tuples of columns (a subset of EXCERPT_COLUMNS). Paging on
+        the primary key costs the same on the last page as on the first.
+        """
+        unknown = set(columns) - set(self.EXCERPT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown excerpt columns: {', '.join(sorted(unknown))}")
+        where, params = self.build_excerpt_filters(filters)
+        try:
+            return self.conn.execute(
+                f"SELECT {', '.join('e.' + column for column in columns)} FROM excerpts e "
+                f"WHERE e.id > ? {'AND ' + where if where else ''} ORDER BY e.id ASC LIMIT ?",
+                [after_id] + params + [limit]).fetchall()
         except sqlite3.Error as e:
             print(f"Error fetching excerpts: {e}")
             return []
     
+    def iter_excerpt_pages(self, batch_size=EXCERPT_PAGE_SIZE, after_id=0, filters=None, columns=EXCERPT_COLUMNS):
+        """Yield successive pages (lists of row tuples) from get_excerpt_page until the table is exhausted
+
+        Each page is its own short query, so no cursor or read transaction
+        stays open between pages and rows written meanwhile behind the last
+        id are not revisited. columns must include 'id'.
+        """
+        if 'id' not in columns:
+            raise ValueError("columns must include 'id'")
+        key = columns.index('id')
+        while True:
+            rows = self.get_excerpt_page(after_id, batch_size, filters, columns)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1][key]
+    
+    def iter_excerpts(self, batch_size=EXCERPT_PAGE_SIZE, after_id=0, filters=None, columns=EXCERPT_COLUMNS):
+        """Yield excerpt row tuples in id order, holding at most one page in memory
+
+        filters is a dict as accepted by build_excerpt_filters, e.g.
+        {'has_rewrite': True}; columns picks the tuple fields.
+        """
+        for rows in self.iter_excerpt_pages(batch_size, after_id, filters, columns):
+            yield from rows
+    
+    def get_excerpt_previews(self, sort='id', descending=False, after=None, limit=200, filters=None,
+                             preview_chars=PREVIEW_CHARS):
+        """Get a page of (sort value, id, excerpt preview, rewrite preview) rows in a sort order
+
+        sort is a key of EXCERPT_SORT_KEYS; after is the (sort value, id) of
+        the last row of the previous page. Previews are cut to
+        preview_chars in SQL, so a page never holds the full texts.
+        """
+        key = self.EXCERPT_SORT_KEYS[sort]
+        op, order = ("<", "DESC") if descending else (">", "ASC")
+        where, params = self.build_excerpt_filters(filters)
+        clauses = [where] if where else []
+        if after is not None:
+            if sort == 'id':
+                clauses.append(f"e.id {op} ?")
+                params.append(after[1])
+            else:
+                # Spelled out rather than as a row value so SQLite scans a range of the index
+                clauses.append(f"{key} {op}= ? AND ({key} {op} ? OR e.id {op} ?)")
+                params.extend((after[0], after[0], after[1]))
+        try:
+            return self.conn.execute(
+                f"SELECT {key}, e.id, substr(e.excerpt, 1, ?), COALESCE(substr(e.rewrite, 1, ?), '') "
+                f"FROM excerpts e {'WHERE ' + ' AND '.join(clauses) if clauses else ''} "
+                f"ORDER BY {key} {order}{'' if sort == 'id' else f', e.id {order}'} LIMIT ?",
+                [preview_chars, preview_chars] + params + [limit]).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error fetching excerpt previews: {e}")
+            return []
+    
+    def count_excerpts(self, filters=None):
+        """Count the excerpts matching a dict of filters"""
+        where, params = self.build_excerpt_filters(filters)
+        try:
+            return self.conn.execute(
+                f"SELECT COUNT(*) FROM excerpts e {'WHERE ' + where if where else ''}", params).fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Error counting excerpts: {e}")
+            return 0
+    
     def get_excerpt_by_id(self, excerpt_id):
         """Get a specific excerpt by ID"""
         try:
-            self.cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id = ?", (excerpt_id,))
-            return self.cursor.fetchone()
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id = ?", (excerpt_id,))
+            return cursor.fetchone()
         except sqlite3.Error as e:
             print(f"Error fetching excerpt: {e}")
             return None
     
-    def get_random_excerpt(self):
-        """Get a random excerpt from the database"""
+    def get_random_excerpt(self, no_repeat=False):
+        """Get a random excerpt from the database
+
+        Picks a random id between MIN(id) and MAX(id) and looks it up by
+        primary key, so the cost does not grow with the table size. With
+        no_repeat, excerpts are drawn from a persisted shuffled deck so none
+        repeats until every excerpt has been shown.
+        """
+        if no_repeat:
+            return self.draw_from_random_deck()
         try:
-            self.cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts ORDER BY RANDOM() LIMIT 1")
-            return self.cursor.fetchone()
+            # Separate subqueries so each uses SQLite's O(log n) min/max optimization
+            min_id, max_id = self.conn.execute(
+                "SELECT (SELECT MIN(id) FROM excerpts), (SELECT MAX(id) FROM excerpts)").fetchone()
+            if min_id is None:
+                return None
+                
+            # Ids are dense unless rows were deleted, so a few uniform probes
+            # almost always hit an existing row
+            for _ in range(self.RANDOM_SAMPLE_ATTEMPTS):
+                row = self.conn.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id = ?",
+                                        (random.randint(min_id, max_id),)).fetchone()
+                if row:
+                    return row
+                
+            # Very sparse ids: skip a random number of rows, which scans but favours no row
+            count = self.conn.execute("SELECT COUNT(*) FROM excerpts").fetchone()[0]
+            if not count:
+                return None
+            return self.conn.execute(
+                "SELECT id, excerpt, analysis, rewrite FROM excerpts ORDER BY id ASC LIMIT 1 OFFSET ?",
+                (random.randrange(count),)).fetchone()
         except sqlite3.Error as e:
             print(f"Error fetching random excerpt: {e}")
             return None
     
+    def draw_from_random_deck(self):
+        """Draw the next excerpt from the persisted shuffled deck, reshuffling when it runs out"""
+        try:
+            reshuffled = False
+            while True:
+                top = self.conn.execute(
+                    "SELECT position, excerpt_id FROM random_deck ORDER BY position ASC LIMIT 1").fetchone()
+                if not top:
+                    if reshuffled:
+                        # Keep the stale entries dropped on the way; the corpus is empty
+                        self.conn.commit()
+                        return None
+                    # One shuffle per pass through the corpus keeps draws amortized O(1)
+                    self.conn.execute(
+                        "INSERT INTO random_deck (excerpt_id) SELECT id FROM excerpts ORDER BY RANDOM()")
+                    reshuffled = True
+                    continue
+                    
+                if self.conn.execute("DELETE FROM random_deck WHERE position = ?", (top[0],)).rowcount == 0:
+                    continue  # Drawn concurrently by another connection
+                row = self.conn.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id = ?",
+                                        (top[1],)).fetchone()
+                if row:  # Skip excerpts deleted since the deck was shuffled
+                    self.conn.commit()
+                    return row
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Error drawing from random deck: {e}")
+            return None
+        finally:
+            # Never leave this thread's connection holding the write lock
+            if self.conn.in_transaction:
+                self.conn.rollback()
+    
+    def _add_to_random_deck(self, cursor, after_id):
+        """Shuffle the excerpts with an id above after_id into the unfinished random deck
+
+        Each new excerpt takes a uniformly random place among the remaining
+        cards and the card it displaces goes to the bottom (inside-out
+        Fisher-Yates), so the deck stays a uniform shuffle. An empty deck is
+        left alone; the next draw shuffles the whole corpus.
+        """
+        low, high = cursor.execute(
+            "SELECT (SELECT MIN(position) FROM random_deck), (SELECT MAX(position) FROM random_deck)").fetchone()
+        if low is None:
+            return
+        
+        # Position -> ('new', excerpt id) or ('card', the position the card was moved from)
+        placed = {}
+        for (excerpt_id,) in cursor.execute("SELECT id FROM excerpts WHERE id > ? ORDER BY id", (after_id,)).fetchall():
+            high += 1
+            position = random.randint(low, high)
+            if position != high:
+                placed[high] = placed.get(position, ('card', position))
+            placed[position] = ('new', excerpt_id)
+        
+        # Moved cards only go to positions past the old bottom, so the updates never collide
+        cursor.executemany("UPDATE random_deck SET position = ? WHERE position = ?",
+                           [(position, value) for position, (kind, value) in placed.items() if kind == 'card'])
+        cursor.executemany("INSERT INTO random_deck (position, excerpt_id) VALUES (?, ?)",
+                           [(position, value) for position, (kind, value) in placed.items() if kind == 'new'])
+    
+    def get_excerpts_after(self, excerpt_id, limit):
+        """Get up to limit excerpts with an id greater than excerpt_id, in ascending order"""
+        try:
+            return self.conn.execute(
+                "SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id > ? ORDER BY id ASC LIMIT ?",
+                (excerpt_id, limit)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error fetching excerpts: {e}")
+            return []
+    
+    def get_excerpts_before(self, excerpt_id, limit):
+        """Get up to limit excerpts with an id less than excerpt_id, in descending order"""
+        try:
+            return self.conn.execute(
+                "SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (excerpt_id, limit)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error fetching excerpts: {e}")
+            return []
+    
+    def get_last_excerpt(self):
+        """Get the last excerpt from the database"""
+        try:
+            return self.conn.execute(
+                "SELECT id, excerpt, analysis, rewrite FROM excerpts ORDER BY id DESC LIMIT 1").fetchone()
+        except sqlite3.Error as e:
+            print(f"Error fetching last excerpt: {e}")
+            return None
+    
     def get_next_excerpt(self, current_id):
         """Get the next excerpt after the current one"""
         try:
-            self.cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id > ? ORDER BY id ASC LIMIT 1", (current_id,))
-            result = self.cursor.fetchone()
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id > ? ORDER BY id ASC LIMIT 1", (current_id,))
+            result = cursor.fetchone()
             if not result:  # If no next excerpt, wrap around to the first one
-                self.cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts ORDER BY id ASC LIMIT 1")
-                result = self.cursor.fetchone()
+                cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts ORDER BY id ASC LIMIT 1")
+                result = cursor.fetchone()
             return result
         except sqlite3.Error as e:
             print(f"Error fetching next excerpt: {e}")
@@ -144,139 +860,161 @@ class Database:
     def get_previous_excerpt(self, current_id):
         """Get the previous excerpt before the current one"""
         try:
-            self.cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id < ? ORDER BY id DESC LIMIT 1", (current_id,))
-            result = self.cursor.fetchone()
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts WHERE id < ? ORDER BY id DESC LIMIT 1", (current_id,))
+            result = cursor.fetchone()
             if not result:  # If no previous excerpt, wrap around to the last one
-                self.cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts ORDER BY id DESC LIMIT 1")
-                result = self.cursor.fetchone()
+                cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts ORDER BY id DESC LIMIT 1")
+                result = cursor.fetchone()
             return result
         except sqlite3.Error as e:
             print(f"Error fetching previous excerpt: {e}")
             return None
     
-    def update_rewrite(self, excerpt_id, rewrite):
-        """Update the rewrite for a specific excerpt"""
-        try:
-            self.cursor.execute("UPDATE excerpts SET rewrite = ? WHERE id = ?", (rewrite, excerpt_id))
-            self.conn.commit()
-            return True
-        except sqlite3.Error as e:
-            print(f"Error updating rewrite: {e}")
-            return False
+    @staticmethod
+    def build_search_query(text):
+        """Turn free text into an FTS5 query, or None if it has no words
+
+        Every word is quoted so punctuation and FTS5 operators typed by the
+        user are matched literally, and words are ANDed together. The last
+        word is matched as a prefix unless the text ends in whitespace, so
+        results appear while a word is still being typed.
+        """
+        words = re.findall(r"\w+", text)
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        if not text[-1].isspace():
+            terms[-1] += "*"
+        return " ".join(terms)
     
-    def save_api_key(self, api_key):
-        """Save the OpenAI API key"""
+    def search(self, text, limit=50, highlight=("[", "]"), snippet_tokens=12):
+        """Search excerpts, analyses and rewrites
+
+        Returns up to limit (id, snippet, score) tuples, best match first.
+        The snippet is taken from the best-matching column with matched
+        words wrapped in the highlight pair; score is the negated bm25 rank,
+        so higher is better.
+        """
+        query = self.build_search_query(text)
+        if query is None:
+            return []
         try:
-            # Check if a key already exists
-            self.cursor.execute("SELECT COUNT(*) FROM settings")
-            count = self.cursor.fetchone()[0]
-            
-            if count == 0:
-                self.cursor.execute("INSERT INTO settings (id, api_key) VALUES (1, ?)", (api_key,))
-            else:
-                self.cursor.execute("UPDATE settings SET api_key = ? WHERE id = 1", (api_key,))
-            
-            self.conn.commit()
-            return True
+            if not self.fts_enabled:
+                return self._search_like(text.strip(), limit)
+            weights = ", ".join(str(weight) for weight in self.SEARCH_WEIGHTS)
+            return self.conn.execute(f'''
+                SELECT rowid, snippet(excerpts_fts, -1, ?, ?, '…', ?), -bm25(excerpts_fts, {weights}) AS score
+                FROM excerpts_fts
+                WHERE excerpts_fts MATCH ?
+                ORDER BY score DESC
+                LIMIT ?
+            ''', (highlight[0], highlight[1], snippet_tokens, query, limit)).fetchall()
         except sqlite3.Error as e:
-            print(f"Error saving API key: {e}")
-            return False
+            print(f"Error searching excerpts: {e}")
+            return []
     
-    def get_api_key(self):
-        """Get the saved OpenAI API key"""
-        try:
-            self.cursor.execute("SELECT api_key FROM settings WHERE id = 1")
-            result = self.cursor.fetchone()
-            return result[0] if result else None
-        except sqlite3.Error as e:
-            print(f"Error fetching API key: {e}")
-            return None
+    @staticmethod
+    def like_pattern(text):
+        """Return a LIKE pattern (with ESCAPE '\\') matching text anywhere"""
+        return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    
+    def _search_like(self, text, limit):
+        """Unranked substring search used when FTS5 is unavailable"""
+        pattern = self.like_pattern(text)
+        rows = self.conn.execute('''
+            SELECT id, excerpt FROM excerpts
+            WHERE excerpt LIKE ? ESCAPE '\\' OR analysis LIKE ? ESCAPE '\\' OR rewrite LIKE ? ESCAPE '\\'
+            ORDER BY id
+            LIMIT ?
+        ''', (pattern, pattern, pattern, limit)).fetchall()
+        return [(excerpt_id, excerpt[:80], 0.0) for excerpt_id, excerpt in rows]
     
-    def save_model(self, model):
-        """Save the OpenAI model selection"""
+    def update_rewrite(self, excerpt_id, rewrite):
+        """Update the rewrite for a specific excerpt"""
         try:
-            # Check if settings already exist
-            self.cursor.execute("SELECT COUNT(*) FROM settings")
-            count = self.cursor.fetchone()[0]
-            
-            if count == 0:
-                self.cursor.execute("INSERT INTO settings (id, model) VALUES (1, ?)", (model,))
-            else:
-                self.cursor.execute("UPDATE settings SET model = ? WHERE id = 1", (model,))
-            
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE excerpts SET rewrite = ? WHERE id = ?", (rewrite, excerpt_id))
             self.conn.commit()
+            self.notify_change("update", excerpt_id)
             return True
         except sqlite3.Error as e:
-            print(f"Error saving model: {e}")
+            print(f"Error updating rewrite: {e}")
             return False
     
-    def get_model(self):
-        """Get the saved OpenAI model"""
+    def load_settings(self):
+        """Load the settings row as a dict of column name to value (empty if not saved yet)"""
         try:
-            self.cursor.execute("SELECT model FROM settings WHERE id = 1")
-            result = self.cursor.fetchone()
-            return result[0] if result else "gpt-4"
+            cursor = self.conn.cursor()
+            cursor.execute(f"SELECT {', '.join(self.SETTINGS_COLUMNS)} FROM settings WHERE id = 1")
+            result = cursor.fetchone()
+            return dict(zip(self.SETTINGS_COLUMNS, result)) if result else {}
         except sqlite3.Error as e:
-            print(f"Error fetching model: {e}")
-            return "gpt-4"
+            print(f"Error fetching settings: {e}")
+            return {}
     
-    def save_font_settings(self, font_family, font_size):
-        """Save font settings"""
+    def upsert_settings(self, error_message="Error saving settings", **values):
+        """Write settings columns with a single INSERT ... ON CONFLICT DO UPDATE"""
+        unknown = set(values) - set(self.SETTINGS_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        if not values:
+            return True
         try:
-            # Check if settings already exist
-            self.cursor.execute("SELECT COUNT(*) FROM settings")
-            count = self.cursor.fetchone()[0]
-            
-            if count == 0:
-                self.cursor.execute("INSERT INTO settings (id, font_family, font_size) VALUES (1, ?, ?)", 
-                                  (font_family, font_size))
-            else:
-                self.cursor.execute("UPDATE settings SET font_family = ?, font_size = ? WHERE id = 1", 
-                                  (font_family, font_size))
-            
+            columns = list(values)
+            self.conn.execute(
+                f"INSERT INTO settings (id, {', '.join(columns)}) VALUES (1, {', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT (id) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in columns)}",
+                [values[column] for column in columns])
             self.conn.commit()
             return True
         except sqlite3.Error as e:
-            print(f"Error saving font settings: {e}")
+            print(f"{error_message}: {e}")
             return False
     
-    def get_font_settings(self):
-        """Get the saved font settings"""
-        try:
-            self.cursor.execute("SELECT font_family, font_size FROM settings WHERE id = 1")
-            result = self.cursor.fetchone()
-            if result:
-                return result[0], result[1]
-            return "Arial", 10
-        except sqlite3.Error as e:
-            print(f"Error fetching font settings: {e}")
-            return "Arial", 10
-            
     def check_and_add_model_column(self):
         """Check if model column exists in settings table and add it if it doesn't"""
         try:
+            cursor = self.conn.cursor()
             # Check if model column exists
-            self.cursor.execute("PRAGMA table_info(settings)")
-            columns = [column[1] for column in self.cursor.fetchall()]
+            cursor.execute("PRAGMA table_info(settings)")
+            columns = [column[1] for column in cursor.fetchall()]
             
             # Add model column if it doesn't exist
             if 'model' not in columns:
-                self.cursor.execute("ALTER TABLE settings ADD COLUMN model TEXT DEFAULT 'gpt-4'")
+                cursor.execute("ALTER TABLE settings ADD COLUMN model TEXT DEFAULT 'gpt-4'")
                 self.conn.commit()
                 print("Added missing 'model' column to settings table")
                 
             # Add font_family column if it doesn't exist
             if 'font_family' not in columns:
-                self.cursor.execute("ALTER TABLE settings ADD COLUMN font_family TEXT DEFAULT 'Arial'")
+                cursor.execute("ALTER TABLE settings ADD COLUMN font_family TEXT DEFAULT 'Arial'")
                 self.conn.commit()
                 print("Added missing 'font_family' column to settings table")
                 
             # Add font_size column if it doesn't exist
             if 'font_size' not in columns:
-                self.cursor.execute("ALTER TABLE settings ADD COLUMN font_size INTEGER DEFAULT 10")
+                cursor.execute("ALTER TABLE settings ADD COLUMN font_size INTEGER DEFAULT 10")
                 self.conn.commit()
                 print("Added missing 'font_size' column to settings table")
                 
+            # Add random_no_repeat column if it doesn't exist
+            if 'random_no_repeat' not in columns:
+                cursor.execute("ALTER TABLE settings ADD COLUMN random_no_repeat INTEGER DEFAULT 0")
+                self.conn.commit()
+                print("Added missing 'random_no_repeat' column to settings table")
+                
+            # Add model catalogue columns if they don't exist
+            if 'model_filter' not in columns:
+                cursor.execute("ALTER TABLE settings ADD COLUMN model_filter TEXT")
+                self.conn.commit()
+                print("Added missing 'model_filter' column to settings table")
+                
+            if 'models_fetched_at' not in columns:
+                cursor.execute("ALTER TABLE settings ADD COLUMN models_fetched_at REAL")
+                self.conn.commit()
+                print("Added missing 'models_fetched_at' column to settings table")
+                
             return True
         except sqlite3.Error as e:
             print(f"Error checking/adding columns: {e}")
@@ -285,8 +1023,14 @@ class Database:
     def save_prompt(self, name, content):
         """Save a prompt template"""
         try:
-            self.cursor.execute("INSERT INTO prompts (name, content) VALUES (?, ?)", (name, content))
+            cursor = self.conn.cursor()
+            # Names are unique, so loading the same file again replaces its content
+            cursor.execute('''
+                INSERT INTO prompts (name, content) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET content = excluded.content
+            ''', (name, content))
             self.conn.commit()
+            self.notify_change("prompts")
             return True
         except sqlite3.Error as e:
             print(f"Error saving prompt: {e}")
@@ -295,8 +1039,9 @@ class Database:
     def get_all_prompts(self):
         """Get all saved prompts"""
         try:
-            self.cursor.execute("SELECT id, name, content FROM prompts")
-            return self.cursor.fetchall()
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id, name, content FROM prompts ORDER BY id")
+            return cursor.fetchall()
         except sqlite3.Error as e:
             print(f"Error fetching prompts: {e}")
             return []
@@ -304,122 +1049,463 @@ class Database:
     def get_prompt_by_id(self, prompt_id):
         """Get a specific prompt by ID"""
         try:
-            self.cursor.execute("SELECT id, name, content FROM prompts WHERE id = ?", (prompt_id,))
-            return self.cursor.fetchone()
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id, name, content FROM prompts WHERE id = ?", (prompt_id,))
+            return cursor.fetchone()
         except sqlite3.Error as e:
             print(f"Error fetching prompt: {e}")
             return None
     
-    def export_to_csv(self, file_path):
-        """Export all excerpts to a CSV file"""
+    def export_to_csv(self, file_path, compress=None, progress_callback=None):
+        """Export all excerpts to a CSV file
+
+        Rows are read a page at a time, so memory use does not grow with
+        the table. The output is gzip-compressed when compress is True, or
+        when compress is None and file_path ends in .gz. progress_callback,
+        if given, is called with (rows_written, total_rows).
+        """
         try:
-            # Get all excerpts
-            self.cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts")
-            excerpts = self.cursor.fetchall()
-            
-            if not excerpts:
+            total = self.conn.execute("SELECT COUNT(*) FROM excerpts").fetchone()[0]
+            if not total:
                 return False, "No excerpts found to export"
-            
-            import csv
-            with open(file_path, 'w', newline='', encoding='utf-8') as file:
-                csv_writer = csv.writer(file)
                 
+            with self._open_export_file(file_path, compress) as file:
+                csv_writer = csv.writer(file)
+                    
                 # Write header
                 csv_writer.writerow(['ID', 'Excerpt', 'Analysis', 'Rewrite'])
-                
+                    
                 # Write data
-                for excerpt in excerpts:
-                    csv_writer.writerow(excerpt)
+                written = 0
+                for rows in self.iter_excerpt_pages():
+                    csv_writer.writerows(rows)
+                    written += len(rows)
+                    if progress_callback:
+                        progress_callback(written, total)
             
-            return True, f"Successfully exported {len(excerpts)} excerpts to {file_path}"
+            return True, f"Successfully exported {written} excerpts to {file_path}"
         except Exception as e:
             return False, f"Error exporting to CSV: {str(e)}"
     
-    def export_to_json(self, file_path):
-        """Export all excerpts to a JSON file"""
+    def export_to_json(self, file_path, ndjson=None, compress=None, progress_callback=None):
+        """Export all excerpts to a JSON file
+
+        Writes a JSON array (the historical format) or, with ndjson, one JSON
+        object per line. Rows are read a page at a time and written as they
+        are read. ndjson and compress default to following the file extension
+        (.ndjson / .gz). progress_callback, if given, is called with
+        (rows_written, total_rows).
+        """
+        if ndjson is None:
+            ndjson = file_path.lower().removesuffix('.gz').endswith('.ndjson')
         try:
-            # Get all excerpts
-            self.cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts")
-            excerpts = self.cursor.fetchall()
-            
-            if not excerpts:
+            total = self.conn.execute("SELECT COUNT(*) FROM excerpts").fetchone()[0]
+            if not total:
                 return False, "No excerpts found to export"
+                
+            with self._open_export_file(file_path, compress) as file:
+                if not ndjson:
+                    file.write("[")
+                    
+                written = 0
+                for rows in self.iter_excerpt_pages():
+                    parts = []
+                    for excerpt in rows:
+                        item = {
+                            'id': excerpt[0],
+                            'excerpt': excerpt[1],
+                            'analysis': excerpt[2] if excerpt[2] else "",
+                            'rewrite': excerpt[3] if excerpt[3] else ""
+                        }
+                        if ndjson:
+                            parts.append(json.dumps(item, ensure_ascii=False) + "\n")
+                        else:
+                            # Same layout json.dump(data, indent=4) produced for the whole list
+                            separator = ",\n    " if written or parts else "\n    "
+                            parts.append(separator + json.dumps(item, indent=4, ensure_ascii=False).replace("\n", "\n    "))
+                    file.write("".join(parts))
+                    written += len(rows)
+                    if progress_callback:
+                        progress_callback(written, total)
+                    
+                if not ndjson:
+                    file.write("\n]")
             
-            import json
-            
-            # Convert to list of dictionaries
-            data = []
-            for excerpt in excerpts:
-                data.append({
-                    'id': excerpt[0],
-                    'excerpt': excerpt[1],
-                    'analysis': excerpt[2] if excerpt[2] else "",
-                    'rewrite': excerpt[3] if excerpt[3] else ""
-                })
-            
-            with open(file_path, 'w', encoding='utf-8') as file:
-                json.dump(data, file, indent=4, ensure_ascii=False)
-            
-            return True, f"Successfully exported {len(excerpts)} excerpts to {file_path}"
+            return True, f"Successfully exported {written} excerpts to {file_path}"
         except Exception as e:
             return False, f"Error exporting to JSON: {str(e)}"
     
+    @staticmethod
+    def _open_export_file(file_path, compress=None):
+        """Open an export file for text writing, gzip-compressed if requested or named .gz"""
+        if compress is None:
+            compress = file_path.lower().endswith('.gz')
+        if compress:
+            return gzip.open(file_path, 'wt', encoding='utf-8', newline='')
+        return open(file_path, 'w', newline='', encoding='utf-8')
+    
     def clear_database(self):
         """Clear all excerpts from the database"""
         try:
-            self.cursor.execute("DELETE FROM excerpts")
+            cursor = self.conn.cursor()
+            if self.fts_enabled:
+                # Empty the index in one step instead of one trigger call per row. The
+                # trigger is dropped inside the transaction, so other connections never
+                # see it missing.
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("DROP TRIGGER IF EXISTS excerpts_fts_delete")
+                try:
+                    cursor.execute("DELETE FROM excerpts")
+                    cursor.execute("INSERT INTO excerpts_fts (excerpts_fts) VALUES ('delete-all')")
+                finally:
+                    self.create_search_triggers(cursor)
+            else:
+                cursor.execute("DELETE FROM excerpts")
+            cursor.execute("DELETE FROM random_deck")
+            cursor.execute("DELETE FROM analyses")
             self.conn.commit()
+            self.notify_change("clear")
             return True, "Database cleared successfully"
         except sqlite3.Error as e:
+            self.conn.rollback()
             print(f"Error clearing database: {e}")
             return False, f"Error clearing database: {str(e)}"
     
     def clear_prompts(self):
         """Clear all prompts from the database"""
         try:
-            self.cursor.execute("DELETE FROM prompts")
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM prompts")
             self.conn.commit()
+            self.notify_change("prompts")
             return True, "Prompts cleared successfully"
         except sqlite3.Error as e:
             print(f"Error clearing prompts: {e}")
             return False, f"Error clearing prompts: {str(e)}"
     
+    def save_analysis(self, result):
+        """Store an AnalysisResult and set its id"""
+        columns = AnalysisResult.COLUMNS[1:]
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"INSERT INTO analyses ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [getattr(result, column) for column in columns])
+            self.conn.commit()
+            result.id = cursor.lastrowid
+            return True
+        except sqlite3.Error as e:
+            print(f"Error saving analysis: {e}")
+            return False
+    
+    def get_analysis(self, analysis_id):
+        """Get a single AnalysisResult by id, or None"""
+        try:
+            row = self.conn.execute(
+                f"SELECT {', '.join(AnalysisResult.COLUMNS)} FROM analyses WHERE id = ?",
+                (analysis_id,)).fetchone()
+            return AnalysisResult.from_row(row) if row else None
+        except sqlite3.Error as e:
+            print(f"Error fetching analysis: {e}")
+            return None
+    
+    def get_analysis_page(self, excerpt_id=None, before=None, after=None, limit=50):
+        """Get one page of analysis history, newest first, using keyset pagination
+
+        before and after are (created_at, id) keys of the last or first row
+        of the page being left; pass neither for the newest page. Only the
+        keys are compared, so every page costs the same however deep it is.
+        The rewrite and response columns are not loaded; use get_analysis
+        for a single row's text.
+        """
+        columns = [column if column not in ('rewrite', 'response') else f"NULL AS {column}"
+                   for column in AnalysisResult.COLUMNS]
+        conditions = []
+        params = []
+        if excerpt_id is not None:
+            conditions.append("excerpt_id = ?")
+            params.append(excerpt_id)
+        key = before if before is not None else after
+        if key is not None:
+            # Spelled out rather than as a row value so SQLite scans a range of the index
+            op = "<" if before is not None else ">"
+            conditions.append(f"created_at {op}= ? AND (created_at {op} ? OR id {op} ?)")
+            params.extend((key[0], key[0], key[1]))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        # Paging towards newer rows reads upwards from the key, then restores newest-first order
+        order = "ASC" if after is not None and before is None else "DESC"
+        try:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(columns)} FROM analyses {where} "
+                f"ORDER BY created_at {order}, id {order} LIMIT ?",
+                params + [limit]).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error fetching analysis history: {e}")
+            return []
+        if order == "ASC":
+            rows.reverse()
+        return [AnalysisResult.from_row(row) for row in rows]
+    
     def get_first_excerpt(self):
         """Get the first excerpt from the database"""
         try:
-            self.cursor.execute("SELECT id, excerpt, analysis, rewrite FROM excerpts ORDER BY id ASC LIMIT 1")
-            return self.cursor.fetchone()
+            return self.conn.execute(
+                "SELECT id, excerpt, analysis, rewrite FROM excerpts ORDER BY id ASC LIMIT 1").fetchone()
         except sqlite3.Error as e:
             print(f"Error fetching first excerpt: {e}")
             return None
     
-    def save_models(self, models):
-        """Save the list of models to the database"""
+    def save_models(self, models, fetched_at=None):
+        """Save the model catalogue, writing only the models that were added or removed"""
         try:
-            # Clear existing models
-            self.cursor.execute("DELETE FROM models")
-            
-            # Insert new models
-            for model in models:
-                self.cursor.execute("INSERT OR IGNORE INTO models (model_id) VALUES (?)", (model,))
-            
+            cursor = self.conn.cursor()
+            existing = {row[0] for row in cursor.execute("SELECT model_id FROM models")}
+            models = set(models)
+            cursor.executemany("DELETE FROM models WHERE model_id = ?",
+                               [(model,) for model in existing - models])
+            cursor.executemany("INSERT OR IGNORE INTO models (model_id) VALUES (?)",
+                               [(model,) for model in sorted(models - existing)])
+            cursor.execute('''
+                INSERT INTO settings (id, models_fetched_at) VALUES (1, ?)
+                ON CONFLICT (id) DO UPDATE SET models_fetched_at = excluded.models_fetched_at
+            ''', (fetched_at if fetched_at is not None else time.time(),))
             self.conn.commit()
             return True
         except sqlite3.Error as e:
+            self.conn.rollback()
             print(f"Error saving models: {e}")
             return False
     
     def get_models(self):
-        """Get all saved models from the database"""
+        """Get all saved models from the database (empty if none were fetched yet)"""
         try:
-            self.cursor.execute("SELECT model_id FROM models ORDER BY model_id")
-            models = [row[0] for row in self.cursor.fetchall()]
-            
-            # If no models are found, return default models
-            if not models:
-                return ["gpt-3.5-turbo", "gpt-4", "gpt-4-turbo", "gpt-4o"]
-            
-            return models
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT model_id FROM models ORDER BY model_id")
+            return [row[0] for row in cursor.fetchall()]
         except sqlite3.Error as e:
             print(f"Error fetching models: {e}")
-            return ["gpt-3.5-turbo", "gpt-4", "gpt-4-turbo", "gpt-4o"]
\ No newline at end of file
+            return []
+    
+    def get_models_fetched_at(self):
+        """Get the time the model catalogue was last fetched, or None"""
+        try:
+            row = self.conn.execute("SELECT models_fetched_at FROM settings WHERE id = 1").fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Error fetching model catalogue time: {e}")
+            return None
+    
+    @staticmethod
+    def make_cache_key(model, messages, temperature):
+        """Build the response cache key from the model, rendered prompt and temperature"""
+        payload = json.dumps([model, messages, temperature], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get_cached_response(self, cache_key):
+        """Get a cached API response, or None on a miss"""
+        if not self.cache_enabled:
+            return None
+        try:
+            now = time.time()
+            row = self.conn.execute(
+                "SELECT response, created_at FROM response_cache WHERE cache_key = ?",
+                (cache_key,)).fetchone()
+                
+            if row and now - row[1] > self.cache_max_age:
+                # Expired entries count as misses and are dropped right away
+                self.conn.execute("DELETE FROM response_cache WHERE cache_key = ?", (cache_key,))
+                self.conn.commit()
+                row = None
+                
+            if not row:
+                self.cache_misses += 1
+                return None
+                
+            self.conn.execute("UPDATE response_cache SET last_used_at = ? WHERE cache_key = ?",
+                              (now, cache_key))
+            self.conn.commit()
+            self.cache_hits += 1
+            return row[0]
+        except sqlite3.Error as e:
+            print(f"Error reading response cache: {e}")
+            return None
+    
+    def save_cached_response(self, cache_key, model, response):
+        """Store an API response in the cache and evict old entries"""
+        if not self.cache_enabled:
+            return False
+        try:
+            now = time.time()
+            self.conn.execute('''
+                INSERT OR REPLACE INTO response_cache
+                    (cache_key, model, response, size, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (cache_key, model, response, len(response.encode('utf-8')), now, now))
+            self.evict_cache(commit=False)
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"Error saving to response cache: {e}")
+            return False
+    
+    def evict_cache(self, commit=True):
+        """Drop expired cache entries, then least recently used ones over the size limits"""
+        try:
+            self.conn.execute("DELETE FROM response_cache WHERE created_at < ?",
+                              (time.time() - self.cache_max_age,))
+                
+            count, total_size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache").fetchone()
+            if count > self.cache_max_entries or total_size > self.cache_max_bytes:
+                # Walk entries from most to least recently used and keep what fits
+                kept_count = 0
+                kept_size = 0
+                cutoff = None
+                for last_used_at, size in self.conn.execute(
+                        "SELECT last_used_at, size FROM response_cache ORDER BY last_used_at DESC"):
+                    if kept_count + 1 > self.cache_max_entries or kept_size + size > self.cache_max_bytes:
+                        cutoff = last_used_at
+                        break
+                    kept_count += 1
+                    kept_size += size
+                if cutoff is not None:
+                    self.conn.execute("DELETE FROM response_cache WHERE last_used_at <= ?", (cutoff,))
+                
+            if commit:
+                self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"Error evicting response cache: {e}")
+            return False
+    
+    def clear_response_cache(self):
+        """Clear all cached API responses"""
+        try:
+            self.conn.execute("DELETE FROM response_cache")
+            self.conn.commit()
+            self.cache_hits = 0
+            self.cache_misses = 0
+            return True, "Response cache cleared successfully"
+        except sqlite3.Error as e:
+            print(f"Error clearing response cache: {e}")
+            return False, f"Error clearing response cache: {str(e)}"
+    
+    def get_cache_stats(self):
+        """Get response cache statistics"""
+        try:
+            count, total_size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache").fetchone()
+        except sqlite3.Error as e:
+            print(f"Error fetching cache stats: {e}")
+            count, total_size = 0, 0
+        return {
+            'entries': count,
+            'bytes': total_size,
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'enabled': self.cache_enabled
+        }
+    
+    @staticmethod
+    def pending_batch_filters(run_name):
+        """Return the excerpt filters selecting excerpts with a rewrite still pending in a batch run"""
+        return {'has_rewrite': True, 'pending_run': run_name}
+    
+    def count_pending_batch_excerpts(self, run_name):
+        """Count excerpts with a rewrite that have no successful result in a batch run"""
+        return self.count_excerpts(self.pending_batch_filters(run_name))
+    
+    def iter_pending_batch_excerpts(self, run_name, after_id=0, batch_size=500):
+        """Yield the (id, excerpt, rewrite) rows still pending in a batch run, one page at a time"""
+        return self.iter_excerpts(batch_size, after_id, self.pending_batch_filters(run_name),
+                                  ('id', 'excerpt', 'rewrite'))
+    
+    def save_batch_results(self, run_name, model, prompt_name, results):
+        """Save a list of (excerpt_id, success, response) batch results in one transaction"""
+        try:
+            now = time.time()
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO batch_results
+                    (run_name, excerpt_id, model, prompt_name, success, response, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(run_name, excerpt_id, model, prompt_name, int(success), response, now)
+                  for excerpt_id, success, response in results])
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"Error saving batch results: {e}")
+            return False
+    
+    def create_batch_job(self, run_name, model, prompt_name, batch_id, input_file_id, status, request_count):
+        """Record a submitted Batch API job and return its id, or None on error"""
+        try:
+            now = time.time()
+            cursor = self.conn.execute('''
+                INSERT INTO batch_jobs
+                    (run_name, model, prompt_name, batch_id, input_file_id, status, request_count,
+                     created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (run_name, model, prompt_name, batch_id, input_file_id, status, request_count, now, now))
+            self.conn.commit()
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            print(f"Error saving batch job: {e}")
+            return None
+    
+    def update_batch_job(self, job_id, **fields):
+        """Update the status columns of a Batch API job"""
+        columns = [column for column in fields if column in self.BATCH_JOB_UPDATE_COLUMNS]
+        if not columns:
+            return False
+        try:
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            self.conn.execute(f"UPDATE batch_jobs SET {assignments}, updated_at = ? WHERE id = ?",
+                              [fields[column] for column in columns] + [time.time(), job_id])
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"Error updating batch job: {e}")
+            return False
+    
+    def get_batch_jobs(self, run_name=None, active_only=False):
+        """Get Batch API jobs as dicts, oldest first; active jobs are those not yet imported"""
+        conditions = []
+        params = []
+        if run_name is not None:
+            conditions.append("run_name = ?")
+            params.append(run_name)
+        if active_only:
+            conditions.append("imported_at IS NULL")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(self.BATCH_JOB_COLUMNS)} FROM batch_jobs {where} ORDER BY id", params).fetchall()
+            return [dict(zip(self.BATCH_JOB_COLUMNS, row)) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Error fetching batch jobs: {e}")
+            return []
+    
+    def import_batch_job_results(self, job_id, results, **fields):
+        """Save a job's (excerpt_id, success, response) results and mark it imported in one transaction"""
+        columns = [column for column in fields if column in self.BATCH_JOB_UPDATE_COLUMNS]
+        conn = self.conn
+        try:
+            run_name, model, prompt_name = conn.execute(
+                "SELECT run_name, model, prompt_name FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+            now = time.time()
+            conn.executemany('''
+                INSERT OR REPLACE INTO batch_results
+                    (run_name, excerpt_id, model, prompt_name, success, response, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', ((run_name, excerpt_id, model, prompt_name, int(success), response, now)
+                  for excerpt_id, success, response in results))
+            assignments = "".join(f"{column} = ?, " for column in columns)
+            conn.execute(f"UPDATE batch_jobs SET {assignments}updated_at = ?, imported_at = ? WHERE id = ?",
+                         [fields[column] for column in columns] + [now, now, job_id])
+            conn.commit()
+            return True
+        except (sqlite3.Error, TypeError) as e:
+            conn.rollback()
+            print(f"Error importing batch job results: {e}")
+            return False
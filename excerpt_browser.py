@@ -0,0 +1,183 @@
+# This Python file uses the following encoding: utf-8
+from collections import OrderedDict
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, Signal
+
+
+class ExcerptTableModel(QAbstractTableModel):
+    """Excerpt previews read from the database a page at a time
+
+    Views call canFetchMore/fetchMore as they scroll towards the end, and
+    each call reads the next page with a keyset query in the current sort
+    order and filters, so sorting and filtering happen in SQL and no query
+    gets slower the further down the list it is. Only the key each page
+    starts after is kept for every page; the previews themselves are held
+    for the MAX_CACHED_PAGES most recently shown pages and read again when
+    an evicted page scrolls back into view. The full excerpt is read when a
+    row is opened.
+    """
+    HEADERS = ("ID", "Excerpt", "Rewrite")
+
+    # Database sort key of each column; None if the column cannot be sorted
+    SORT_KEYS = ('id', 'excerpt', None)
+
+    # Rows read per query, and pages of previews kept in memory
+    PAGE_SIZE = 200
+    MAX_CACHED_PAGES = 20
+
+    # Emitted from any thread when the database changes; handled on the model's thread
+    database_changed = Signal(str, object)
+
+    def __init__(self, db, parent=None):
+        """Initialize an empty model; rows are loaded when a view asks for them"""
+        super().__init__(parent)
+        self.db = db
+        self.sort_key = 'id'
+        self.descending = False
+        self.filters = {}
+        self.clear_rows()
+        self.database_changed.connect(self.handle_database_change)
+        self.db.add_change_listener(self.notify_database_change)
+
+    def clear_rows(self):
+        """Forget every loaded page"""
+        self.row_count = 0
+        self.exhausted = False
+
+        # page_keys[n] is the (sort value, id) page n starts after, None for the first page
+        self.page_keys = []
+        self.next_key = None
+
+        # Page number -> rows of (sort value, id, excerpt preview, rewrite preview), least recently used first
+        self.pages = OrderedDict()
+
+    def close(self):
+        """Unsubscribe from database changes"""
+        self.db.remove_change_listener(self.notify_database_change)
+
+    def notify_database_change(self, event, excerpt_id):
+        """Database change listener; may be called from a worker thread"""
+        self.database_changed.emit(event, excerpt_id)
+
+    def rowCount(self, parent=QModelIndex()):
+        """Return the number of rows fetched so far"""
+        return 0 if parent.isValid() else self.row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        """Return the number of columns"""
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        """Return the preview shown in a cell, or the excerpt id for Qt.UserRole"""
+        if not index.isValid():
+            return None
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter) if index.column() == 0 else None
+        if role not in (Qt.DisplayRole, Qt.UserRole):
+            return None
+        row = self.row(index.row())
+        if row is None:
+            return None
+        if role == Qt.UserRole or index.column() == 0:
+            return row[1]
+        text = row[index.column() + 1]
+        preview = " ".join(text.split())
+        return preview + "…" if len(text) >= self.db.PREVIEW_CHARS else preview
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        """Return the column titles"""
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        """Return True until a page shorter than PAGE_SIZE has been read"""
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        """Append the next page of rows"""
+        if parent.isValid() or self.exhausted:
+            return
+        rows = self.read_page(self.next_key)
+        if len(rows) < self.PAGE_SIZE:
+            self.exhausted = True
+        if not rows:
+            return
+        number = len(self.page_keys)
+        self.page_keys.append(self.next_key)
+        self.next_key = rows[-1][:2]
+        self.cache_page(number, rows)
+        self.beginInsertRows(QModelIndex(), self.row_count, self.row_count + len(rows) - 1)
+        self.row_count += len(rows)
+        self.endInsertRows()
+
+    def read_page(self, after):
+        """Read the page of rows following a (sort value, id) key"""
+        return self.db.get_excerpt_previews(self.sort_key, self.descending, after, self.PAGE_SIZE, self.filters)
+
+    def cache_page(self, number, rows):
+        """Keep a page in memory, evicting the least recently used one"""
+        self.pages[number] = rows
+        self.pages.move_to_end(number)
+        while len(self.pages) > self.MAX_CACHED_PAGES:
+            self.pages.popitem(last=False)
+
+    def row(self, position):
+        """Return the row tuple at a position, reading its page again if it was evicted"""
+        if not 0 <= position < self.row_count:
+            return None
+        number, offset = divmod(position, self.PAGE_SIZE)
+        rows = self.pages.get(number)
+        if rows is None:
+            rows = self.read_page(self.page_keys[number])
+            self.cache_page(number, rows)
+        else:
+            self.pages.move_to_end(number)
+        # Rows deleted since the page was first read leave it short until the next reload
+        return rows[offset] if offset < len(rows) else None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Reload in the order of a sortable column; other columns keep the current order"""
+        key = self.SORT_KEYS[column] if 0 <= column < len(self.SORT_KEYS) else None
+        if key is None:
+            return
+        self.sort_key = key
+        self.descending = order == Qt.DescendingOrder
+        self.reload()
+
+    def sort_column(self):
+        """Return the column the rows are sorted by"""
+        return self.SORT_KEYS.index(self.sort_key)
+
+    def set_filters(self, filters):
+        """Reload with a dict of Database excerpt filters"""
+        self.filters = dict(filters)
+        self.reload()
+
+    def reload(self):
+        """Drop the loaded rows and read the first page again"""
+        self.beginResetModel()
+        self.clear_rows()
+        self.endResetModel()
+        self.fetchMore()
+
+    def excerpt_id(self, position):
+        """Return the excerpt id shown at a row position, or None"""
+        row = self.row(position)
+        return row[1] if row else None
+
+    def handle_database_change(self, event, excerpt_id):
+        """Reload after imports and clears; refresh the previews of an updated row if it is in memory"""
+        if event in ("import", "clear"):
+            self.reload()
+        elif event == "update" and excerpt_id is not None:
+            for number, rows in self.pages.items():
+                for offset, row in enumerate(rows):
+                    if row[1] != excerpt_id:
+                        continue
+                    excerpt = self.db.get_excerpt_by_id(excerpt_id)
+                    if excerpt:
+                        chars = self.db.PREVIEW_CHARS
+                        rows[offset] = row[:2] + (excerpt[1][:chars], (excerpt[3] or "")[:chars])
+                        position = number * self.PAGE_SIZE + offset
+                        self.dataChanged.emit(self.index(position, 1), self.index(position, 2))
+                    return
@@ -0,0 +1,117 @@
+# This Python file uses the following encoding: utf-8
+import threading
+import importlib.util
+
+
+def import_httpx():
+    """Import the HTTP library the installed openai package is built on"""
+    try:
+        # openai 3.x moved to the httpx2 fork
+        import httpx2 as httpx
+    except ImportError:
+        import httpx
+    return httpx
+
+
+class HTTPPool:
+    """Long-lived HTTP client shared by every OpenAI client in the process
+
+    The client is created on first use with fixed pool limits, timeout and
+    TLS context, so connections (and TLS sessions) stay warm across
+    requests, API key changes and threads. HTTP/2 is used when the h2
+    package is installed. Connection reuse is counted through
+    the transport's trace events; see stats().
+    """
+
+    # Connection pool limits; idle connections are closed after KEEPALIVE_EXPIRY seconds
+    MAX_CONNECTIONS = 20
+    MAX_KEEPALIVE_CONNECTIONS = 10
+    KEEPALIVE_EXPIRY = 120.0
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry=KEEPALIVE_EXPIRY, http2=None, timeout=60.0):
+        """Configure the pool; no clients are created until they are needed
+
+        http2 defaults to True when the h2 package is available.
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = importlib.util.find_spec("h2") is not None if http2 is None else http2
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sync_client = None
+        self.ssl_context = None
+        self.counters = {'requests': 0, 'connections': 0, 'tls_handshakes': 0, 'http2_requests': 0}
+
+    def client_options(self, httpx):
+        """Return the keyword arguments of the shared client"""
+        if self.ssl_context is None:
+            import ssl
+            # Kept so a recreated client reuses the same certificates and TLS session cache
+            self.ssl_context = ssl.create_default_context()
+            try:
+                import certifi
+                self.ssl_context.load_verify_locations(certifi.where())
+            except ImportError:
+                pass
+        return {
+            'limits': httpx.Limits(max_connections=self.max_connections,
+                                   max_keepalive_connections=self.max_keepalive_connections,
+                                   keepalive_expiry=self.keepalive_expiry),
+            'timeout': self.timeout,
+            'http2': self.http2,
+            'verify': self.ssl_context,
+        }
+
+    def get_sync_client(self):
+        """Return the shared sync client, creating it on first use"""
+        with self.lock:
+            if self.sync_client is None:
+                from openai import DefaultHttpxClient
+                options = self.client_options(import_httpx())
+                self.sync_client = DefaultHttpxClient(
+                    event_hooks={'request': [self.trace_request], 'response': [self.count_response]}, **options)
+            return self.sync_client
+
+    def count(self, name):
+        """Increment a counter"""
+        with self.lock:
+            self.counters[name] += 1
+
+    def trace(self, event, info):
+        """Count new connections and TLS handshakes from transport trace events"""
+        if event == "connection.connect_tcp.complete":
+            self.count('connections')
+        elif event == "connection.start_tls.complete":
+            self.count('tls_handshakes')
+
+    def trace_request(self, request):
+        """Attach the trace callback to an outgoing request"""
+        request.extensions['trace'] = self.trace
+
+    def count_response(self, response):
+        """Count a completed request and its HTTP version"""
+        self.count('requests')
+        if response.http_version == "HTTP/2":
+            self.count('http2_requests')
+
+    def stats(self):
+        """Return the request and connection counters with the share of requests on reused connections"""
+        with self.lock:
+            stats = dict(self.counters)
+        stats['reused'] = max(0, stats['requests'] - stats['connections'])
+        stats['reuse_ratio'] = stats['reused'] / stats['requests'] if stats['requests'] else None
+        stats['http2'] = self.http2
+        return stats
+
+    def close(self):
+        """Close the shared client"""
+        with self.lock:
+            client, self.sync_client = self.sync_client, None
+        if client is not None:
+            client.close()
+
+
+# Process-wide pool used by OpenAIAPI unless it is given another one
+shared_pool = HTTPPool()
@@ -0,0 +1,195 @@
+# This Python file uses the following encoding: utf-8
+import os
+import json
+import time
+import inspect
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+
+class LatencyHistogram:
+    """Call count and latency distribution of one instrumented operation
+
+    Latencies fall into power-of-two microsecond buckets, so recording is a
+    bit_length() and an increment, and percentiles are bucket upper bounds.
+    """
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    BUCKETS = 40  # 2**39 us is about six days
+
+    def __init__(self):
+        """Initialize an empty histogram"""
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * self.BUCKETS
+
+    def record(self, seconds):
+        """Add one latency"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """Return the upper bound in seconds of the bucket holding the given fraction of calls"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return min((1 << index) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        """Return the count and latencies in milliseconds as a dict"""
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'mean_ms': self.total / self.count * 1000 if self.count else None,
+            'p50_ms': self.percentile(0.50) * 1000 if self.count else None,
+            'p99_ms': self.percentile(0.99) * 1000 if self.count else None,
+            'max_ms': self.max * 1000,
+        }
+
+
+class Instrumentation:
+    """Registry of latency histograms keyed by operation name
+
+    Methods instrumented with instrument_class are swapped for timing
+    wrappers only while instrumentation is enabled, so when it is off they
+    run exactly as written. timed() and timer() check the enabled flag on
+    each call instead.
+    """
+
+    def __init__(self, enabled=False):
+        """Initialize the registry"""
+        self.enabled = enabled
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.logger = None
+        
+        # (class, attribute, original function, timing wrapper) per instrumented method
+        self.sites = []
+
+    def set_enabled(self, enabled):
+        """Turn recording on or off, installing or removing the method wrappers"""
+        self.enabled = enabled
+        for cls, attribute, original, wrapper in self.sites:
+            setattr(cls, attribute, wrapper if enabled else original)
+
+    def record(self, name, seconds):
+        """Record one call of name that took seconds"""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the body of a with block as one call of name"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def timed(self, name):
+        """Decorator that times every call of a function as name while enabled"""
+        def decorate(fn):
+            return self.wrap(name, fn, check_enabled=True)
+        return decorate
+
+    def wrap(self, name, fn, check_enabled=False):
+        """Return a wrapper that records each call of fn as name
+
+        Generator functions are timed from the first call until the
+        generator is exhausted or closed.
+        """
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                if check_enabled and not self.enabled:
+                    return (yield from fn(*args, **kwargs))
+                started = time.perf_counter()
+                try:
+                    return (yield from fn(*args, **kwargs))
+                finally:
+                    self.record(name, time.perf_counter() - started)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if check_enabled and not self.enabled:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - started)
+        return wrapper
+
+    def instrument_class(self, prefix, include=None, exclude=()):
+        """Class decorator that times public methods as prefix.method_name
+
+        include limits timing to the named methods; otherwise every public
+        method not in exclude is timed. Static methods, class methods and
+        properties are left alone.
+        """
+        def decorate(cls):
+            for attribute, value in list(vars(cls).items()):
+                if attribute.startswith('_') or attribute in exclude or not inspect.isfunction(value):
+                    continue
+                if include is not None and attribute not in include:
+                    continue
+                wrapper = self.wrap(f"{prefix}.{attribute}", value)
+                self.sites.append((cls, attribute, value, wrapper))
+                if self.enabled:
+                    setattr(cls, attribute, wrapper)
+            return cls
+        return decorate
+
+    def snapshot(self):
+        """Return the summaries of all histograms, keyed by name"""
+        with self.lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def reset(self):
+        """Discard everything recorded so far"""
+        with self.lock:
+            self.histograms.clear()
+
+    def open_log(self, path, max_bytes=1024 * 1024, backups=3):
+        """Log snapshots as JSON lines to path, rolling over to path.1 ... at max_bytes"""
+        logger = logging.getLogger(f"rewrites.instrumentation.{os.path.abspath(path)}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            # The file is only created by the first write, so disabled timings leave no log behind
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8',
+                                          delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        self.logger = logger
+
+    def write_log(self):
+        """Append the current snapshot to the log, if one is open and anything was recorded"""
+        if self.logger is None:
+            return
+        stats = self.snapshot()
+        if stats:
+            self.logger.info(json.dumps({'time': time.time(), 'stats': stats}))
+
+
+# Shared registry used by the application modules
+instruments = Instrumentation(enabled=os.environ.get("REWRITES_INSTRUMENT") == "1")
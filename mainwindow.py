@@ -1,9 +1,10 @@
 # This Python file uses the following encoding: utf-8
 import sys
 import os
+import time
 from pathlib import Path
 from PySide6.QtWidgets import QApplication, QMainWindow, QFileDialog, QMessageBox, QPushButton, QLabel, QLineEdit, QTextBrowser
-from PySide6.QtCore import Qt, QUrl
+from PySide6.QtCore import Qt, QUrl, QTimer
 from PySide6.QtGui import QDesktopServices
 
 # Important:
@@ -13,20 +14,63 @@ from PySide6.QtGui import QDesktopServices
 from ui_form import Ui_MainWindow
 from database import Database
 from openai_api import OpenAIAPI
+from workers import RequestExecutor
+from request_broker import RequestBroker
+from navigation_cache import NavigationCache
+from settings_store import SettingsStore
+from batch import BatchAnalyzer, format_progress
+from prompt_registry import PromptRegistry
+from model_catalog import ModelCatalog
+from analysis_result import AnalysisResult
+from instrumentation import instruments
+from http_pool import shared_pool
 
 class MainWindow(QMainWindow):
+    # Minimum delay between two re-renders of a streaming response
+    STREAM_RENDER_INTERVAL_MS = 150
+    
+    # Pause in typing before the search box queries the database
+    SEARCH_DEBOUNCE_MS = 250
+    
+    # Time the Send button stays disabled after a click, swallowing double-clicks
+    SEND_DEBOUNCE_MS = 500
+    
+    # Markers the database wraps around matched words in search snippets
+    SEARCH_HIGHLIGHT = ("\x02", "\x03")
+    
+    # Rows per page in the History tab
+    HISTORY_PAGE_SIZE = 50
+    
+    # How often the stats panel refreshes and the stats log is appended to
+    STATS_REFRESH_MS = 1000
+    STATS_LOG_INTERVAL_MS = 60 * 1000
+    
+    # Longest wait for running background work when the window closes
+    CLOSE_TIMEOUT_MS = 3000
+    
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.startup_started = time.perf_counter()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
         self.db = Database()
         
+        # Prefetching cache for Next/Previous/Random navigation
+        self.navigator = NavigationCache(self.db)
+        
+        # Load settings once; later reads are served from memory
+        self.settings = SettingsStore(self.db)
+        self.settings.add_listener(self.handle_settings_changed)
+        
         # Get model from database if available
-        model = self.db.get_model()
-        self.openai_api = OpenAIAPI(model=model)
+        self.openai_api = OpenAIAPI(model=self.settings.model, cache=self.db)
+        
+        # Model list cached in the database and refreshed in the background
+        self.model_catalog = ModelCatalog(self.db, self.openai_api, rules=self.settings.model_filter)
+        self.model_refresh_worker = None
         
         # Set up API key from database if available
-        api_key = self.db.get_api_key()
+        api_key = self.settings.api_key
         if api_key:
             self.openai_api.set_api_key(api_key)
             self.ui.apifield.setEchoMode(QLineEdit.Password)  # Set to password mode
@@ -35,6 +79,13 @@ class MainWindow(QMainWindow):
         # Replace QTextEdit with QTextBrowser for markdown rendering
         self.setup_markdown_viewer()
         
+        # Background executor for OpenAI requests so the GUI stays responsive
+        self.executor = RequestExecutor(parent=self)
+        self.analysis_workers = set()
+        
+        # Identical analyses share one request; ones for other excerpts are cancelled
+        self.request_broker = RequestBroker(self.executor)
+        
         # Connect UI signals to slots
         self.ui.sendopenai.clicked.connect(self.send_to_openai)
         self.ui.pushButton_random.clicked.connect(self.load_random_excerpt)
@@ -43,32 +94,81 @@ class MainWindow(QMainWindow):
         # Add navigation buttons for excerpts
         self.setup_navigation_buttons()
         
+        # Add the full-text search box
+        self.setup_search_box()
+        
+        # Add cancel button for in-flight requests
+        self.setup_cancel_button()
+        
+        # Progress bar for background imports and exports
+        self.setup_task_progress()
+        
         # Set up prompt combo box
         self.setup_prompt_combo_box()
         
         # Current excerpt ID
         self.current_excerpt_id = None
         
-        # Add import CSV button and other UI elements to settings tab
-        self.setup_settings_ui()
+        # The settings tab is built when it is first opened
+        self.settings_tab_built = False
+        self.font_families = None
+        self.ui.Tabs.currentChanged.connect(
+            lambda index: self.setup_settings_tab() if self.ui.Tabs.widget(index) is self.ui.Settings else None)
+        
+        # Add the tab listing every excerpt
+        self.setup_browse_tab()
+        
+        # Add the analysis history tab
+        self.setup_history_tab()
+        
+        # Log timing statistics even while the settings tab is unbuilt
+        self.setup_stats_log()
         
         # Apply font settings if available
         self.apply_font_settings()
+        
+        # Work that can wait for the first paint is done in finish_startup
+        self.startup_pending = True
+        if instruments.enabled:
+            instruments.record("ui.startup.init", time.perf_counter() - self.startup_started)
+    
+    def showEvent(self, event):
+        """Schedule the deferred startup work once the window is first shown"""
+        super().showEvent(event)
+        if self.startup_pending:
+            self.startup_pending = False
+            QTimer.singleShot(0, self.finish_startup)
+    
+    def finish_startup(self):
+        """Load fonts and the API client and refresh the model list after the first paint"""
+        if instruments.enabled:
+            instruments.record("ui.startup.shown", time.perf_counter() - self.startup_started)
+        self.populate_font_combo()
+        if self.settings.api_key:
+            # Import openai and create the client before the first request needs it
+            self.executor.submit(lambda worker: self.openai_api.client)
+            
+            # Refresh the cached model list if it has expired
+            if self.model_catalog.is_stale():
+                self.fetch_and_update_models(quiet=True)
+        if instruments.enabled:
+            instruments.record("ui.startup.deferred", time.perf_counter() - self.startup_started)
 
 
     def setup_prompt_combo_box(self):
         """Set up the prompt combo box with default templates"""
-        # Get default prompt templates
-        default_templates = self.openai_api.get_default_prompt_templates()
-        
-        # Add default templates to combo box
-        for name in default_templates.keys():
-            self.ui.comboBox_prompt.addItem(name)
-        
-        # Get saved prompts from database
-        saved_prompts = self.db.get_all_prompts()
-        for prompt in saved_prompts:
-            self.ui.comboBox_prompt.addItem(prompt[1])  # prompt[1] is the name
+        # Default and saved templates, parsed once and cached by name
+        self.prompts = PromptRegistry(self.db, self.openai_api.get_default_prompt_templates())
+        self.ui.comboBox_prompt.addItems(self.prompts.names())
+    
+    def setup_settings_tab(self):
+        """Build the settings tab the first time it is opened"""
+        if self.settings_tab_built:
+            return
+        self.settings_tab_built = True
+        with instruments.timer("ui.settings_tab"):
+            self.setup_settings_ui()
+            self.setup_stats_panel()
     
     def setup_settings_ui(self):
         """Set up all UI elements in the settings tab"""
@@ -103,7 +203,8 @@ class MainWindow(QMainWindow):
         # Add refresh models button
         self.refresh_models_button = QPushButton("Refresh Models", self.ui.Settings)
         self.refresh_models_button.setGeometry(300, 150, 120, 32)
-        self.refresh_models_button.clicked.connect(self.fetch_and_update_models)
+        self.refresh_models_button.clicked.connect(lambda: self.fetch_and_update_models())
+        self.refresh_models_button.setEnabled(self.model_refresh_worker is None)
         self.refresh_models_button.show()
         
         # Clear Database button
@@ -121,19 +222,23 @@ class MainWindow(QMainWindow):
         self.model_combo = QComboBox(self.ui.Settings)
         self.model_combo.setGeometry(140, 150, 150, 32)
         
-        # Load models from database
-        saved_models = self.db.get_models()
-        self.model_combo.addItems(saved_models)
-        
-        # Set current model from database
-        current_model = self.db.get_model()
-        index = self.model_combo.findText(current_model)
-        if index >= 0:
-            self.model_combo.setCurrentIndex(index)
+        # Load models from the cached catalogue
+        self.populate_model_combo()
         
         self.model_combo.currentTextChanged.connect(self.save_model)
         self.model_combo.show()
         
+        # Model filter rules
+        self.model_filter_label = QLabel("Model filter (-keyword hides):", self.ui.Settings)
+        self.model_filter_label.setGeometry(610, 130, 300, 16)
+        self.model_filter_label.show()
+        
+        self.model_filter_field = QLineEdit(self.ui.Settings)
+        self.model_filter_field.setGeometry(610, 150, 300, 32)
+        self.model_filter_field.setText(self.settings.model_filter)
+        self.model_filter_field.editingFinished.connect(self.save_model_filter)
+        self.model_filter_field.show()
+        
         # Prompt template selection
         self.prompt_label = QLabel("Select Prompt Template:", self.ui.Settings)
         self.prompt_label.setGeometry(30, 200, 150, 16)
@@ -161,11 +266,10 @@ class MainWindow(QMainWindow):
         self.font_family_label.setGeometry(40, 300, 100, 16)
         self.font_family_label.show()
         
-        from PySide6.QtGui import QFontDatabase
         self.font_family_combo = QComboBox(self.ui.Settings)
         self.font_family_combo.setGeometry(140, 300, 150, 32)
-        font_families = QFontDatabase().families()
-        self.font_family_combo.addItems(font_families)
+        self.populate_font_combo()
+        self.font_family_combo.show()
         
         # Font size selection
         self.font_size_label = QLabel("Font Size:", self.ui.Settings)
@@ -185,12 +289,212 @@ class MainWindow(QMainWindow):
         self.apply_font_button.clicked.connect(self.save_font_settings)
         self.apply_font_button.show()
         
+        # Load current font size
+        self.font_size_spin.setValue(self.settings.font_size)
+        
+        # Response cache settings
+        from PySide6.QtWidgets import QCheckBox
+        self.cache_checkbox = QCheckBox("Use response cache", self.ui.Settings)
+        self.cache_checkbox.setGeometry(30, 440, 160, 32)
+        self.cache_checkbox.setChecked(self.db.cache_enabled)
+        self.cache_checkbox.toggled.connect(self.toggle_response_cache)
+        self.cache_checkbox.show()
+        
+        self.clear_cache_button = QPushButton("Clear Cache", self.ui.Settings)
+        self.clear_cache_button.setGeometry(200, 440, 120, 32)
+        self.clear_cache_button.clicked.connect(self.clear_response_cache)
+        self.clear_cache_button.show()
+        
+        self.cache_stats_label = QLabel(self.ui.Settings)
+        self.cache_stats_label.setGeometry(330, 448, 400, 16)
+        self.cache_stats_label.show()
+        self.update_cache_stats()
+        
+        # Batch analysis of every excerpt that has a rewrite
+        self.batch_button = QPushButton("Batch Analyze", self.ui.Settings)
+        self.batch_button.setGeometry(30, 490, 120, 32)
+        self.batch_button.clicked.connect(self.start_batch_analysis)
+        self.batch_button.show()
+        
+        self.cancel_batch_button = QPushButton("Stop Batch", self.ui.Settings)
+        self.cancel_batch_button.setGeometry(160, 490, 120, 32)
+        self.cancel_batch_button.setEnabled(False)
+        self.cancel_batch_button.clicked.connect(self.cancel_batch_analysis)
+        self.cancel_batch_button.show()
+        
+        from PySide6.QtWidgets import QProgressBar
+        self.batch_progress = QProgressBar(self.ui.Settings)
+        self.batch_progress.setGeometry(290, 494, 310, 24)
+        self.batch_progress.show()
+        
+        self.batch_status_label = QLabel(self.ui.Settings)
+        self.batch_status_label.setGeometry(30, 530, 570, 16)
+        self.batch_status_label.show()
+        self.batch_worker = None
+    
+    def populate_font_combo(self):
+        """Fill the font family combo box, listing the installed families on first use"""
+        if self.font_families is None:
+            # Slow on systems with many fonts, so it waits until after the first paint
+            from PySide6.QtGui import QFontDatabase
+            with instruments.timer("ui.font_families"):
+                self.font_families = QFontDatabase.families()
+        if not self.settings_tab_built or self.font_family_combo.count():
+            return
+        self.font_family_combo.addItems(self.font_families)
+        
         # Load current font settings if available
-        font_family, font_size = self.db.get_font_settings()
-        index = self.font_family_combo.findText(font_family)
+        index = self.font_family_combo.findText(self.settings.font_family)
         if index >= 0:
             self.font_family_combo.setCurrentIndex(index)
-        self.font_size_spin.setValue(font_size)
+    
+    def setup_stats_panel(self):
+        """Set up the panel showing call counts and latencies of instrumented operations"""
+        from PySide6.QtWidgets import QCheckBox, QTableWidget, QAbstractItemView
+        self.stats_checkbox = QCheckBox("Collect timings", self.ui.Settings)
+        self.stats_checkbox.setGeometry(620, 200, 150, 32)
+        self.stats_checkbox.setChecked(instruments.enabled)
+        self.stats_checkbox.toggled.connect(self.toggle_instrumentation)
+        self.stats_checkbox.show()
+        
+        self.reset_stats_button = QPushButton("Reset", self.ui.Settings)
+        self.reset_stats_button.setGeometry(780, 200, 100, 32)
+        self.reset_stats_button.clicked.connect(self.reset_stats)
+        self.reset_stats_button.show()
+        
+        self.stats_table = QTableWidget(0, 5, self.ui.Settings)
+        self.stats_table.setGeometry(620, 240, 370, 190)
+        self.stats_table.setHorizontalHeaderLabels(["Operation", "Calls", "Mean ms", "p99 ms", "Max ms"])
+        self.stats_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.stats_table.verticalHeader().hide()
+        self.stats_table.show()
+        
+        # Reuse of the pooled connections to the API
+        self.http_stats_label = QLabel(self.ui.Settings)
+        self.http_stats_label.setGeometry(620, 435, 370, 16)
+        self.http_stats_label.show()
+        self.update_stats_panel()
+    
+    def setup_stats_log(self):
+        """Set up the timers that refresh the stats panel and append to the stats log"""
+        # Snapshots are also appended to a rolling JSON log next to the database
+        instruments.open_log(os.path.splitext(self.db.db_path)[0] + "-stats.jsonl")
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(self.STATS_REFRESH_MS)
+        self.stats_timer.timeout.connect(self.update_stats_panel)
+        self.stats_log_timer = QTimer(self)
+        self.stats_log_timer.setInterval(self.STATS_LOG_INTERVAL_MS)
+        self.stats_log_timer.timeout.connect(instruments.write_log)
+        if instruments.enabled:
+            self.stats_timer.start()
+            self.stats_log_timer.start()
+    
+    def toggle_instrumentation(self, enabled):
+        """Start or stop collecting timings"""
+        instruments.set_enabled(enabled)
+        if enabled:
+            self.stats_timer.start()
+            self.stats_log_timer.start()
+        else:
+            self.stats_timer.stop()
+            self.stats_log_timer.stop()
+            instruments.write_log()
+        self.update_stats_panel()
+    
+    def reset_stats(self):
+        """Discard the collected timings"""
+        instruments.reset()
+        self.update_stats_panel()
+    
+    def update_stats_panel(self):
+        """Show the latest timings while the settings tab is visible"""
+        if not self.settings_tab_built:
+            return
+        if self.ui.Tabs.currentWidget() is not self.ui.Settings and self.stats_table.rowCount():
+            return
+        from PySide6.QtWidgets import QTableWidgetItem
+        stats = instruments.snapshot()
+        self.stats_table.setRowCount(len(stats))
+        for row, (name, summary) in enumerate(stats.items()):
+            values = [name, str(summary['count']), f"{summary['mean_ms']:.2f}",
+                      f"{summary['p99_ms']:.2f}", f"{summary['max_ms']:.2f}"]
+            for column, value in enumerate(values):
+                self.stats_table.setItem(row, column, QTableWidgetItem(value))
+        self.stats_table.resizeColumnsToContents()
+        
+        http = shared_pool.stats()
+        reuse = f"{http['reuse_ratio']:.0%}" if http['reuse_ratio'] is not None else "--"
+        self.http_stats_label.setText(
+            f"HTTP: {http['requests']} requests, {http['connections']} connections opened, "
+            f"{reuse} reused{', HTTP/2' if http['http2'] else ''}")
+    
+    def toggle_response_cache(self, enabled):
+        """Enable or bypass the response cache"""
+        self.db.cache_enabled = enabled
+        self.update_cache_stats()
+    
+    def clear_response_cache(self):
+        """Clear all cached API responses"""
+        success, message = self.db.clear_response_cache()
+        if success:
+            QMessageBox.information(self, "Success", message)
+        else:
+            QMessageBox.critical(self, "Error", message)
+        self.update_cache_stats()
+    
+    def update_cache_stats(self):
+        """Show the response cache size and hit/miss counters"""
+        if not self.settings_tab_built:
+            return
+        stats = self.db.get_cache_stats()
+        self.cache_stats_label.setText(
+            f"{stats['entries']} cached responses ({stats['bytes'] // 1024} KB), "
+            f"{stats['hits']} hits / {stats['misses']} misses")
+    
+    def start_batch_analysis(self):
+        """Analyze every excerpt that has a rewrite in the background"""
+        prompt_name = self.ui.comboBox_prompt.currentText()
+        prompt_template = self.get_prompt_template(prompt_name)
+        analyzer = BatchAnalyzer(self.db, self.openai_api, prompt_template, prompt_name=prompt_name)
+        
+        self.batch_button.setEnabled(False)
+        self.cancel_batch_button.setEnabled(True)
+        self.batch_progress.setValue(0)
+        self.batch_status_label.setText(f"Starting batch run '{analyzer.run_name}'...")
+        self.batch_worker = self.executor.submit(
+            lambda worker: analyzer.run(progress_callback=worker.report_progress,
+                                        should_cancel=worker.is_cancelled),
+            on_result=self.handle_batch_result,
+            on_error=lambda message: self.batch_status_label.setText(f"Error: {message}"),
+            on_progress=self.handle_batch_progress,
+            on_finished=self.handle_batch_finished,
+        )
+    
+    def cancel_batch_analysis(self):
+        """Stop submitting batch requests; results so far are kept for resuming"""
+        if self.batch_worker:
+            self.batch_worker.cancel()
+            self.batch_status_label.setText("Stopping after in-flight requests finish...")
+    
+    def handle_batch_progress(self, progress):
+        """Show batch throughput and ETA"""
+        self.batch_progress.setMaximum(progress['total'])
+        self.batch_progress.setValue(progress['done'])
+        self.batch_status_label.setText(format_progress(progress))
+    
+    def handle_batch_result(self, outcome):
+        """Show the batch summary"""
+        success, message = outcome
+        self.batch_status_label.setText(message)
+    
+    def handle_batch_finished(self):
+        """Reset the batch controls"""
+        if self.batch_worker and self.batch_worker.is_cancelled():
+            self.batch_status_label.setText("Batch stopped; run it again to resume.")
+        self.batch_worker = None
+        self.batch_button.setEnabled(True)
+        self.cancel_batch_button.setEnabled(False)
+        self.update_cache_stats()
     
     def save_api_key(self):
         """Save the OpenAI API key to the database"""
@@ -200,62 +504,92 @@ class MainWindow(QMainWindow):
             return
         
         # Save to database
-        if self.db.save_api_key(api_key):
-            self.openai_api.set_api_key(api_key)
+        if self.settings.update(api_key=api_key):
             QMessageBox.information(self, "Success", "API key saved successfully.")
         else:
             QMessageBox.critical(self, "Error", "Failed to save API key.")
     
+    def handle_settings_changed(self, changes):
+        """Apply changed settings to the API client and the UI"""
+        if 'api_key' in changes:
+            self.openai_api.set_api_key(changes['api_key'])
+        if 'model' in changes:
+            self.openai_api.set_model(changes['model'])
+        if 'font_family' in changes or 'font_size' in changes:
+            self.apply_font_settings()
+        if 'model_filter' in changes:
+            self.model_catalog.rules = changes['model_filter']
+            self.populate_model_combo()
+        if changes.get('api_key') and self.model_catalog.is_stale():
+            self.fetch_and_update_models(quiet=True)
+    
     def save_model(self, model):
         """Save the selected model to the database"""
         if not model:
             return
         
         # Save to database
-        if self.db.save_model(model):
-            self.openai_api.set_model(model)
+        if self.settings.update(model=model):
             QMessageBox.information(self, "Success", f"Model set to {model}")
         else:
             QMessageBox.critical(self, "Error", "Failed to save model selection.")
     
-    def fetch_and_update_models(self):
-        """Fetch available models from OpenAI API and update the model combo box"""
-        # Show loading message
-        self.model_combo.clear()
-        self.model_combo.addItem("Fetching models...")
-        
-        # Fetch models from OpenAI API
-        success, models = self.openai_api.fetch_available_models()
+    def populate_model_combo(self):
+        """Fill the model combo box from the catalogue without saving the selection"""
+        if not self.settings_tab_built:
+            return
+        models = self.model_catalog.models()
+        current_model = self.settings.model
+        if current_model not in models:
+            models.insert(0, current_model)
         
-        # Update model combo box
+        # Repopulating would otherwise report each change as a new model selection
+        self.model_combo.blockSignals(True)
         self.model_combo.clear()
+        self.model_combo.addItems(models)
+        self.model_combo.setCurrentIndex(self.model_combo.findText(current_model))
+        self.model_combo.blockSignals(False)
+    
+    def save_model_filter(self):
+        """Save the model filter rules"""
+        self.settings.update(model_filter=self.model_filter_field.text().strip())
+    
+    def fetch_and_update_models(self, quiet=False):
+        """Fetch available models from OpenAI API in the background and update the model combo box"""
+        if self.model_refresh_worker is not None:
+            return
+        
+        if self.settings_tab_built:
+            self.refresh_models_button.setEnabled(False)
+        if not quiet:
+            self.statusBar().showMessage("Fetching models...")
+        self.model_refresh_worker = self.executor.submit(
+            lambda worker: self.model_catalog.refresh(),
+            on_result=lambda outcome: self.handle_models_refreshed(outcome, quiet),
+            on_error=lambda message: self.handle_models_refreshed((False, message), quiet),
+            on_finished=lambda: self.handle_models_refresh_finished(quiet),
+        )
+    
+    def handle_models_refreshed(self, outcome, quiet):
+        """Show the refreshed model list"""
+        success, message = outcome
         if success:
-            # Filter out models with specific keywords
-            filtered_models = []
-            excluded_keywords = ["instruct", "preview", "audio", "realtime", "search", "transcribe", "tts"]
-            
-            for model in models:
-                # Check if any excluded keyword is in the model name
-                if not any(keyword in model.lower() for keyword in excluded_keywords):
-                    filtered_models.append(model)
-            
-            # Save filtered models to database
-            self.db.save_models(filtered_models)
-            
-            self.model_combo.addItems(filtered_models)
-            
-            # Set current model from database
-            current_model = self.db.get_model()
-            index = self.model_combo.findText(current_model)
-            if index >= 0:
-                self.model_combo.setCurrentIndex(index)
-            
-            QMessageBox.information(self, "Success", f"Models fetched and saved successfully. Filtered out {len(models) - len(filtered_models)} models.")
+            self.populate_model_combo()
+        if quiet:
+            if not success:
+                print(f"Background model refresh failed: {message}")
+        elif success:
+            QMessageBox.information(self, "Success", message)
         else:
-            # Add default models if fetch fails
-            default_models = ["gpt-3.5-turbo", "gpt-4", "gpt-4-turbo", "gpt-4o"]
-            self.model_combo.addItems(default_models)
-            QMessageBox.warning(self, "Warning", models[0])
+            QMessageBox.warning(self, "Warning", message)
+    
+    def handle_models_refresh_finished(self, quiet):
+        """Re-enable the Refresh Models button"""
+        self.model_refresh_worker = None
+        if self.settings_tab_built:
+            self.refresh_models_button.setEnabled(True)
+        if not quiet:
+            self.statusBar().clearMessage()
     
     def load_prompt_file(self):
         """Load a prompt template from a file"""
@@ -276,6 +610,9 @@ class MainWindow(QMainWindow):
                 # Get the file name without extension as the prompt name
                 name = Path(file_path).stem
                 
+                # Validate the placeholders once, before the template is stored
+                self.prompts.parse(name, content)
+                
                 # Save to database
                 if self.db.save_prompt(name, content):
                     # Add to combo box if not already there
@@ -299,18 +636,15 @@ class MainWindow(QMainWindow):
         font_size = self.font_size_spin.value()
         
         # Save to database
-        if self.db.save_font_settings(font_family, font_size):
-            self.apply_font_settings()
+        if self.settings.update(font_family=font_family, font_size=font_size):
             QMessageBox.information(self, "Success", "Font settings saved successfully.")
         else:
             QMessageBox.critical(self, "Error", "Failed to save font settings.")
     
     def apply_font_settings(self):
         """Apply the saved font settings to the UI"""
-        font_family, font_size = self.db.get_font_settings()
-        
         from PySide6.QtGui import QFont
-        font = QFont(font_family, font_size)
+        font = QFont(self.settings.font_family, self.settings.font_size)
         
         # Apply to text areas
         self.ui.Excerpts.setFont(font)
@@ -330,56 +664,145 @@ class MainWindow(QMainWindow):
         if not file_path:
             return
         
-        success, message = self.db.import_csv(file_path)
+        # Ask how excerpts that are already in the database should be handled
+        from PySide6.QtWidgets import QInputDialog
+        modes = {
+            "Skip excerpts already in the database": "skip",
+            "Update their analysis and rewrite": "update",
+            "Keep both copies": "keep-both",
+        }
+        choice, ok = QInputDialog.getItem(self, "Import CSV", "Duplicate excerpts:", list(modes), 0, False)
+        if not ok:
+            return
+        
+        # Import on a worker thread and report progress in the status bar. Each
+        # chunk is committed on its own so GUI writes get the lock in between.
+        self.import_button.setEnabled(False)
+        self.show_task_progress("Importing CSV...")
+        self.executor.submit(
+            lambda worker: self.db.import_csv(
+                file_path,
+                mode=modes[choice],
+                single_transaction=False,
+                progress_callback=lambda rows, done, total: worker.report_progress((rows, done, total))),
+            on_result=self.handle_import_result,
+            on_error=lambda message: QMessageBox.critical(self, "Error", message),
+            on_progress=self.handle_import_progress,
+            on_finished=self.handle_import_finished,
+        )
+    
+    def handle_import_progress(self, progress):
+        """Update the progress bar while a CSV import runs"""
+        rows, bytes_read, total_bytes = progress
+        self.update_task_progress(bytes_read, total_bytes, f"Processed {rows} rows...")
+    
+    def handle_import_result(self, outcome):
+        """Report the outcome of a CSV import"""
+        success, message = outcome
         if success:
             QMessageBox.information(self, "Success", message)
         else:
             QMessageBox.critical(self, "Error", message)
     
+    def handle_import_finished(self):
+        """Reset the import controls"""
+        self.import_button.setEnabled(True)
+        self.hide_task_progress()
+    
+    def setup_task_progress(self):
+        """Set up the status bar progress bar used by background imports and exports"""
+        from PySide6.QtWidgets import QProgressBar
+        self.task_progress = QProgressBar(self)
+        self.task_progress.setMaximumWidth(200)
+        self.task_progress.hide()
+        self.statusBar().addPermanentWidget(self.task_progress)
+    
+    def show_task_progress(self, message):
+        """Show the status bar progress bar"""
+        self.task_progress.setRange(0, 0)  # Busy indicator until the first update
+        self.task_progress.show()
+        self.statusBar().showMessage(message)
+    
+    def update_task_progress(self, done, total, message):
+        """Update the status bar progress bar"""
+        # QProgressBar takes ints, so scale large byte counts down to per-mille
+        self.task_progress.setRange(0, 1000)
+        self.task_progress.setValue(int(done * 1000 / total) if total else 0)
+        self.statusBar().showMessage(message)
+    
+    def hide_task_progress(self):
+        """Hide the status bar progress bar"""
+        self.task_progress.hide()
+        self.statusBar().clearMessage()
+    
     def export_to_csv(self):
         """Export excerpts to a CSV file"""
-        file_path, _ = QFileDialog.getSaveFileName(
+        file_path, selected_filter = QFileDialog.getSaveFileName(
             self,
             "Save CSV File",
             "",
-            "CSV Files (*.csv)"
+            "CSV Files (*.csv);;Gzipped CSV Files (*.csv.gz)"
         )
         
         if not file_path:
             return
         
         # Add .csv extension if not present
-        if not file_path.lower().endswith('.csv'):
-            file_path += '.csv'
+        extension = '.csv.gz' if selected_filter.startswith("Gzipped") else '.csv'
+        if not file_path.lower().endswith(extension):
+            file_path += extension
         
-        success, message = self.db.export_to_csv(file_path)
-        if success:
-            QMessageBox.information(self, "Success", message)
-        else:
-            QMessageBox.critical(self, "Error", message)
+        self.start_export(self.db.export_to_csv, file_path)
     
     def export_to_json(self):
         """Export excerpts to a JSON file"""
-        file_path, _ = QFileDialog.getSaveFileName(
+        file_path, selected_filter = QFileDialog.getSaveFileName(
             self,
             "Save JSON File",
             "",
-            "JSON Files (*.json)"
+            "JSON Files (*.json);;NDJSON Files (*.ndjson);;Gzipped JSON Files (*.json.gz);;Gzipped NDJSON Files (*.ndjson.gz)"
         )
         
         if not file_path:
             return
         
         # Add .json extension if not present
-        if not file_path.lower().endswith('.json'):
-            file_path += '.json'
+        extension = selected_filter[selected_filter.index('*') + 1:-1] if '*' in selected_filter else '.json'
+        if not file_path.lower().endswith(extension):
+            file_path += extension
         
-        success, message = self.db.export_to_json(file_path)
+        self.start_export(self.db.export_to_json, file_path)
+    
+    def start_export(self, export_function, file_path):
+        """Run an export on a worker thread with progress in the status bar"""
+        self.export_csv_button.setEnabled(False)
+        self.export_json_button.setEnabled(False)
+        self.show_task_progress(f"Exporting to {file_path}...")
+        self.executor.submit(
+            lambda worker: export_function(
+                file_path,
+                progress_callback=lambda done, total: worker.report_progress((done, total))),
+            on_result=self.handle_export_result,
+            on_error=lambda message: QMessageBox.critical(self, "Error", message),
+            on_progress=lambda progress: self.update_task_progress(
+                progress[0], progress[1], f"Exported {progress[0]} of {progress[1]} excerpts..."),
+            on_finished=self.handle_export_finished,
+        )
+    
+    def handle_export_result(self, outcome):
+        """Report the outcome of an export"""
+        success, message = outcome
         if success:
             QMessageBox.information(self, "Success", message)
         else:
             QMessageBox.critical(self, "Error", message)
     
+    def handle_export_finished(self):
+        """Reset the export controls"""
+        self.export_csv_button.setEnabled(True)
+        self.export_json_button.setEnabled(True)
+        self.hide_task_progress()
+    
     def clear_database(self):
         """Clear all excerpts from the database"""
         # Show confirmation dialog
@@ -395,8 +818,8 @@ class MainWindow(QMainWindow):
             success, message = self.db.clear_database()
             if success:
                 QMessageBox.information(self, "Success", message)
-                # Reset current excerpt ID
-                self.current_excerpt_id = None
+                # Reset current excerpt ID, cancelling requests for the cleared excerpts
+                self.set_current_excerpt(None)
                 # Clear text fields
                 self.ui.Excerpts.clear()
                 self.ui.analysis.clear()
@@ -418,63 +841,394 @@ class MainWindow(QMainWindow):
         self.next_button.setGeometry(230, 10, 100, 32)
         self.next_button.clicked.connect(self.load_next_excerpt)
         self.next_button.show()
+        
+        # Random selection without repeats until every excerpt has been shown
+        from PySide6.QtWidgets import QCheckBox
+        self.no_repeat_checkbox = QCheckBox("No repeats", self.ui.WorkArea)
+        self.no_repeat_checkbox.setGeometry(120, 44, 120, 24)
+        self.no_repeat_checkbox.setChecked(self.settings.random_no_repeat)
+        self.no_repeat_checkbox.toggled.connect(lambda checked: self.settings.update(random_no_repeat=checked))
+        self.no_repeat_checkbox.show()
+    
+    def setup_search_box(self):
+        """Set up the search box and its drop-down list of results"""
+        from PySide6.QtWidgets import QListWidget
+        self.search_field = QLineEdit(self.ui.WorkArea)
+        self.search_field.setGeometry(350, 10, 251, 32)
+        self.search_field.setPlaceholderText("Search excerpts...")
+        self.search_field.setClearButtonEnabled(True)
+        self.search_field.textChanged.connect(self.schedule_search)
+        self.search_field.returnPressed.connect(self.load_first_search_result)
+        self.search_field.show()
+        
+        self.search_results = QListWidget(self.ui.WorkArea)
+        self.search_results.setGeometry(350, 44, 400, 220)
+        self.search_results.itemActivated.connect(self.load_search_result)
+        self.search_results.itemClicked.connect(self.load_search_result)
+        self.search_results.hide()
+        
+        # Query only once typing pauses; results of superseded queries are dropped
+        self.search_worker = None
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
+    
+    def schedule_search(self):
+        """Restart the search debounce timer"""
+        self.search_timer.start()
+    
+    def run_search(self):
+        """Search the database for the text in the search box on a worker thread"""
+        text = self.search_field.text()
+        if len(text.strip()) < 2:
+            self.search_worker = None
+            self.search_results.hide()
+            return
+        
+        worker = self.executor.submit(
+            lambda worker: self.db.search(text, highlight=self.SEARCH_HIGHLIGHT),
+            on_result=lambda rows: self.show_search_results(worker, rows),
+        )
+        self.search_worker = worker
+    
+    def show_search_results(self, worker, rows):
+        """Fill the results list with the rows of the latest search"""
+        if worker is not self.search_worker:
+            return
+        
+        import html
+        from PySide6.QtWidgets import QListWidgetItem
+        self.search_results.clear()
+        if not rows:
+            self.search_results.addItem("No matches")
+            self.search_results.item(0).setFlags(Qt.NoItemFlags)
+        for excerpt_id, snippet, score in rows:
+            # Escape the snippet, then turn the highlight markers into bold tags
+            text = html.escape(snippet.replace("\n", " "))
+            text = text.replace(self.SEARCH_HIGHLIGHT[0], "<b>").replace(self.SEARCH_HIGHLIGHT[1], "</b>")
+            label = QLabel(f"#{excerpt_id}: {text}")
+            label.setTextFormat(Qt.RichText)
+            item = QListWidgetItem()
+            item.setData(Qt.UserRole, excerpt_id)
+            item.setSizeHint(label.sizeHint())
+            self.search_results.addItem(item)
+            self.search_results.setItemWidget(item, label)
+        self.search_results.raise_()
+        self.search_results.show()
+    
+    def load_first_search_result(self):
+        """Load the top search result when Enter is pressed in the search box"""
+        if not self.search_results.isHidden() and self.search_results.count():
+            self.load_search_result(self.search_results.item(0))
+    
+    def load_search_result(self, item):
+        """Load the excerpt of a search result"""
+        excerpt_id = item.data(Qt.UserRole)
+        if excerpt_id is None:
+            return
+        excerpt = self.db.get_excerpt_by_id(excerpt_id)
+        if not excerpt:
+            QMessageBox.warning(self, "Warning", "The selected excerpt no longer exists.")
+            return
+        self.search_results.hide()
+        
+        self.display_excerpt(excerpt)
+    
+    def setup_browse_tab(self):
+        """Set up the tab that lists excerpts, loading rows as the table is scrolled"""
+        from PySide6.QtWidgets import QWidget, QCheckBox, QTableView, QAbstractItemView, QHeaderView
+        self.browse_tab = QWidget()
+        self.ui.Tabs.addTab(self.browse_tab, "Browse")
+        
+        self.browse_filter_field = QLineEdit(self.browse_tab)
+        self.browse_filter_field.setGeometry(10, 10, 300, 32)
+        self.browse_filter_field.setPlaceholderText("Filter excerpts...")
+        self.browse_filter_field.setClearButtonEnabled(True)
+        
+        self.browse_rewrite_checkbox = QCheckBox("Only with a rewrite", self.browse_tab)
+        self.browse_rewrite_checkbox.setGeometry(320, 10, 180, 32)
+        self.browse_rewrite_checkbox.toggled.connect(lambda checked: self.apply_browse_filters())
+        
+        self.browse_count_label = QLabel("", self.browse_tab)
+        self.browse_count_label.setGeometry(510, 10, 481, 32)
+        
+        self.browse_table = QTableView(self.browse_tab)
+        self.browse_table.setGeometry(10, 50, 981, 590)
+        self.browse_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.browse_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.browse_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.browse_table.setWordWrap(False)
+        self.browse_table.verticalHeader().hide()
+        self.browse_table.horizontalHeader().setStretchLastSection(True)
+        self.browse_table.activated.connect(self.open_browse_row)
+        self.browse_table.clicked.connect(self.open_browse_row)
+        
+        # Every row has the same height, so the view never measures rows to lay them out
+        self.browse_table.verticalHeader().setDefaultSectionSize(24)
+        self.browse_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        
+        # The header only shows the order; sorting is done by the model in SQL
+        header = self.browse_table.horizontalHeader()
+        header.setSectionsClickable(True)
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(0, Qt.AscendingOrder)
+        header.sortIndicatorChanged.connect(self.sort_browse_table)
+        
+        # Filter only once typing pauses
+        self.browse_filter_timer = QTimer(self)
+        self.browse_filter_timer.setSingleShot(True)
+        self.browse_filter_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self.browse_filter_timer.timeout.connect(self.apply_browse_filters)
+        self.browse_filter_field.textChanged.connect(lambda text: self.browse_filter_timer.start())
+        
+        # The model is created, and the first page read, when the tab is first opened
+        self.browse_model = None
+        self.browse_count_worker = None
+        self.ui.Tabs.currentChanged.connect(
+            lambda index: self.load_browse_tab() if self.ui.Tabs.widget(index) is self.browse_tab else None)
+    
+    def load_browse_tab(self):
+        """Attach the excerpt model to the table the first time the tab is opened"""
+        if self.browse_model is not None:
+            return
+        from excerpt_browser import ExcerptTableModel
+        self.browse_model = ExcerptTableModel(self.db, self)
+        self.browse_model.modelReset.connect(self.update_browse_count)
+        self.browse_table.setModel(self.browse_model)
+        self.browse_table.setColumnWidth(0, 70)
+        self.browse_table.setColumnWidth(1, 520)
+        self.apply_browse_filters()
+    
+    def browse_filters(self):
+        """Return the excerpt filters chosen in the Browse tab"""
+        return {
+            'text': self.browse_filter_field.text() or None,
+            'has_rewrite': True if self.browse_rewrite_checkbox.isChecked() else None,
+        }
+    
+    def apply_browse_filters(self):
+        """Reload the excerpt list with the current filters"""
+        if self.browse_model is not None:
+            self.browse_model.set_filters(self.browse_filters())
+    
+    def sort_browse_table(self, column, order):
+        """Sort the excerpt list by a clicked column, if it can be sorted"""
+        if self.browse_model is None:
+            return
+        if self.browse_model.SORT_KEYS[column] is None:
+            # Put the indicator back on the column the rows are actually sorted by
+            header = self.browse_table.horizontalHeader()
+            header.blockSignals(True)
+            header.setSortIndicator(self.browse_model.sort_column(),
+                                    Qt.DescendingOrder if self.browse_model.descending else Qt.AscendingOrder)
+            header.blockSignals(False)
+            return
+        self.browse_model.sort(column, order)
+    
+    def update_browse_count(self):
+        """Count the excerpts matching the Browse filters on a worker thread"""
+        filters = self.browse_model.filters
+        worker = self.executor.submit(
+            lambda worker: self.db.count_excerpts(filters),
+            on_result=lambda count: self.show_browse_count(worker, count),
+        )
+        self.browse_count_worker = worker
+    
+    def show_browse_count(self, worker, count):
+        """Show the result of the latest count"""
+        if worker is self.browse_count_worker:
+            self.browse_count_label.setText(f"{count} excerpt(s)")
+    
+    def open_browse_row(self, index):
+        """Load the clicked excerpt into the Work Area"""
+        excerpt_id = self.browse_model.excerpt_id(index.row())
+        if excerpt_id is None:
+            return
+        excerpt = self.db.get_excerpt_by_id(excerpt_id)
+        if not excerpt:
+            QMessageBox.warning(self, "Warning", "The selected excerpt no longer exists.")
+            return
+        self.display_excerpt(excerpt)
+        self.ui.Tabs.setCurrentWidget(self.ui.WorkArea)
+    
+    def setup_history_tab(self):
+        """Set up the tab that browses past analyses one page at a time"""
+        from PySide6.QtWidgets import QWidget, QCheckBox, QTableWidget, QAbstractItemView
+        self.history_tab = QWidget()
+        self.ui.Tabs.addTab(self.history_tab, "History")
+        
+        self.history_excerpt_checkbox = QCheckBox("Current excerpt only", self.history_tab)
+        self.history_excerpt_checkbox.setGeometry(10, 10, 200, 32)
+        self.history_excerpt_checkbox.toggled.connect(lambda checked: self.load_history_page())
+        
+        self.history_refresh_button = QPushButton("Refresh", self.history_tab)
+        self.history_refresh_button.setGeometry(220, 10, 100, 32)
+        self.history_refresh_button.clicked.connect(lambda: self.load_history_page())
+        
+        self.history_newer_button = QPushButton("Newer", self.history_tab)
+        self.history_newer_button.setGeometry(390, 10, 100, 32)
+        self.history_newer_button.clicked.connect(self.load_newer_history)
+        
+        self.history_older_button = QPushButton("Older", self.history_tab)
+        self.history_older_button.setGeometry(500, 10, 100, 32)
+        self.history_older_button.clicked.connect(self.load_older_history)
+        
+        self.history_table = QTableWidget(0, 6, self.history_tab)
+        self.history_table.setGeometry(10, 50, 591, 590)
+        self.history_table.setHorizontalHeaderLabels(["Time", "Excerpt", "Model", "Prompt", "Latency", "Tokens"])
+        self.history_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.history_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.history_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.history_table.verticalHeader().hide()
+        self.history_table.currentCellChanged.connect(lambda row, *_: self.show_history_entry(row))
+        
+        self.history_viewer = QTextBrowser(self.history_tab)
+        self.history_viewer.setGeometry(620, 50, 371, 590)
+        
+        # Only the displayed page is held in memory
+        self.history_page = []
+        self.ui.Tabs.currentChanged.connect(
+            lambda index: self.load_history_page() if self.ui.Tabs.widget(index) is self.history_tab else None)
+    
+    def history_filter(self):
+        """Return the excerpt id the history is restricted to, or None"""
+        if self.history_excerpt_checkbox.isChecked():
+            return self.current_excerpt_id
+        return None
+    
+    def load_history_page(self, before=None, after=None):
+        """Show the page of analyses before or after a (created_at, id) key, or the newest page"""
+        excerpt_id = self.history_filter()
+        if self.history_excerpt_checkbox.isChecked() and excerpt_id is None:
+            page = []
+        else:
+            page = self.db.get_analysis_page(excerpt_id, before=before, after=after, limit=self.HISTORY_PAGE_SIZE)
+            if after is not None and len(page) < self.HISTORY_PAGE_SIZE:
+                # Reached the newest rows; show a full newest page instead
+                page = self.db.get_analysis_page(excerpt_id, limit=self.HISTORY_PAGE_SIZE)
+        
+        self.history_page = page
+        self.history_table.setRowCount(len(page))
+        from PySide6.QtWidgets import QTableWidgetItem
+        for row, result in enumerate(page):
+            tokens = result.total_tokens
+            values = [
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(result.created_at)),
+                str(result.excerpt_id),
+                result.model or "",
+                result.prompt_name or "",
+                "cached" if result.cached else (f"{result.latency:.1f}s" if result.latency is not None else ""),
+                str(tokens) if tokens is not None else "",
+            ]
+            for column, value in enumerate(values):
+                self.history_table.setItem(row, column, QTableWidgetItem(value))
+        self.history_table.resizeColumnsToContents()
+        self.history_viewer.clear()
+        
+        # Probe one row past each end of the page to enable the paging buttons
+        has_newer = has_older = False
+        if page:
+            first, last = page[0], page[-1]
+            has_newer = bool(self.db.get_analysis_page(excerpt_id, after=(first.created_at, first.id), limit=1))
+            has_older = bool(self.db.get_analysis_page(excerpt_id, before=(last.created_at, last.id), limit=1))
+        self.history_newer_button.setEnabled(has_newer)
+        self.history_older_button.setEnabled(has_older)
+    
+    def load_newer_history(self):
+        """Show the next page of newer analyses"""
+        if self.history_page:
+            first = self.history_page[0]
+            self.load_history_page(after=(first.created_at, first.id))
+    
+    def load_older_history(self):
+        """Show the next page of older analyses"""
+        if self.history_page:
+            last = self.history_page[-1]
+            self.load_history_page(before=(last.created_at, last.id))
+    
+    def show_history_entry(self, row):
+        """Show the rewrite and response of the selected analysis"""
+        if row < 0 or row >= len(self.history_page):
+            self.history_viewer.clear()
+            return
+        result = self.db.get_analysis(self.history_page[row].id)
+        if not result:
+            self.history_viewer.clear()
+            return
+        text = f"**Rewrite**\n\n{result.rewrite or ''}\n\n**Analysis**\n\n{result.response}"
+        try:
+            from markdown import markdown
+            self.history_viewer.setHtml(markdown(text))
+        except ImportError:
+            self.history_viewer.setPlainText(text)
+    
+    def setup_cancel_button(self):
+        """Set up the button that cancels in-flight OpenAI requests"""
+        self.cancel_button = QPushButton("Cancel", self.ui.WorkArea)
+        self.cancel_button.setGeometry(120, 410, 100, 32)
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_requests)
+        self.cancel_button.show()
     
     def load_random_excerpt(self):
         """Load a random excerpt from the database"""
-        excerpt = self.db.get_random_excerpt()
+        excerpt = self.navigator.get_random(no_repeat=self.no_repeat_checkbox.isChecked())
         if not excerpt:
             QMessageBox.warning(self, "Warning", "No excerpts found in the database. Please import a CSV file first.")
             return
         
-        # excerpt format: (id, excerpt, analysis, rewrite)
-        self.current_excerpt_id = excerpt[0]
-        self.ui.Excerpts.setText(excerpt[1])
-        self.ui.analysis.setText(excerpt[2] if excerpt[2] else "")
-        self.ui.Rewrites.setText(excerpt[3] if excerpt[3] else "")
-        self.ui.airesponse.clear()
+        self.display_excerpt(excerpt)
     
     def load_previous_excerpt(self):
         """Load the previous excerpt from the database"""
         if not self.current_excerpt_id:
             # If no current excerpt, load the first one
-            excerpt = self.db.get_first_excerpt()
+            excerpt = self.navigator.get_first()
             if not excerpt:
                 QMessageBox.warning(self, "Warning", "No excerpts found in the database. Please import a CSV file first.")
                 return
         else:
-            excerpt = self.db.get_previous_excerpt(self.current_excerpt_id)
+            excerpt = self.navigator.get_previous(self.current_excerpt_id)
             if not excerpt:
                 QMessageBox.warning(self, "Warning", "No previous excerpt found.")
                 return
         
-        # excerpt format: (id, excerpt, analysis, rewrite)
-        self.current_excerpt_id = excerpt[0]
-        self.ui.Excerpts.setText(excerpt[1])
-        self.ui.analysis.setText(excerpt[2] if excerpt[2] else "")
-        self.ui.Rewrites.setText(excerpt[3] if excerpt[3] else "")
-        self.ui.airesponse.clear()
+        self.display_excerpt(excerpt)
     
     def load_next_excerpt(self):
         """Load the next excerpt from the database"""
         if not self.current_excerpt_id:
             # If no current excerpt, load the first one
-            excerpt = self.db.get_first_excerpt()
+            excerpt = self.navigator.get_first()
             if not excerpt:
                 QMessageBox.warning(self, "Warning", "No excerpts found in the database. Please import a CSV file first.")
                 return
         else:
-            excerpt = self.db.get_next_excerpt(self.current_excerpt_id)
+            excerpt = self.navigator.get_next(self.current_excerpt_id)
             if not excerpt:
                 QMessageBox.warning(self, "Warning", "No next excerpt found.")
                 return
         
+        self.display_excerpt(excerpt)
+    
+    def display_excerpt(self, excerpt):
+        """Show an excerpt row and make it the current excerpt"""
         # excerpt format: (id, excerpt, analysis, rewrite)
-        self.current_excerpt_id = excerpt[0]
+        self.set_current_excerpt(excerpt[0])
         self.ui.Excerpts.setText(excerpt[1])
         self.ui.analysis.setText(excerpt[2] if excerpt[2] else "")
         self.ui.Rewrites.setText(excerpt[3] if excerpt[3] else "")
         self.ui.airesponse.clear()
     
+    def set_current_excerpt(self, excerpt_id):
+        """Change the current excerpt, cancelling requests made for any other one"""
+        if excerpt_id != self.current_excerpt_id:
+            # A response to the previous excerpt must not land under this one
+            self.finish_stream(self.stream_worker)
+            self.request_broker.supersede(excerpt_id)
+        self.current_excerpt_id = excerpt_id
+    
     def setup_markdown_viewer(self):
         """Set up the QTextBrowser for markdown rendering"""
         # Create a QTextBrowser to replace the QTextEdit for AI response
@@ -492,6 +1246,16 @@ class MainWindow(QMainWindow):
         # Replace the reference in the UI
         self.ui.airesponse = self.markdown_viewer
         self.markdown_viewer.show()
+        
+        # Streamed responses are buffered and re-rendered on a throttled timer
+        # rather than on every token
+        self.stream_chunks = []
+        self.stream_buffers = {}
+        self.stream_dirty = False
+        self.stream_worker = None
+        self.render_timer = QTimer(self)
+        self.render_timer.setInterval(self.STREAM_RENDER_INTERVAL_MS)
+        self.render_timer.timeout.connect(self.render_stream_buffer)
     
     def send_to_openai(self):
         """Send the excerpt and rewrite to OpenAI for analysis"""
@@ -507,42 +1271,164 @@ class MainWindow(QMainWindow):
             return
         
         # Get selected prompt template
-        prompt_name = self.ui.comboBox_prompt.currentText()
-        prompt_template = ""
-        
-        # Check if it's a default template
-        default_templates = self.openai_api.get_default_prompt_templates()
-        if prompt_name in default_templates:
-            prompt_template = default_templates[prompt_name]
-        else:
-            # Get from database
-            saved_prompts = self.db.get_all_prompts()
-            for prompt in saved_prompts:
-                if prompt[1] == prompt_name:  # prompt[1] is the name
-                    prompt_template = prompt[2]  # prompt[2] is the content
-                    break
-        
-        if not prompt_template:
-            prompt_template = default_templates["Basic Analysis"]  # Fallback to basic analysis
-        
-        # Send to OpenAI
+        prompt_template = self.get_prompt_template(self.ui.comboBox_prompt.currentText())
+        
+        # Swallow the second click of a double-click
+        self.ui.sendopenai.setEnabled(False)
+        QTimer.singleShot(self.SEND_DEBOUNCE_MS, lambda: self.ui.sendopenai.setEnabled(True))
+        
+        # Stream the response from a worker thread; deltas and the final
+        # result are handled on the GUI thread. A request identical to one
+        # still in flight is not sent again but joins the running one.
+        excerpt_id = self.current_excerpt_id
+        key = RequestBroker.analysis_key(self.openai_api, excerpt_id, excerpt, rewrite, prompt_template)
+        worker, created = self.request_broker.submit(
+            key, excerpt_id, self.run_analysis, excerpt_id, excerpt, rewrite, prompt_template,
+            on_result=lambda result: self.handle_analysis_result(worker, result),
+            on_error=lambda message: self.handle_analysis_error(worker, message),
+            on_progress=lambda delta: self.handle_stream_delta(worker, delta),
+        )
+        if worker is self.stream_worker:
+            self.statusBar().showMessage("This analysis is already in progress.", 3000)
+            return
+        self.stream_worker = worker
+        self.stream_chunks = self.stream_buffers.setdefault(worker, [])
+        self.stream_dirty = bool(self.stream_chunks)
         self.ui.airesponse.setHtml("<p>Analyzing...</p>")
-        success, response = self.openai_api.analyze_rewrite(excerpt, rewrite, prompt_template)
+        if created:
+            self.analysis_workers.add(worker)
+            self.update_request_status()
+            worker.signals.cancelled.connect(lambda: self.handle_analysis_cancelled(worker))
+            worker.signals.finished.connect(lambda: self.forget_analysis_worker(worker))
+        self.render_timer.setInterval(self.STREAM_RENDER_INTERVAL_MS)
+        self.render_timer.start()
+    
+    def get_prompt_template(self, prompt_name):
+        """Get a prompt template by name, falling back to Basic Analysis"""
+        return self.prompts.get_or_default(prompt_name)
+    
+    def run_analysis(self, excerpt_id, excerpt, rewrite, prompt_template, worker):
+        """Stream the analysis from the OpenAI API and return an AnalysisResult; runs on a worker thread"""
+        result = AnalysisResult(excerpt_id=excerpt_id, prompt_name=prompt_template.name, rewrite=rewrite)
+        stream = self.openai_api.analyze_rewrite_stream(excerpt, rewrite, prompt_template, result=result,
+                                                        should_cancel=worker.is_cancelled)
+        try:
+            for delta in stream:
+                if worker.is_cancelled():
+                    break
+                worker.report_progress(delta)
+        finally:
+            stream.close()
+        return result
+    
+    def handle_stream_delta(self, worker, delta):
+        """Buffer a streamed delta for the next throttled render"""
+        # Every request keeps its text, so a resend that joins it can show it all
+        self.stream_buffers.setdefault(worker, []).append(delta)
+        if worker is self.stream_worker:
+            self.stream_dirty = True
+    
+    def render_stream_buffer(self):
+        """Re-render the buffered streaming response if it has changed"""
+        if not self.stream_dirty:
+            return
+        self.stream_dirty = False
+        started = time.perf_counter()
+        self.render_markdown("".join(self.stream_chunks))
         
-        if success:
-            # Convert markdown to HTML for display
-            try:
-                from markdown import markdown
-                html_content = markdown(response)
-                self.ui.airesponse.setHtml(html_content)
-            except ImportError:
-                # Fallback if markdown module is not available
-                self.ui.airesponse.setHtml(f"<pre>{response}</pre>")
-            
-            # Save the rewrite to the database
-            self.db.update_rewrite(self.current_excerpt_id, rewrite)
+        # Back off when rendering gets expensive so long responses stay cheap
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.render_timer.setInterval(max(self.STREAM_RENDER_INTERVAL_MS, int(elapsed_ms * 4)))
+    
+    def render_markdown(self, text):
+        """Convert markdown to HTML and display it in the AI response viewer"""
+        try:
+            from markdown import markdown
+            with instruments.timer("ui.markdown"):
+                html_content = markdown(text)
+        except ImportError:
+            # Fallback if markdown module is not available
+            html_content = f"<pre>{text}</pre>"
+        with instruments.timer("ui.set_html"):
+            self.ui.airesponse.setHtml(html_content)
+        
+        # Keep the newest text in view while streaming
+        scroll_bar = self.ui.airesponse.verticalScrollBar()
+        if self.render_timer.isActive():
+            scroll_bar.setValue(scroll_bar.maximum())
+    
+    def finish_stream(self, worker):
+        """Stop the render timer once the displayed stream has ended"""
+        if worker is None or worker is not self.stream_worker:
+            return False
+        self.render_timer.stop()
+        self.stream_worker = None
+        self.stream_chunks = []
+        self.stream_dirty = False
+        return True
+    
+    def handle_analysis_result(self, worker, result):
+        """Display the final analysis and save it with the rewrite; runs on the GUI thread"""
+        # A late response for an excerpt that is no longer shown is saved but not displayed
+        if self.finish_stream(worker) and result.excerpt_id == self.current_excerpt_id:
+            self.render_markdown(result.response or "")
+        
+        # Save the rewrite and keep the analysis in the history
+        self.db.update_rewrite(result.excerpt_id, result.rewrite)
+        if result.response:
+            self.db.save_analysis(result)
+        self.update_cache_stats()
+    
+    def handle_analysis_error(self, worker, message):
+        """Display an analysis error; runs on the GUI thread"""
+        if self.finish_stream(worker):
+            self.ui.airesponse.setHtml(f"<p style='color:red'>Error: {message}</p>")
         else:
-            self.ui.airesponse.setHtml(f"<p style='color:red'>Error: {response}</p>")
+            self.statusBar().showMessage(f"Error: {message}", 5000)
+    
+    def handle_analysis_cancelled(self, worker):
+        """Show that the displayed request was cancelled"""
+        if self.finish_stream(worker):
+            self.ui.airesponse.setHtml("<p>Request cancelled.</p>")
+    
+    def cancel_requests(self):
+        """Cancel all in-flight OpenAI requests"""
+        for worker in list(self.analysis_workers):
+            self.executor.cancel(worker)
+    
+    def forget_analysis_worker(self, worker):
+        """Drop a finished analysis worker"""
+        self.analysis_workers.discard(worker)
+        self.stream_buffers.pop(worker, None)
+        
+        # Normally already done by the result, error or cancelled handler
+        self.finish_stream(worker)
+        self.update_request_status()
+    
+    def update_request_status(self):
+        """Reflect the number of in-flight analysis requests in the status bar"""
+        count = len(self.analysis_workers)
+        self.cancel_button.setEnabled(count > 0)
+        if count:
+            self.statusBar().showMessage(f"{count} request(s) in progress...")
+        else:
+            self.statusBar().clearMessage()
+    
+    def closeEvent(self, event):
+        """Cancel pending requests and wait briefly for running ones before closing"""
+        self.executor.cancel_all()
+        
+        # Running requests stop at their next cancellation check; one still blocked
+        # on the network is not waited for beyond CLOSE_TIMEOUT_MS
+        if not self.executor.wait_for_done(self.CLOSE_TIMEOUT_MS):
+            print("Closing with background work still running")
+        self.navigator.close()
+        if self.browse_model is not None:
+            self.browse_model.close()
+        shared_pool.close()
+        if instruments.enabled:
+            instruments.write_log()
+        super().closeEvent(event)
 
 
     def clear_prompts(self):
@@ -565,9 +1451,7 @@ class MainWindow(QMainWindow):
                 self.ui.comboBox_prompt.clear()
                 
                 # Add default templates back
-                default_templates = self.openai_api.get_default_prompt_templates()
-                for name in default_templates.keys():
-                    self.ui.comboBox_prompt.addItem(name)
+                self.ui.comboBox_prompt.addItems(self.prompts.names())
                 
                 QMessageBox.information(self, "Success", "Custom prompt templates cleared successfully.")
             else:
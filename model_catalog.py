@@ -0,0 +1,92 @@
+# This Python file uses the following encoding: utf-8
+import time
+import threading
+
+# Shown when no catalogue has been fetched yet
+DEFAULT_MODELS = ["gpt-3.5-turbo", "gpt-4", "gpt-4-turbo", "gpt-4o"]
+
+# Keep chat models and hide the variants that can't be used for analysis
+DEFAULT_MODEL_FILTER = "gpt, -instruct, -preview, -audio, -realtime, -search, -transcribe, -tts"
+
+
+def parse_model_filter(rules):
+    """Split comma-separated filter rules into (include, exclude) keyword tuples
+
+    A keyword prefixed with '-' hides models containing it; any other
+    keyword is required, and a model is shown if it contains at least one
+    of them (or if there are none).
+    """
+    include = []
+    exclude = []
+    for keyword in (rules or "").split(","):
+        keyword = keyword.strip().lower()
+        if keyword.startswith("-"):
+            if keyword[1:].strip():
+                exclude.append(keyword[1:].strip())
+        elif keyword:
+            include.append(keyword)
+    return tuple(include), tuple(exclude)
+
+
+def filter_models(models, rules):
+    """Return the models that pass the filter rules"""
+    include, exclude = parse_model_filter(rules)
+    return [model for model in models
+            if (not include or any(keyword in model.lower() for keyword in include))
+            and not any(keyword in model.lower() for keyword in exclude)]
+
+
+class ModelCatalog:
+    """Persistent, time-limited cache of the models offered by the API
+
+    The full catalogue is stored unfiltered with the time it was fetched,
+    so startup reads it from the database and filter rules can change
+    without another request. refresh() makes the blocking API call and is
+    meant to run on a worker thread when the catalogue is stale.
+    """
+
+    # Catalogue age after which it is refreshed in the background
+    TTL = 24 * 60 * 60  # seconds
+
+    def __init__(self, db, openai_api, rules=DEFAULT_MODEL_FILTER, ttl=TTL):
+        """Load the cached catalogue from the database"""
+        self.db = db
+        self.openai_api = openai_api
+        self.rules = rules
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.all_models = db.get_models()
+        self.fetched_at = db.get_models_fetched_at()
+
+    def models(self):
+        """Return the cached catalogue after applying the filter rules"""
+        with self.lock:
+            models = self.all_models
+        return filter_models(models, self.rules) or list(DEFAULT_MODELS)
+
+    def is_stale(self, now=None):
+        """Return True if the catalogue was never fetched or is older than the TTL"""
+        if self.fetched_at is None:
+            return True
+        return (now if now is not None else time.time()) - self.fetched_at > self.ttl
+
+    def refresh(self):
+        """Fetch the catalogue, persist the changes and return (success, message)"""
+        success, models = self.openai_api.fetch_available_models()
+        if not success:
+            return False, models[0]
+
+        fetched_at = time.time()
+        with self.lock:
+            previous = set(self.all_models)
+        if not self.db.save_models(models, fetched_at):
+            return False, "Error saving the model list."
+
+        with self.lock:
+            self.all_models = sorted(set(models))
+            self.fetched_at = fetched_at
+        added = len(set(models) - previous)
+        removed = len(previous - set(models))
+        hidden = len(models) - len(filter_models(models, self.rules))
+        return True, (f"Models refreshed: {added} added, {removed} removed, "
+                      f"{hidden} hidden by the filter.")
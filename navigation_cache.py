@@ -0,0 +1,207 @@
+# This Python file uses the following encoding: utf-8
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class NavigationCache:
+    """Read-ahead cache in front of Database for Next/Previous/Random navigation
+
+    Every excerpt returned is followed by a background prefetch of a window
+    of neighbours on both sides plus a few pre-drawn random excerpts. Rows
+    live in a bounded LRU together with links to their previous and next
+    ids (including the wrap-around from last to first), so stepping through
+    the corpus is served from memory. Writes reported by the Database
+    invalidate the affected entries.
+    """
+
+    def __init__(self, db, window=10, capacity=256, random_pool=5):
+        """Initialize the cache and subscribe to database changes"""
+        self.db = db
+        self.window = window
+        self.capacity = max(capacity, 2 * window + random_pool + 1)
+        self.random_pool = random_pool
+        self.hits = 0
+        self.misses = 0
+
+        # id -> [row, previous id, next id]; links are None when unknown
+        self.entries = OrderedDict()
+        self.random_rows = deque()
+        self.first_id = None
+
+        # Bumped on invalidation so prefetches started earlier are discarded
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.pending = set()
+        self.db.add_change_listener(self.handle_change)
+
+    def close(self):
+        """Stop prefetching and unsubscribe from database changes"""
+        self.db.remove_change_listener(self.handle_change)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def get_first(self):
+        """Get the first excerpt"""
+        with self.lock:
+            row = self._lookup(self.first_id)
+            generation = self.generation
+            self._count_lookup(row)
+        if row is None:
+            row = self.db.get_first_excerpt()
+            if row:
+                with self.lock:
+                    # A write during the fetch may have made the row stale; return it uncached
+                    if generation == self.generation:
+                        self.first_id = row[0]
+                        self._store(row)
+        self.prefetch_around(row)
+        return row
+
+    def get_next(self, current_id):
+        """Get the excerpt after current_id, wrapping around to the first"""
+        return self._step(current_id, 2, self.db.get_next_excerpt)
+
+    def get_previous(self, current_id):
+        """Get the excerpt before current_id, wrapping around to the last"""
+        return self._step(current_id, 1, self.db.get_previous_excerpt)
+
+    def get_random(self, no_repeat=False):
+        """Get a random excerpt, served from the pre-drawn pool when possible
+
+        The no-repeat deck is persisted, so its draws are never made ahead of
+        time; they go straight to the database.
+        """
+        with self.lock:
+            generation = self.generation
+        if no_repeat:
+            row = self.db.get_random_excerpt(no_repeat=True)
+        else:
+            with self.lock:
+                row = self.random_rows.popleft() if self.random_rows else None
+                self._count_lookup(row)
+            if row is None:
+                row = self.db.get_random_excerpt()
+        if row:
+            with self.lock:
+                if generation == self.generation:
+                    self._store(row)
+        self.prefetch_around(row)
+        return row
+
+    def handle_change(self, event, excerpt_id=None):
+        """Invalidate cached rows after a database write"""
+        if event not in ("update", "import", "clear"):
+            return
+        with self.lock:
+            self.generation += 1
+            if event == "update" and excerpt_id is not None:
+                # Ids and ordering are unchanged, so only the row itself is stale
+                entry = self.entries.get(excerpt_id)
+                if entry:
+                    entry[0] = None
+                self.random_rows = deque(row for row in self.random_rows if row[0] != excerpt_id)
+            else:
+                self.entries.clear()
+                self.random_rows.clear()
+                self.first_id = None
+
+    def prefetch_around(self, row):
+        """Schedule a background fetch of the neighbours of row and of random rows"""
+        if not row:
+            return
+        with self.lock:
+            excerpt_id = row[0]
+            if excerpt_id in self.pending:
+                return
+            self.pending.add(excerpt_id)
+            generation = self.generation
+        try:
+            self.executor.submit(self._prefetch, excerpt_id, generation)
+        except RuntimeError:
+            pass  # Executor already shut down
+
+    def _step(self, current_id, link, fetch):
+        """Follow the previous (link=1) or next (link=2) link from current_id"""
+        with self.lock:
+            entry = self.entries.get(current_id)
+            row = self._lookup(entry[link]) if entry else None
+            generation = self.generation
+            self._count_lookup(row)
+        if row is None:
+            row = fetch(current_id)
+            if row:
+                with self.lock:
+                    if generation == self.generation:
+                        self._store(row)
+                        self._link(*((row[0], current_id) if link == 1 else (current_id, row[0])))
+        self.prefetch_around(row)
+        return row
+
+    def _prefetch(self, excerpt_id, generation):
+        """Fetch neighbours and random rows; runs on the prefetch thread"""
+        try:
+            after = self.db.get_excerpts_after(excerpt_id, self.window)
+            before = self.db.get_excerpts_before(excerpt_id, self.window)
+            first = self.db.get_first_excerpt() if len(after) < self.window else None
+            last = self.db.get_last_excerpt() if len(before) < self.window else None
+            with self.lock:
+                missing_random = self.random_pool - len(self.random_rows)
+            randoms = [self.db.get_random_excerpt() for _ in range(max(0, missing_random))]
+
+            with self.lock:
+                if generation != self.generation:
+                    return
+                chain = [row[0] for row in reversed(before)] + [excerpt_id] + [row[0] for row in after]
+                for row in before + after:
+                    self._store(row)
+                for earlier, later in zip(chain, chain[1:]):
+                    self._link(earlier, later)
+                if first:
+                    self.first_id = first[0]
+                    self._store(first)
+                    self._link(chain[-1], first[0])
+                if last:
+                    self._store(last)
+                    self._link(last[0], chain[0])
+                self.random_rows.extend(row for row in randoms if row)
+        except Exception as e:
+            print(f"Error prefetching excerpts: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(excerpt_id)
+
+    def _count_lookup(self, row):
+        """Count a cache hit, or a miss if row is None; call with the lock held"""
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def _lookup(self, excerpt_id):
+        """Return the cached row for excerpt_id and mark it recently used"""
+        if excerpt_id is None:
+            return None
+        entry = self.entries.get(excerpt_id)
+        if entry is None or entry[0] is None:
+            return None
+        self.entries.move_to_end(excerpt_id)
+        return entry[0]
+
+    def _store(self, row):
+        """Cache a row, keeping any known links, and evict the least recently used"""
+        entry = self.entries.get(row[0])
+        if entry:
+            entry[0] = row
+            self.entries.move_to_end(row[0])
+        else:
+            self.entries[row[0]] = [row, None, None]
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def _link(self, earlier_id, later_id):
+        """Record that later_id follows earlier_id"""
+        if earlier_id in self.entries:
+            self.entries[earlier_id][2] = later_id
+        if later_id in self.entries:
+            self.entries[later_id][1] = earlier_id
@@ -1,17 +1,43 @@
 # This Python file uses the following encoding: utf-8
-import os
-import json
-from openai import OpenAI
-from typing import Dict, Any, Optional, Tuple, List
+import time
+import itertools
+import threading
+from typing import Dict, Optional, Tuple, List, Iterator, Union
+from prompt_registry import PromptTemplate, render_prompt
+from analysis_result import AnalysisResult
+from instrumentation import instruments
+from http_pool import shared_pool
+from resilience import APIError, RetryPolicy, CircuitBreaker, call_with_retries, classify_error
 
+@instruments.instrument_class("openai", include=('analyze_rewrite', 'analyze_rewrite_stream', 'fetch_available_models'))
 class OpenAIAPI:
-    def __init__(self, api_key=None, model=None):
-        """Initialize the OpenAI API handler"""
+    # Seconds allowed for connecting and for each wait on the response, including between streamed chunks
+    REQUEST_TIMEOUT = 60.0
+    
+    def __init__(self, api_key=None, model=None, cache=None, timeout=REQUEST_TIMEOUT, retry_policy=None,
+                 breaker=None, http_pool=None):
+        """Initialize the OpenAI API handler
+
+        cache is an optional response cache (normally the Database) exposing
+        make_cache_key, get_cached_response and save_cached_response.
+        Failed requests are retried according to retry_policy, and breaker
+        fails them fast while the API keeps erroring; both are shared by
+        all requests made through this handler. Connections come from
+        http_pool, by default the process-wide shared pool, so they survive
+        API key changes.
+        """
         self.api_key = api_key
-        self.client = None
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.http_pool = http_pool or shared_pool
+        
+        # Created on first use; importing openai takes most of a second
+        self._client = None
+        self.client_lock = threading.Lock()
         self.model = model if model else "gpt-4"
+        self.temperature = 0.7
+        self.cache = cache
         
     def set_model(self, model):
         """Set the OpenAI model to use"""
@@ -19,33 +45,164 @@ class OpenAIAPI:
     
     def set_api_key(self, api_key):
         """Set the OpenAI API key"""
-        self.api_key = api_key
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
+        with self.client_lock:
+            self.api_key = api_key
+            
+            # Only the thin API wrapper is replaced; the pooled connections stay open
+            self._client = None
+    
+    @property
+    def client(self):
+        """The OpenAI client, imported and created on first use; None without an API key"""
+        with self.client_lock:
+            if self._client is None and self.api_key:
+                from openai import OpenAI
+                # Retries are handled by the retry policy, not the client
+                self._client = OpenAI(api_key=self.api_key, timeout=self.timeout, max_retries=0,
+                                      http_client=self.http_pool.get_sync_client())
+            return self._client
+    
+    def build_messages(self, excerpt: str, rewrite: str, prompt_template: Union[PromptTemplate, str]) -> List[Dict[str, str]]:
+        """Build the chat messages for an analysis request"""
+        # Substitute the placeholders; prompt_template is a PromptTemplate or a string
+        prompt = render_prompt(prompt_template, excerpt, rewrite)
+        return [
+            {"role": "system", "content": "You are an expert writing coach analyzing rewrites of text excerpts."},
+            {"role": "user", "content": prompt}
+        ]
     
-    def analyze_rewrite(self, excerpt: str, rewrite: str, prompt_template: str) -> Tuple[bool, str]:
-        """Send the excerpt and rewrite to OpenAI for analysis"""
-        if not self.api_key or not self.client:
-            return False, "API key not set. Please set your OpenAI API key in Settings."
+    def cache_lookup(self, messages, use_cache=True):
+        """Return (cache_key, cached_response) for a request; both None when caching is off"""
+        if not self.cache or not use_cache:
+            return None, None
+        cache_key = self.cache.make_cache_key(self.model, messages, self.temperature)
+        return cache_key, self.cache.get_cached_response(cache_key)
+    
+    def analyze_rewrite(self, excerpt: str, rewrite: str, prompt_template: Union[PromptTemplate, str], use_cache: bool = True,
+                        result: Optional[AnalysisResult] = None, should_cancel=None) -> Tuple[bool, str]:
+        """Send the excerpt and rewrite to OpenAI for analysis
+
+        result, if given, is filled in with the model, latency and token
+        usage of a successful request, or with the APIError of a failed one.
+        should_cancel is polled while waiting to retry.
+        """
+        started = time.monotonic()
+        messages = self.build_messages(excerpt, rewrite, prompt_template)
+        cache_key, cached = self.cache_lookup(messages, use_cache)
+        if cached is not None:
+            self.fill_result(result, started, cached, cached=True)
+            return True, cached
         
-        # Replace placeholders in the prompt template
-        prompt = prompt_template.replace("{excerpt}", excerpt).replace("{rewrite}", rewrite)
+        def request():
+            response = client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature
+            )
+            if not response.choices:
+                # A malformed answer; worth retrying like a server error
+                raise APIError("The response contained no choices.", kind='server')
+            return response
         
         try:
-            response = self.client.chat.completions.create(
+            client = self.require_client()
+            response = call_with_retries(request, self.retry_policy, self.breaker, should_cancel)
+            analysis = response.choices[0].message.content
+        except APIError as e:
+            if result is not None:
+                result.error = e
+            return False, str(e)
+        
+        if cache_key and analysis:
+            self.cache.save_cached_response(cache_key, self.model, analysis)
+        self.fill_result(result, started, analysis, usage=response.usage)
+        return True, analysis
+    
+    def analyze_rewrite_stream(self, excerpt: str, rewrite: str, prompt_template: Union[PromptTemplate, str], use_cache: bool = True,
+                               result: Optional[AnalysisResult] = None, should_cancel=None) -> Iterator[str]:
+        """Stream the analysis, yielding text deltas as they arrive
+
+        Raises APIError (a RuntimeError) if the API key is missing or the
+        request fails. Failures before the first delta are retried; once
+        text has been yielded an error ends the stream. Closing the
+        generator early closes the underlying HTTP stream. A cached
+        response is yielded as a single delta. result, if given, is filled
+        in once the stream completes.
+        """
+        started = time.monotonic()
+        messages = self.build_messages(excerpt, rewrite, prompt_template)
+        cache_key, cached = self.cache_lookup(messages, use_cache)
+        if cached is not None:
+            self.fill_result(result, started, cached, cached=True)
+            yield cached
+            return
+        
+        client = self.require_client()
+        
+        def open_stream():
+            # Read up to the first chunk, so errors up to then can be retried
+            stream = client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert writing coach analyzing rewrites of text excerpts."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7
+                messages=messages,
+                temperature=self.temperature,
+                stream=True,
+                # The final chunk then carries the token usage of the request
+                stream_options={"include_usage": True}
             )
-            
-            analysis = response.choices[0].message.content
-            return True, analysis
-                
+            try:
+                chunks = iter(stream)
+                first = next(chunks, None)
+            except BaseException:
+                stream.close()
+                raise
+            return stream, chunks, first
+        
+        stream, chunks, first = call_with_retries(open_stream, self.retry_policy, self.breaker, should_cancel)
+        
+        parts = []
+        usage = None
+        completed = False
+        try:
+            for chunk in itertools.chain((first,) if first is not None else (), chunks):
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            completed = True
         except Exception as e:
-            return False, f"Error communicating with OpenAI API: {str(e)}"
+            error = classify_error(e)
+            error.attempts = 1
+            self.breaker.record_failure(error)
+            raise error from e
+        finally:
+            stream.close()
+        
+        # Only complete responses are cached, never ones cut short by the caller
+        if completed and cache_key and parts:
+            self.cache.save_cached_response(cache_key, self.model, "".join(parts))
+        if completed:
+            self.fill_result(result, started, "".join(parts), usage=usage)
+    
+    def require_client(self):
+        """Return the client, or raise APIError if no API key is set"""
+        client = self.client
+        if client is None:
+            raise APIError("API key not set. Please set your OpenAI API key in Settings.", kind='auth')
+        return client
+    
+    def fill_result(self, result, started, response, usage=None, cached=False):
+        """Record the outcome of a request in result, if one was given"""
+        if result is None:
+            return
+        result.model = self.model
+        result.response = response
+        result.latency = time.monotonic() - started
+        result.cached = cached
+        result.set_usage(usage)
     
     def get_default_prompt_templates(self) -> Dict[str, str]:
         """Return a dictionary of default prompt templates"""
@@ -57,14 +214,13 @@ class OpenAIAPI:
     
     def fetch_available_models(self) -> Tuple[bool, List[str]]:
         """Fetch available models from OpenAI API"""
-        if not self.api_key or not self.client:
-            return False, ["API key not set. Please set your OpenAI API key in Settings."]
-        
         try:
-            models = self.client.models.list()
-            model_ids = [model.id for model in models]
-            # Filter for chat models only
-            chat_models = [model for model in model_ids if 'gpt' in model.lower()]
-            return True, chat_models
-        except Exception as e:
-            return False, [f"Error fetching models from OpenAI API: {str(e)}"]
\ No newline at end of file
+            client = self.require_client()
+            # Listing is paginated lazily, so the whole listing is retried as one call
+            models = call_with_retries(lambda: [model.id for model in client.models.list()],
+                                       self.retry_policy, self.breaker)
+        except APIError as e:
+            return False, [str(e)]
+        
+        # Filtering is left to the caller so the rules can change without a new request
+        return True, sorted(models)
\ No newline at end of file
@@ -0,0 +1,112 @@
+# This Python file uses the following encoding: utf-8
+import re
+import threading
+
+# Placeholders substituted into prompt templates
+PLACEHOLDERS = ('excerpt', 'rewrite')
+PLACEHOLDER_PATTERN = re.compile(r'\{(excerpt|rewrite)\}')
+OTHER_PLACEHOLDER_PATTERN = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)\}')
+
+
+class PromptTemplateError(ValueError):
+    """Raised when a prompt template fails validation"""
+
+
+class PromptTemplate:
+    """A prompt template split once into literal text and placeholder slots
+
+    Rendering joins the pre-split parts, so it costs one pass over the output
+    and never substitutes into text that came from the excerpt or rewrite.
+    """
+    __slots__ = ('name', 'content', 'parts', 'placeholders', 'unknown_placeholders')
+
+    def __init__(self, name, content):
+        """Parse the template content"""
+        self.name = name
+        self.content = content
+
+        # Even indices hold literal text, odd indices hold placeholder names
+        self.parts = PLACEHOLDER_PATTERN.split(content)
+        self.placeholders = frozenset(self.parts[1::2])
+
+        # Brace-wrapped words other than our placeholders are left as literal
+        # text but reported, since they are usually typos like {Excerpt}
+        self.unknown_placeholders = sorted(
+            set(OTHER_PLACEHOLDER_PATTERN.findall(content)) - set(PLACEHOLDERS))
+
+    def validate(self):
+        """Raise PromptTemplateError if the template uses neither placeholder"""
+        if not self.placeholders:
+            message = f"Prompt template '{self.name}' must contain {{excerpt}} or {{rewrite}}"
+            if self.unknown_placeholders:
+                unknown = ", ".join(f"{{{name}}}" for name in self.unknown_placeholders)
+                message += f" (found {unknown})"
+            raise PromptTemplateError(message)
+        return self
+
+    def render(self, excerpt, rewrite):
+        """Substitute the excerpt and rewrite into the template"""
+        values = {'excerpt': excerpt, 'rewrite': rewrite}
+        parts = self.parts[:]
+        for index in range(1, len(parts), 2):
+            parts[index] = values[parts[index]]
+        return "".join(parts)
+
+
+def render_prompt(prompt_template, excerpt, rewrite):
+    """Render a PromptTemplate or a raw template string"""
+    if isinstance(prompt_template, str):
+        prompt_template = PromptTemplate(None, prompt_template)
+    return prompt_template.render(excerpt, rewrite)
+
+
+class PromptRegistry:
+    """Name-indexed cache of the default and saved prompt templates
+
+    Templates are parsed once when the registry loads. Saved prompts are
+    read from the database in one query on first use and again only after
+    Database.save_prompt or clear_prompts reports a change.
+    """
+
+    def __init__(self, db, default_templates):
+        """Initialize the registry and subscribe to prompt changes"""
+        self.db = db
+        self.defaults = {name: PromptTemplate(name, content).validate()
+                         for name, content in default_templates.items()}
+        self.saved = None
+        self.lock = threading.Lock()
+        self.db.add_change_listener(self.handle_change)
+
+    def handle_change(self, event, excerpt_id=None):
+        """Drop the saved prompts after they change"""
+        if event == "prompts":
+            with self.lock:
+                self.saved = None
+
+    def load(self):
+        """Return the saved prompts by name, loading them if needed"""
+        with self.lock:
+            if self.saved is None:
+                # Invalid saved templates are kept; get() still renders them as-is
+                self.saved = {name: PromptTemplate(name, content)
+                              for _, name, content in self.db.get_all_prompts()}
+            return self.saved
+
+    def names(self):
+        """Return the default template names followed by the saved ones"""
+        return list(self.defaults) + [name for name in self.load() if name not in self.defaults]
+
+    def get(self, name):
+        """Return the template with the given name, or None"""
+        if name in self.defaults:
+            return self.defaults[name]
+        return self.load().get(name)
+
+    def get_or_default(self, name, fallback="Basic Analysis"):
+        """Return the named template, falling back to a default template"""
+        template = self.get(name)
+        return template if template is not None else self.defaults[fallback]
+
+    def parse(self, name, content):
+        """Parse and validate a template before it is saved"""
+        return PromptTemplate(name, content).validate()
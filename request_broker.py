@@ -0,0 +1,54 @@
+# This Python file uses the following encoding: utf-8
+
+
+class RequestBroker:
+    """Coalesces identical in-flight API requests and cancels stale ones
+
+    Requests are submitted through a RequestExecutor under a key describing
+    everything that determines the response, and a scope (the excerpt they
+    belong to). Submitting a key that is already in flight returns the
+    running worker instead of starting another request, and supersede()
+    cancels every request outside the scope that is now on screen. The
+    broker lives on the GUI thread, like the executor.
+    """
+
+    def __init__(self, executor):
+        """Initialize the broker"""
+        self.executor = executor
+        self.in_flight = {}
+        self.scopes = {}
+
+    @staticmethod
+    def analysis_key(openai_api, excerpt_id, excerpt, rewrite, prompt_template):
+        """Return the key of an analysis request; equal keys get the same response"""
+        return (excerpt_id, openai_api.model, openai_api.temperature, prompt_template.name,
+                prompt_template.content, excerpt, rewrite)
+
+    def submit(self, key, scope, fn, *args, **kwargs):
+        """Submit fn through the executor unless key is in flight; return (worker, created)
+
+        A coalesced caller gets the running worker, whose signals are
+        already connected to the first caller's handlers.
+        """
+        worker = self.in_flight.get(key)
+        if worker is not None and not worker.is_cancelled():
+            return worker, False
+        worker = self.executor.submit(fn, *args, **kwargs)
+        self.in_flight[key] = worker
+        self.scopes[worker] = (key, scope)
+        worker.signals.finished.connect(lambda: self.forget(worker))
+        return worker, True
+
+    def supersede(self, scope):
+        """Cancel every in-flight request outside scope and return how many were cancelled"""
+        stale = [worker for worker, (_, worker_scope) in self.scopes.items()
+                 if worker_scope != scope and not worker.is_cancelled()]
+        for worker in stale:
+            self.executor.cancel(worker)
+        return len(stale)
+
+    def forget(self, worker):
+        """Drop a finished worker"""
+        entry = self.scopes.pop(worker, None)
+        if entry and self.in_flight.get(entry[0]) is worker:
+            del self.in_flight[entry[0]]
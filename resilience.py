@@ -0,0 +1,249 @@
+# This Python file uses the following encoding: utf-8
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+# Error kinds worth retrying, and that count against the circuit breaker
+TRANSIENT_KINDS = ('rate_limit', 'server', 'timeout', 'connection')
+
+
+class APIError(RuntimeError):
+    """A failed API request, classified so callers can decide how to degrade
+
+    kind is one of auth, bad_request, not_found, rate_limit, server,
+    timeout, connection, circuit_open, cancelled or unknown. retry_after is
+    the delay in seconds the server (or the circuit breaker) asked for, if
+    any, and attempts is the number of requests made.
+    """
+
+    def __init__(self, message, kind="unknown", status=None, retry_after=None, attempts=0):
+        """Initialize the error"""
+        super().__init__(message)
+        self.message = message
+        self.kind = kind
+        self.status = status
+        self.retry_after = retry_after
+        self.attempts = attempts
+
+    @property
+    def retryable(self):
+        """True if the same request may succeed later"""
+        return self.kind in TRANSIENT_KINDS or self.kind == 'circuit_open'
+
+    def __str__(self):
+        """Describe the error for the user"""
+        if self.attempts == 0 or self.kind in ('circuit_open', 'cancelled'):
+            return self.message
+        detail = self.kind.replace('_', ' ')
+        if self.status is not None:
+            detail += f", HTTP {self.status}"
+        if self.attempts > 1:
+            detail += f", {self.attempts} attempts"
+        return f"Error communicating with OpenAI API ({detail}): {self.message}"
+
+    def to_dict(self):
+        """Return the error as a dict, e.g. for logs"""
+        return {'kind': self.kind, 'status': self.status, 'message': self.message,
+                'retry_after': self.retry_after, 'attempts': self.attempts}
+
+
+def parse_retry_after(headers):
+    """Return the delay in seconds asked for by retry-after-ms or Retry-After headers, or None"""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """Turn an exception raised by the OpenAI client into an APIError"""
+    if isinstance(error, APIError):
+        return error
+    status = getattr(error, 'status_code', None)
+    response = getattr(error, 'response', None)
+    retry_after = parse_retry_after(getattr(response, 'headers', None))
+    name = type(error).__name__
+    if name == "APITimeoutError" or isinstance(error, TimeoutError):
+        kind = 'timeout'
+    elif name == "APIConnectionError" or isinstance(error, ConnectionError):
+        kind = 'connection'
+    elif status == 429:
+        # Quota exhaustion is also a 429, but waiting won't fix it
+        code = getattr(error, 'code', None)
+        kind = 'auth' if code == 'insufficient_quota' else 'rate_limit'
+    elif status in (401, 403):
+        kind = 'auth'
+    elif status == 404:
+        kind = 'not_found'
+    elif status in (408, 409) or (status is not None and status >= 500):
+        kind = 'server' if status != 408 else 'timeout'
+    elif status is not None and 400 <= status < 500:
+        kind = 'bad_request'
+    else:
+        kind = 'unknown'
+    return APIError(str(error), kind=kind, status=status, retry_after=retry_after)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that honours Retry-After
+
+    The delay before retry n (counting from 0) is drawn uniformly from
+    [0, min(max_delay, base_delay * 2**n)], or is the server's Retry-After
+    if that is longer. A Retry-After beyond max_retry_after is not waited
+    for; the error is returned to the caller instead.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=20.0, max_retry_after=60.0, rng=None):
+        """Initialize the policy"""
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt, retry_after=None):
+        """Return the seconds to wait before retrying after attempt (0-based) failed"""
+        backoff = self.rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            return max(backoff, retry_after)
+        return backoff
+
+    def should_retry(self, error, attempt):
+        """Return True if the request that failed with error on attempt should be retried"""
+        if error.kind not in TRANSIENT_KINDS or attempt + 1 >= self.max_attempts:
+            return False
+        return error.retry_after is None or error.retry_after <= self.max_retry_after
+
+
+class CircuitBreaker:
+    """Fails requests fast after repeated transient errors
+
+    After failure_threshold consecutive failures the circuit opens and
+    requests are refused for reset_timeout seconds. Then one trial request
+    is let through (half-open): success closes the circuit, failure opens it
+    again. Thread-safe, so one breaker can be shared by concurrent requests.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        """Initialize a closed circuit"""
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self):
+        """Return 'closed', 'open' or 'half-open'"""
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return 'open'
+            return 'half-open'
+
+    def retry_in(self):
+        """Return the seconds until a request would be let through; 0 if one would be now"""
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.reset_timeout - (self.clock() - self.opened_at)
+            if remaining > 0:
+                return remaining
+            # Half-open: wait for the outcome of the trial request
+            return 1.0 if self.trial_in_flight else 0.0
+
+    def before_request(self):
+        """Raise APIError(kind='circuit_open') if the request should not be made; return True for a half-open trial"""
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.reset_timeout - (self.clock() - self.opened_at)
+            if remaining <= 0 and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+        retry_after = max(remaining, 1.0)
+        raise APIError(f"OpenAI API unavailable after repeated errors; try again in {retry_after:.0f}s.",
+                       kind='circuit_open', retry_after=retry_after)
+
+    def record_success(self):
+        """Close the circuit"""
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Let another trial through after one ended without an outcome"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self, error):
+        """Count a failed request; only transient errors can open the circuit"""
+        with self.lock:
+            if error.kind not in TRANSIENT_KINDS:
+                # The service answered, so as far as the circuit is concerned it is up
+                self.failures = 0
+                self.opened_at = None
+                self.trial_in_flight = False
+                return
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self.trial_in_flight = False
+
+
+def call_with_retries(fn, policy, breaker=None, should_cancel=None, sleep=time.sleep):
+    """Call fn() until it succeeds or the policy gives up, and return its result
+
+    Failures are raised as APIError, with attempts set. should_cancel is
+    polled while waiting between attempts.
+    """
+    attempt = 0
+    while True:
+        trial = breaker.before_request() if breaker is not None else False
+        interrupted = True
+        try:
+            result = fn()
+            interrupted = False
+        except Exception as e:
+            interrupted = False
+            cause = e
+            error = classify_error(e)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+        finally:
+            if interrupted and trial:
+                # e.g. KeyboardInterrupt: nothing to record, but the half-open circuit must not wait forever
+                breaker.release_trial()
+        error.attempts = attempt + 1
+        if breaker is not None:
+            breaker.record_failure(error)
+        if not policy.should_retry(error, attempt):
+            raise error from cause
+        deadline = time.monotonic() + policy.delay(attempt, error.retry_after)
+        while (remaining := deadline - time.monotonic()) > 0:
+            if should_cancel and should_cancel():
+                raise APIError("Request cancelled.", kind='cancelled', attempts=attempt + 1) from cause
+            sleep(min(remaining, 0.25))
+        attempt += 1
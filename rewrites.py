@@ -0,0 +1,312 @@
+# This Python file uses the following encoding: utf-8
+"""Command-line interface for scripts, cron jobs and headless servers
+
+    python -m rewrites import excerpts.csv --mode update
+    python -m rewrites export backup.ndjson.gz
+    python -m rewrites random --no-repeat
+    python -m rewrites analyze --id 42 --rewrite "My rewrite"
+    python -m rewrites batch --prompt "Detailed Critique" --workers 8
+    python -m rewrites jobs submit --prompt "Detailed Critique"
+    python -m rewrites jobs poll --wait
+
+Drives Database and OpenAIAPI directly and never imports PySide6. The
+OpenAI client is only loaded by the commands that call the API.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from database import Database
+
+
+def create_openai_api(db, model=None):
+    """Create an OpenAIAPI using OPENAI_API_KEY or the saved key; None if there is no key"""
+    from settings_store import SettingsStore
+    from openai_api import OpenAIAPI
+    settings = SettingsStore(db)
+    api_key = os.environ.get("OPENAI_API_KEY") or settings.api_key
+    if not api_key:
+        print("API key not set. Set OPENAI_API_KEY or save a key in the app's Settings.", file=sys.stderr)
+        return None
+    return OpenAIAPI(api_key=api_key, model=model or settings.model, cache=db)
+
+
+def get_prompt_template(db, openai_api, name):
+    """Look up a prompt template by name; None (with a message) if it doesn't exist"""
+    from prompt_registry import PromptRegistry
+    prompt_template = PromptRegistry(db, openai_api.get_default_prompt_templates()).get(name)
+    if prompt_template is None:
+        print(f"Unknown prompt template: {name}", file=sys.stderr)
+    return prompt_template
+
+
+def print_excerpt(excerpt, as_json=False):
+    """Print an (id, excerpt, analysis, rewrite) row"""
+    excerpt_id, text, analysis, rewrite = excerpt
+    if as_json:
+        print(json.dumps({'id': excerpt_id, 'excerpt': text, 'analysis': analysis, 'rewrite': rewrite},
+                         ensure_ascii=False))
+        return
+    print(f"#{excerpt_id}")
+    print(text)
+    if analysis:
+        print(f"\nAnalysis: {analysis}")
+    if rewrite:
+        print(f"\nRewrite: {rewrite}")
+
+
+def command_import(db, args):
+    """Import excerpts from a CSV file"""
+    success, message = db.import_csv(args.csv_path, mode=args.mode)
+    print(message, file=sys.stdout if success else sys.stderr)
+    return 0 if success else 1
+
+
+def command_export(db, args):
+    """Export excerpts to CSV, JSON or NDJSON"""
+    output_format = args.format
+    if output_format is None:
+        name = args.file_path.lower().removesuffix('.gz')
+        output_format = ("ndjson" if name.endswith(('.ndjson', '.jsonl'))
+                         else "json" if name.endswith('.json') else "csv")
+    compress = True if args.gzip else None
+    if output_format == "csv":
+        success, message = db.export_to_csv(args.file_path, compress=compress)
+    else:
+        success, message = db.export_to_json(args.file_path, ndjson=output_format == "ndjson", compress=compress)
+    print(message, file=sys.stdout if success else sys.stderr)
+    return 0 if success else 1
+
+
+def command_random(db, args):
+    """Print a random excerpt"""
+    excerpt = db.get_random_excerpt(no_repeat=args.no_repeat)
+    if not excerpt:
+        print("No excerpts found in the database. Import a CSV file first.", file=sys.stderr)
+        return 1
+    print_excerpt(excerpt, args.json)
+    return 0
+
+
+def command_analyze(db, args):
+    """Analyze a rewrite of one excerpt and stream the feedback to stdout"""
+    excerpt = db.get_excerpt_by_id(args.id) if args.id is not None else db.get_random_excerpt()
+    if not excerpt:
+        print("Excerpt not found." if args.id is not None else "No excerpts found in the database.",
+              file=sys.stderr)
+        return 1
+
+    if args.rewrite is not None:
+        rewrite = args.rewrite
+    elif args.rewrite_file == "-":
+        rewrite = sys.stdin.read()
+    elif args.rewrite_file:
+        with open(args.rewrite_file, encoding="utf-8") as file:
+            rewrite = file.read()
+    else:
+        rewrite = excerpt[3] or ""
+    rewrite = rewrite.strip()
+    if not rewrite:
+        print("No rewrite given and the excerpt has no saved rewrite.", file=sys.stderr)
+        return 2
+
+    openai_api = create_openai_api(db, args.model)
+    if openai_api is None:
+        return 2
+    prompt_template = get_prompt_template(db, openai_api, args.prompt)
+    if prompt_template is None:
+        return 2
+
+    from analysis_result import AnalysisResult
+    if args.id is None:
+        print(f"Excerpt #{excerpt[0]}", file=sys.stderr)
+    result = AnalysisResult(excerpt_id=excerpt[0], prompt_name=prompt_template.name, rewrite=rewrite)
+    try:
+        for delta in openai_api.analyze_rewrite_stream(excerpt[1], rewrite, prompt_template,
+                                                       use_cache=not args.no_cache, result=result):
+            sys.stdout.write(delta)
+            sys.stdout.flush()
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    print()
+
+    # Saved like an analysis made in the app
+    db.update_rewrite(excerpt[0], rewrite)
+    if result.response:
+        db.save_analysis(result)
+    return 0
+
+
+def command_batch(db, args):
+    """Analyze every excerpt that has a rewrite"""
+    openai_api = create_openai_api(db, args.model)
+    if openai_api is None:
+        return 2
+    prompt_template = get_prompt_template(db, openai_api, args.prompt)
+    if prompt_template is None:
+        return 2
+
+    from batch import BatchAnalyzer, format_progress
+    analyzer = BatchAnalyzer(db, openai_api, prompt_template, prompt_name=args.prompt,
+                             run_name=args.run_name, max_workers=args.workers)
+    try:
+        success, message = analyzer.run(
+            progress_callback=lambda progress: print(format_progress(progress), file=sys.stderr))
+    except KeyboardInterrupt:
+        # Results are flushed as they complete, so the run can be resumed
+        print("Interrupted; re-run to resume", file=sys.stderr)
+        return 130
+    print(message)
+    return 0 if success else 1
+
+
+def create_job_manager(db, args):
+    """Create a BatchJobManager; None if there is no API key"""
+    openai_api = create_openai_api(db, getattr(args, 'model', None))
+    if openai_api is None:
+        return None
+    from batch_jobs import BatchJobManager
+    return BatchJobManager(db, openai_api)
+
+
+def command_jobs_submit(db, args):
+    """Submit the pending excerpts of a run to the Batch API"""
+    manager = create_job_manager(db, args)
+    if manager is None:
+        return 2
+    prompt_template = get_prompt_template(db, manager.openai_api, args.prompt)
+    if prompt_template is None:
+        return 2
+    success, message = manager.submit(prompt_template, prompt_name=args.prompt, run_name=args.run_name,
+                                      limit=args.limit)
+    print(message, file=sys.stdout if success else sys.stderr)
+    return 0 if success else 1
+
+
+def command_jobs_poll(db, args):
+    """Refresh unfinished Batch API jobs and import the finished ones"""
+    manager = create_job_manager(db, args)
+    if manager is None:
+        return 2
+    try:
+        if args.wait:
+            success, message = manager.wait(interval=args.interval, timeout=args.timeout,
+                                            progress_callback=lambda message: print(message, file=sys.stderr))
+        else:
+            success, message = manager.poll()
+    except KeyboardInterrupt:
+        print("Stopped waiting; the jobs keep running, poll again later", file=sys.stderr)
+        return 130
+    print(message, file=sys.stdout if success else sys.stderr)
+    return 0 if success else 1
+
+
+def command_jobs_list(db, args):
+    """List Batch API jobs"""
+    jobs = db.get_batch_jobs(active_only=args.active)
+    for job in jobs:
+        state = "imported" if job['imported_at'] else "unfinished"
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(job['created_at']))
+        print(f"{job['id']:>4}  {created}  {job['status']:<11} {state:<10} "
+              f"{job['completed_count']}/{job['request_count']} done, {job['failed_count']} failed  "
+              f"{job['run_name']}  {job['batch_id']}")
+        if job['error']:
+            print(f"      {job['error']}")
+    if not jobs:
+        print("No batch jobs", file=sys.stderr)
+    return 0
+
+
+def command_jobs_cancel(db, args):
+    """Cancel a Batch API job"""
+    manager = create_job_manager(db, args)
+    if manager is None:
+        return 2
+    success, message = manager.cancel(args.job_id)
+    print(message, file=sys.stdout if success else sys.stderr)
+    return 0 if success else 1
+
+
+def build_parser():
+    """Build the argument parser with one subcommand per command"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", default="rewrites.db", help="Path to the SQLite database")
+
+    parser = argparse.ArgumentParser(prog="python -m rewrites", description="Rewrites without the GUI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", parents=[common], help="Import excerpts from a CSV file")
+    import_parser.add_argument("csv_path", help="CSV file with Excerpt, Analysis and Rewrite columns")
+    import_parser.add_argument("--mode", choices=Database.IMPORT_MODES, default="skip",
+                               help="What to do with excerpts already in the database (default: skip)")
+    import_parser.set_defaults(handler=command_import)
+
+    export_parser = commands.add_parser("export", parents=[common], help="Export all excerpts")
+    export_parser.add_argument("file_path", help="Output file; the format follows the extension unless --format is given")
+    export_parser.add_argument("--format", choices=("csv", "json", "ndjson"), help="Output format")
+    export_parser.add_argument("--gzip", action="store_true", help="Compress the output (implied by a .gz extension)")
+    export_parser.set_defaults(handler=command_export)
+
+    random_parser = commands.add_parser("random", parents=[common], help="Print a random excerpt")
+    random_parser.add_argument("--no-repeat", action="store_true", help="Don't repeat excerpts until all were shown")
+    random_parser.add_argument("--json", action="store_true", help="Print the excerpt as a JSON object")
+    random_parser.set_defaults(handler=command_random)
+
+    analyze_parser = commands.add_parser("analyze", parents=[common], help="Get feedback on a rewrite")
+    analyze_parser.add_argument("--id", type=int, help="Excerpt id (default: a random excerpt)")
+    rewrite_source = analyze_parser.add_mutually_exclusive_group()
+    rewrite_source.add_argument("--rewrite", help="The rewrite (default: the saved rewrite)")
+    rewrite_source.add_argument("--rewrite-file", help="Read the rewrite from a file, or '-' for stdin")
+    analyze_parser.add_argument("--prompt", default="Basic Analysis", help="Name of the prompt template")
+    analyze_parser.add_argument("--model", help="Model to use (defaults to the saved model)")
+    analyze_parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache")
+    analyze_parser.set_defaults(handler=command_analyze)
+
+    batch_parser = commands.add_parser("batch", parents=[common], help="Analyze every excerpt that has a rewrite")
+    batch_parser.add_argument("--prompt", default="Basic Analysis", help="Name of the prompt template")
+    batch_parser.add_argument("--model", help="Model to use (defaults to the saved model)")
+    batch_parser.add_argument("--run-name", help="Name of the run to create or resume")
+    batch_parser.add_argument("--workers", type=int, default=4, help="Number of concurrent requests")
+    batch_parser.set_defaults(handler=command_batch)
+
+    jobs_parser = commands.add_parser("jobs", help="Analyze excerpts offline through the Batch API")
+    job_commands = jobs_parser.add_subparsers(dest="job_command", required=True)
+
+    submit_parser = job_commands.add_parser("submit", parents=[common], help="Submit the pending excerpts of a run")
+    submit_parser.add_argument("--prompt", default="Basic Analysis", help="Name of the prompt template")
+    submit_parser.add_argument("--model", help="Model to use (defaults to the saved model)")
+    submit_parser.add_argument("--run-name", help="Name of the run the results are saved under")
+    submit_parser.add_argument("--limit", type=int, help="Submit at most this many excerpts")
+    submit_parser.set_defaults(handler=command_jobs_submit)
+
+    poll_parser = job_commands.add_parser("poll", parents=[common], help="Check jobs and import finished results")
+    poll_parser.add_argument("--wait", action="store_true", help="Keep polling until every job is imported")
+    poll_parser.add_argument("--interval", type=float, default=60.0, help="Seconds between polls with --wait")
+    poll_parser.add_argument("--timeout", type=float, help="Give up waiting after this many seconds")
+    poll_parser.set_defaults(handler=command_jobs_poll)
+
+    list_parser = job_commands.add_parser("list", parents=[common], help="List batch jobs")
+    list_parser.add_argument("--active", action="store_true", help="Only jobs not imported yet")
+    list_parser.set_defaults(handler=command_jobs_list)
+
+    cancel_parser = job_commands.add_parser("cancel", parents=[common], help="Cancel a batch job")
+    cancel_parser.add_argument("job_id", type=int, help="Job id, as shown by jobs list")
+    cancel_parser.set_defaults(handler=command_jobs_cancel)
+    return parser
+
+
+def main(argv=None):
+    """Run one command and return its exit status"""
+    args = build_parser().parse_args(argv)
+    db = Database(args.db)
+    try:
+        return args.handler(db, args)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
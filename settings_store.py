@@ -0,0 +1,79 @@
+# This Python file uses the following encoding: utf-8
+from model_catalog import DEFAULT_MODEL_FILTER
+
+
+class AppSettings:
+    """Typed in-memory copy of the settings row"""
+    __slots__ = ('api_key', 'model', 'font_family', 'font_size', 'random_no_repeat', 'model_filter')
+
+    def __init__(self, api_key=None, model="gpt-4", font_family="Arial", font_size=10, random_no_repeat=False,
+                 model_filter=DEFAULT_MODEL_FILTER):
+        """Initialize the settings, coercing values to their types"""
+        self.api_key = api_key or None
+        self.model = model or "gpt-4"
+        self.font_family = font_family or "Arial"
+        self.font_size = int(font_size) if font_size else 10
+        self.random_no_repeat = bool(random_no_repeat)
+        self.model_filter = DEFAULT_MODEL_FILTER if model_filter is None else model_filter
+
+    @classmethod
+    def from_row(cls, row):
+        """Build settings from a Database.load_settings dict, ignoring missing or NULL values"""
+        return cls(**{name: value for name, value in row.items() if value is not None})
+
+
+class SettingsStore:
+    """Loads the settings row once and writes changes through to the database
+
+    Reads are served from memory. update() persists changed fields with a
+    single upsert and then calls every listener with a dict of the fields
+    that changed.
+    """
+
+    def __init__(self, db):
+        """Load the settings row from the database"""
+        self.db = db
+        self.settings = AppSettings.from_row(db.load_settings())
+        self.listeners = []
+
+    def __getattr__(self, name):
+        """Expose the settings fields directly on the store"""
+        if name in AppSettings.__slots__:
+            return getattr(self.settings, name)
+        raise AttributeError(name)
+
+    def add_listener(self, listener):
+        """Register listener(changes) to be called after settings change"""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Unregister a settings listener"""
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def update(self, **values):
+        """Persist and apply changed settings; returns False if the write failed"""
+        unknown = set(values) - set(AppSettings.__slots__)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+
+        # Coerce through AppSettings so the cached values keep their types
+        current = {name: getattr(self.settings, name) for name in AppSettings.__slots__}
+        coerced = AppSettings(**{**current, **values})
+        changes = {name: getattr(coerced, name) for name in values
+                   if getattr(coerced, name) != current[name]}
+        if not changes:
+            return True
+
+        stored = {name: int(value) if isinstance(value, bool) else value for name, value in changes.items()}
+        if not self.db.upsert_settings(**stored):
+            return False
+
+        for name, value in changes.items():
+            setattr(self.settings, name, value)
+        for listener in list(self.listeners):
+            try:
+                listener(changes)
+            except Exception as e:
+                print(f"Error in settings listener: {e}")
+        return True
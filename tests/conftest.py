@@ -0,0 +1,36 @@
+# This Python file uses the following encoding: utf-8
+import os
+import sys
+import csv
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A fresh database in a temporary directory"""
+    database = Database(str(tmp_path / "rewrites.db"))
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def write_csv(tmp_path):
+    """Return a function writing (excerpt, analysis, rewrite) rows to an import CSV and returning its path"""
+    written = []
+
+    def write(rows):
+        path = tmp_path / f"import-{len(written)}.csv"
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Excerpt', 'Analysis', 'Rewrite'])
+            writer.writerows(rows)
+        written.append(path)
+        return str(path)
+    return write
@@ -0,0 +1,109 @@
+# This Python file uses the following encoding: utf-8
+import json
+
+import pytest
+
+from batch_jobs import BatchJobManager, parse_result_line
+
+
+def batch_results(db):
+    """Return every batch result as (excerpt_id, success, response) in excerpt order"""
+    return db.conn.execute(
+        "SELECT excerpt_id, success, response FROM batch_results ORDER BY excerpt_id").fetchall()
+
+
+def test_parse_result_line():
+    success = {'custom_id': "excerpt-7", 'response': {'status_code': 200, 'body': {
+        'choices': [{'message': {'content': "Fine"}}]}}}
+    failure = {'custom_id': "excerpt-8", 'response': {'status_code': 400, 'body': {'error': {'message': "Bad"}}}}
+    assert parse_result_line(json.dumps(success)) == (7, True, "Fine")
+    assert parse_result_line(json.dumps(failure)) == (8, False, "Batch request failed: Bad")
+    assert parse_result_line(json.dumps({'custom_id': "other-1"})) is None
+
+
+@pytest.fixture
+def openai_api():
+    """An OpenAIAPI that fails fast instead of retrying"""
+    from openai_api import OpenAIAPI
+    from resilience import RetryPolicy
+    return OpenAIAPI(api_key="test", model="gpt-test", retry_policy=RetryPolicy(max_attempts=1))
+
+
+@pytest.fixture
+def corpus(db, write_csv):
+    """A database with five excerpts, the third asking the stand-in server to fail"""
+    rows = [(f"Excerpt {i}", "", f"Rewrite {i}") for i in range(1, 6)]
+    rows[2] = ("Excerpt FAIL", "", "Rewrite 3")
+    db.import_csv(write_csv(rows))
+    return db
+
+
+@pytest.fixture
+def manager(corpus, openai_api, monkeypatch):
+    """A BatchJobManager talking to a stand-in server on a free port"""
+    from http_pool import HTTPPool
+    from batch_stand_in_server import serve
+    server = serve()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    openai_api.http_pool = HTTPPool(http2=False)
+    yield BatchJobManager(corpus, openai_api)
+    server.shutdown()
+    openai_api.http_pool.close()
+
+
+@pytest.fixture
+def template():
+    """The prompt the tests submit"""
+    from prompt_registry import PromptTemplate
+    return PromptTemplate("Basic Analysis", "{excerpt} {rewrite}")
+
+
+def test_submit_poll_import_cycle(manager, corpus, template):
+    manager.MAX_REQUESTS_PER_JOB = 2
+    success, message = manager.submit(template)
+    assert success, message
+    assert "5 request(s) in 3 job(s)" in message
+    assert len(corpus.get_batch_jobs(active_only=True)) == 3
+
+    # Submitting again while jobs are unfinished would send excerpts twice
+    assert manager.submit(template)[0] is False
+
+    # The stand-in moves a batch from validating to in_progress to completed, one step per poll
+    success, message = manager.poll()
+    assert success and message.count("in_progress") == 3
+    success, message = manager.poll()
+    assert success, message
+    assert not corpus.get_batch_jobs(active_only=True)
+    assert [row[:2] for row in batch_results(corpus)] == [(1, 1), (2, 1), (3, 0), (4, 1), (5, 1)]
+    assert manager.poll() == (True, "No unfinished batch jobs")
+
+    # Only the failed excerpt is submitted again
+    success, message = manager.submit(template)
+    assert success and "Submitted 1 request(s) in 1 job(s)" in message
+
+
+def test_wait_imports_results(manager, corpus, template):
+    success, message = manager.submit(template, limit=4)
+    assert success, message
+    assert "Submitted 4 request(s) in 1 job(s)" in message
+
+    success, message = manager.wait(interval=0, timeout=30)
+    assert "imported 3 result(s), 1 failed" in message
+    results = batch_results(corpus)
+    assert [row[:2] for row in results] == [(1, 1), (2, 1), (3, 0), (4, 1)]
+    assert results[0][2] == "Stand-in analysis of a 4-word prompt."
+    assert "Stand-in failure" in results[2][2]
+
+    # The failed and unsubmitted excerpts are still pending
+    assert corpus.count_pending_batch_excerpts(manager.default_run_name("Basic Analysis")) == 2
+
+
+def test_cancel(manager, corpus, template):
+    manager.submit(template)
+    job = corpus.get_batch_jobs(active_only=True)[0]
+    success, message = manager.cancel(job['id'])
+    assert success and message == f"Job {job['id']} is cancelling"
+    manager.wait(interval=0, timeout=30)
+    assert corpus.get_batch_jobs()[0]['status'] == "cancelled"
+    assert batch_results(corpus) == []
+    assert manager.cancel(job['id'])[0] is False
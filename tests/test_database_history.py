@@ -0,0 +1,48 @@
+# This Python file uses the following encoding: utf-8
+import pytest
+
+from analysis_result import AnalysisResult
+
+
+@pytest.fixture
+def history(db):
+    """A database with analyses of two excerpts, several sharing a timestamp"""
+    for i in range(30):
+        result = AnalysisResult(excerpt_id=1 + i % 2, model="gpt-test", prompt_name="Basic Analysis",
+                                rewrite=f"Rewrite {i}", response=f"Response {i}", created_at=1000.0 + i // 4)
+        db.save_analysis(result)
+    return db
+
+
+def newest_first(db, excerpt_id=None):
+    """Return the ids of every analysis in history order"""
+    where = "WHERE excerpt_id = ?" if excerpt_id is not None else ""
+    params = (excerpt_id,) if excerpt_id is not None else ()
+    return [row[0] for row in db.conn.execute(
+        f"SELECT id FROM analyses {where} ORDER BY created_at DESC, id DESC", params)]
+
+
+@pytest.mark.parametrize("excerpt_id", [None, 2])
+def test_pages_older_through_ties(history, excerpt_id):
+    ids = []
+    key = None
+    while True:
+        page = history.get_analysis_page(excerpt_id=excerpt_id, before=key, limit=3)
+        if not page:
+            break
+        ids.extend(result.id for result in page)
+        key = (page[-1].created_at, page[-1].id)
+    assert ids == newest_first(history, excerpt_id)
+
+
+def test_pages_newer_in_newest_first_order(history):
+    expected = newest_first(history)
+    page = history.get_analysis_page(limit=30)[-5:]
+    newer = history.get_analysis_page(after=(page[0].created_at, page[0].id), limit=4)
+    assert [result.id for result in newer] == expected[-9:-5]
+
+
+def test_page_rows_skip_the_long_columns(history):
+    page = history.get_analysis_page(limit=1)
+    assert page[0].response is None and page[0].rewrite is None
+    assert history.get_analysis(page[0].id).response.startswith("Response")
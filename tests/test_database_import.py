@@ -0,0 +1,106 @@
+# This Python file uses the following encoding: utf-8
+import pytest
+
+
+def stored(db):
+    """Return every excerpt as (excerpt, analysis, rewrite) in id order"""
+    return db.conn.execute("SELECT excerpt, analysis, rewrite FROM excerpts ORDER BY id").fetchall()
+
+
+def test_repeats_match_by_normalized_content(db, write_csv):
+    success, message = db.import_csv(write_csv([
+        ("The quick  fox", "a1", ""),
+        ("the QUICK fox", "a2", ""),
+        ("A slow dog", "a3", ""),
+    ]))
+    assert success, message
+    assert stored(db) == [("The quick  fox", "a1", ""), ("A slow dog", "a3", "")]
+    assert "2 new, 0 updated, 1 skipped" in message
+
+
+def test_skip_leaves_stored_rows_alone(db, write_csv):
+    db.import_csv(write_csv([("One", "first", "r1")]))
+    success, message = db.import_csv(write_csv([("one", "second", "r2"), ("Two", "", "")]), mode="skip")
+    assert success, message
+    assert stored(db) == [("One", "first", "r1"), ("Two", "", "")]
+    assert "1 new, 0 updated, 1 skipped" in message
+
+
+def test_update_overwrites_with_non_empty_values(db, write_csv):
+    db.import_csv(write_csv([("One", "first", "r1"), ("Two", "keep", "r2")]))
+    success, message = db.import_csv(write_csv([("One", "second", ""), ("Two", "keep", "r2")]), mode="update")
+    assert success, message
+    assert stored(db) == [("One", "second", "r1"), ("Two", "keep", "r2")]
+    assert "0 new, 1 updated, 1 skipped" in message
+
+
+def test_update_keeps_the_last_repeat_in_the_file(db, write_csv):
+    db.import_csv(write_csv([("One", "", "")]))
+    db.import_csv(write_csv([("One", "early", ""), ("ONE", "late", "")]), mode="update")
+    assert stored(db) == [("One", "late", "")]
+
+
+def test_keep_both_stores_every_copy(db, write_csv):
+    db.import_csv(write_csv([("One", "first", "")]))
+    success, message = db.import_csv(write_csv([("One", "second", ""), ("one", "third", "")]), mode="keep-both")
+    assert success, message
+    assert stored(db) == [("One", "first", ""), ("One", "second", ""), ("one", "third", "")]
+
+    # Only the original carries the hash, so a later skip import still matches it alone
+    db.import_csv(write_csv([("One", "fourth", "")]), mode="skip")
+    assert len(stored(db)) == 3
+
+
+@pytest.mark.parametrize("single_transaction", [True, False])
+def test_chunked_import_keeps_every_row_in_order(db, write_csv, single_transaction):
+    rows = [(f"Excerpt {i}", f"Analysis {i}", "") for i in range(20)]
+    success, message = db.import_csv(write_csv(rows), chunk_size=3, single_transaction=single_transaction)
+    assert success, message
+    assert stored(db) == rows
+    assert not db.conn.in_transaction
+
+
+@pytest.mark.parametrize("single_transaction", [True, False])
+def test_chunked_import_matches_across_chunks(db, write_csv, single_transaction):
+    rows = [(f"Excerpt {i % 7}", f"a{i}", "") for i in range(20)]
+    success, message = db.import_csv(write_csv(rows), chunk_size=3, single_transaction=single_transaction)
+    assert success, message
+    assert len(stored(db)) == 7
+    assert not db.conn.in_transaction
+    assert db.search("Excerpt")
+
+
+def test_multi_line_fields_count_as_one_row(db, write_csv):
+    success, message = db.import_csv(write_csv([("First line\nsecond line", "", ""), ("Other", "", "Rewrite")]))
+    assert success and "2 new" in message
+    assert stored(db)[0][0] == "First line\nsecond line"
+
+
+def test_progress_is_reported_per_chunk(db, write_csv):
+    calls = []
+    path = write_csv([(f"Excerpt {i}", "", "") for i in range(7)])
+    db.import_csv(path, chunk_size=3, progress_callback=lambda *args: calls.append(args))
+    assert [rows for rows, _, _ in calls] == [3, 6, 7]
+    total = calls[-1][2]
+    assert calls[-1][1] == total
+    assert all(read <= total for _, read, _ in calls)
+
+
+def test_unknown_mode_and_missing_columns_are_refused(db, tmp_path, write_csv):
+    assert db.import_csv(write_csv([("One", "", "")]), mode="merge")[0] is False
+    path = tmp_path / "bad.csv"
+    path.write_text("Excerpt\nOne\n", encoding="utf-8")
+    success, message = db.import_csv(str(path))
+    assert not success and "Excerpt, Analysis, and Rewrite" in message
+    assert stored(db) == []
+
+
+def test_import_indexes_rows_and_leaves_the_trigger_active(db, write_csv):
+    db.import_csv(write_csv([(f"Imported {i}", "", "") for i in range(10)]), chunk_size=4, single_transaction=False)
+    assert len(db.search("Imported")) == 10
+    assert db.conn.execute("SELECT COUNT(*) FROM fts_paused").fetchone()[0] == 0
+
+    # Rows written outside an import are still indexed by the trigger
+    db.conn.execute("INSERT INTO excerpts (excerpt) VALUES ('Outsider')")
+    db.conn.commit()
+    assert len(db.search("Outsider")) == 1
@@ -0,0 +1,77 @@
+# This Python file uses the following encoding: utf-8
+import pytest
+
+
+@pytest.fixture
+def paged_db(db, write_csv):
+    """A database with 25 excerpts, every other one with a rewrite"""
+    success, message = db.import_csv(write_csv(
+        [(f"Excerpt {i}", "", f"rewrite {i}" if i % 2 else "") for i in range(25)]))
+    assert success, message
+    return db
+
+
+def test_iter_excerpt_pages_covers_every_row(paged_db):
+    pages = list(paged_db.iter_excerpt_pages(batch_size=10, columns=('id',)))
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [row[0] for page in pages for row in page] == list(range(1, 26))
+    assert [row[0] for row in paged_db.iter_excerpts(batch_size=7, after_id=20, columns=('id',))] == [21, 22, 23, 24, 25]
+
+
+def test_iter_excerpts_with_filters(paged_db):
+    rows = list(paged_db.iter_excerpts(batch_size=4, filters={'has_rewrite': True}))
+    assert len(rows) == paged_db.count_excerpts({'has_rewrite': True}) == 12
+    assert all(row[3] for row in rows)
+    assert [row[0] for row in rows] == sorted(row[0] for row in rows)
+
+
+@pytest.fixture
+def tied_db(db, write_csv):
+    """A database whose excerpts share sort prefixes, so the excerpt order has ties broken by id"""
+    prefix = "x" * db.EXCERPT_SORT_PREFIX
+    rows = []
+    for i in range(25):
+        # Five groups whose members differ only after the sort prefix
+        rows.append((f"{'abcde'[i % 5]}{prefix} {i}", "", f"rewrite {i}" if i % 2 else ""))
+    success, message = db.import_csv(write_csv(rows))
+    assert success, message
+    return db
+
+
+def read_all(db, sort, descending, limit, filters=None):
+    """Page through get_excerpt_previews and return the ids in order"""
+    ids = []
+    after = None
+    while True:
+        rows = db.get_excerpt_previews(sort, descending, after, limit, filters)
+        ids.extend(row[1] for row in rows)
+        if len(rows) < limit:
+            return ids
+        after = rows[-1][:2]
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("limit", [1, 3, 4, 100])
+def test_excerpt_order_pages_through_ties_exactly_once(tied_db, descending, limit):
+    expected = [row[1] for row in tied_db.get_excerpt_previews('excerpt', descending, None, 1000)]
+    ids = read_all(tied_db, 'excerpt', descending, limit)
+    assert ids == expected
+    assert sorted(ids) == list(range(1, 26))
+
+
+def test_ties_are_ordered_by_id(tied_db):
+    rows = tied_db.get_excerpt_previews('excerpt', False, None, 1000)
+    keys = [(row[0].lower(), row[1]) for row in rows]
+    assert keys == sorted(keys)
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_id_order_pages(tied_db, descending):
+    ids = read_all(tied_db, 'id', descending, 4)
+    assert ids == sorted(range(1, 26), reverse=descending)
+
+
+def test_paging_with_filters(tied_db):
+    ids = read_all(tied_db, 'excerpt', False, 2, {'has_rewrite': True})
+    assert len(ids) == tied_db.count_excerpts({'has_rewrite': True}) == 12
+    assert all(tied_db.get_excerpt_by_id(excerpt_id)[3] for excerpt_id in ids)
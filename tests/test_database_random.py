@@ -0,0 +1,39 @@
+# This Python file uses the following encoding: utf-8
+from collections import Counter
+
+
+def test_deck_draws_every_excerpt_once_per_pass(db, write_csv):
+    db.import_csv(write_csv([(f"Excerpt {i}", "", "") for i in range(10)]))
+    first_pass = [db.get_random_excerpt(no_repeat=True)[0] for _ in range(10)]
+    assert sorted(first_pass) == list(range(1, 11))
+    second_pass = [db.get_random_excerpt(no_repeat=True)[0] for _ in range(10)]
+    assert sorted(second_pass) == list(range(1, 11))
+
+
+def test_imported_excerpts_join_the_current_deck(db, write_csv):
+    db.import_csv(write_csv([(f"Excerpt {i}", "", "") for i in range(6)]))
+    drawn = [db.get_random_excerpt(no_repeat=True)[0] for _ in range(3)]
+    db.import_csv(write_csv([(f"New {i}", "", "") for i in range(4)]), chunk_size=3)
+    rest = [db.get_random_excerpt(no_repeat=True)[0] for _ in range(7)]
+    assert sorted(drawn + rest) == list(range(1, 11))
+    assert not db.conn.in_transaction
+
+
+def test_empty_corpus_draws_nothing(db):
+    assert db.get_random_excerpt() is None
+    assert db.get_random_excerpt(no_repeat=True) is None
+    assert not db.conn.in_transaction
+
+
+def test_sparse_ids_are_all_reachable(db, write_csv, monkeypatch):
+    db.import_csv(write_csv([(f"Excerpt {i}", "", "") for i in range(100)]))
+    db.conn.execute("DELETE FROM excerpts WHERE id NOT IN (1, 2, 3, 100)")
+    db.conn.commit()
+
+    # Force the offset lookup that follows failed id probes
+    monkeypatch.setattr(db, "RANDOM_SAMPLE_ATTEMPTS", 0)
+    drawn = Counter(db.get_random_excerpt()[0] for _ in range(400))
+    assert set(drawn) == {1, 2, 3, 100}
+
+    # A row after a wide gap is not favoured
+    assert drawn[100] < 200
@@ -0,0 +1,64 @@
+# This Python file uses the following encoding: utf-8
+import pytest
+
+from navigation_cache import NavigationCache
+
+
+@pytest.fixture
+def cache(db, write_csv):
+    """A navigation cache over five excerpts"""
+    db.import_csv(write_csv([(f"Excerpt {i}", "", "") for i in range(1, 6)]))
+    navigation = NavigationCache(db, window=2, random_pool=0)
+    yield navigation
+    navigation.close()
+
+
+def settle(cache):
+    """Wait for scheduled prefetches to finish"""
+    cache.executor.submit(lambda: None).result()
+
+
+def test_steps_wrap_around_and_are_served_from_memory(cache):
+    assert cache.get_first()[0] == 1
+    settle(cache)
+    misses = cache.misses
+    assert cache.get_next(1)[0] == 2
+    assert cache.get_previous(1)[0] == 5
+    assert cache.misses == misses
+
+
+def test_invalidation_drops_cached_rows(cache, db):
+    cache.get_first()
+    settle(cache)
+    db.update_rewrite(2, "new rewrite")
+    assert cache.entries[2][0] is None
+    assert cache.get_next(1)[3] == "new rewrite"
+
+    generation = cache.generation
+    db.clear_database()
+    assert cache.generation > generation
+    assert not cache.entries and cache.first_id is None
+    assert cache.get_first() is None
+
+
+def test_row_fetched_across_an_invalidation_is_not_cached(cache, db, monkeypatch):
+    # Without prefetching nothing else stores the row
+    monkeypatch.setattr(cache, "prefetch_around", lambda row: None)
+    fetch = db.get_next_excerpt
+
+    def racing_fetch(current_id):
+        row = fetch(current_id)
+        cache.handle_change("import")
+        return row
+
+    row = cache._step(1, 2, racing_fetch)
+    assert row[0] == 2
+    assert 2 not in cache.entries
+
+
+def test_prefetch_from_an_old_generation_is_discarded(cache):
+    cache.get_first()
+    settle(cache)
+    cache.handle_change("import")
+    cache._prefetch(1, cache.generation - 1)
+    assert not cache.entries
@@ -0,0 +1,109 @@
+# This Python file uses the following encoding: utf-8
+from request_broker import RequestBroker
+
+
+class FakeSignal:
+    """Stand-in for a Qt signal"""
+
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def emit(self):
+        for slot in self.slots:
+            slot()
+
+
+class FakeSignals:
+    def __init__(self):
+        self.finished = FakeSignal()
+
+
+class FakeWorker:
+    """A worker that never runs; the test finishes it"""
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+        self.signals = FakeSignals()
+
+    def is_cancelled(self):
+        return self.cancelled
+
+
+class FakeExecutor:
+    """Records submissions and cancellations like RequestExecutor"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args, **kwargs):
+        worker = FakeWorker(fn, args)
+        self.submitted.append(worker)
+        return worker
+
+    def cancel(self, worker):
+        worker.cancelled = True
+        worker.signals.finished.emit()
+
+
+def test_identical_requests_are_coalesced():
+    executor = FakeExecutor()
+    broker = RequestBroker(executor)
+    first, created = broker.submit("key", 1, print, "a")
+    second, created_again = broker.submit("key", 1, print, "a")
+    assert created and not created_again
+    assert second is first
+    assert len(executor.submitted) == 1
+
+
+def test_different_keys_are_submitted_separately():
+    executor = FakeExecutor()
+    broker = RequestBroker(executor)
+    first, _ = broker.submit("a", 1, print)
+    second, _ = broker.submit("b", 1, print)
+    assert first is not second
+    assert len(executor.submitted) == 2
+
+
+def test_finished_request_is_forgotten():
+    executor = FakeExecutor()
+    broker = RequestBroker(executor)
+    first, _ = broker.submit("key", 1, print)
+    first.signals.finished.emit()
+    assert broker.in_flight == {} and broker.scopes == {}
+    second, created = broker.submit("key", 1, print)
+    assert created and second is not first
+
+
+def test_cancelled_request_is_not_reused():
+    executor = FakeExecutor()
+    broker = RequestBroker(executor)
+    first, _ = broker.submit("key", 1, print)
+    first.cancelled = True
+    second, created = broker.submit("key", 1, print)
+    assert created and second is not first
+
+
+def test_supersede_cancels_only_other_scopes():
+    executor = FakeExecutor()
+    broker = RequestBroker(executor)
+    stale, _ = broker.submit("a", 1, print)
+    current, _ = broker.submit("b", 2, print)
+    assert broker.supersede(2) == 1
+    assert stale.is_cancelled() and not current.is_cancelled()
+    assert list(broker.scopes) == [current]
+    assert broker.supersede(2) == 0
+
+
+def test_late_finish_of_replaced_worker_keeps_new_one():
+    executor = FakeExecutor()
+    broker = RequestBroker(executor)
+    first, _ = broker.submit("key", 1, print)
+    first.cancelled = True
+    second, _ = broker.submit("key", 1, print)
+    first.signals.finished.emit()
+    assert broker.in_flight["key"] is second
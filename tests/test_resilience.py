@@ -0,0 +1,149 @@
+# This Python file uses the following encoding: utf-8
+import random
+
+import pytest
+
+from resilience import APIError, CircuitBreaker, RetryPolicy, call_with_retries
+
+
+class FakeClock:
+    """A monotonic clock the test advances by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def transient():
+    return APIError("Server error", kind='server', status=500)
+
+
+def test_delay_is_bounded_by_backoff_and_max_delay():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0, rng=random.Random(1))
+    for attempt in range(10):
+        assert 0 <= policy.delay(attempt) <= min(5.0, 2 ** attempt)
+
+
+def test_delay_honours_retry_after():
+    policy = RetryPolicy(base_delay=0.1, max_delay=0.1, rng=random.Random(1))
+    assert policy.delay(0, retry_after=7.0) == 7.0
+
+
+def test_should_retry_only_transient_errors_within_limits():
+    policy = RetryPolicy(max_attempts=3, max_retry_after=60)
+    assert policy.should_retry(transient(), 0)
+    assert policy.should_retry(transient(), 1)
+    assert not policy.should_retry(transient(), 2)
+    assert not policy.should_retry(APIError("Bad key", kind='auth', status=401), 0)
+    assert not policy.should_retry(APIError("Slow down", kind='rate_limit', retry_after=120), 0)
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record_failure(transient())
+    assert breaker.state == 'closed'
+    breaker.record_failure(transient())
+    assert breaker.state == 'open'
+    with pytest.raises(APIError) as raised:
+        breaker.before_request()
+    assert raised.value.kind == 'circuit_open'
+    assert breaker.retry_in() == 30
+
+    clock.now += 30
+    assert breaker.state == 'half-open'
+    breaker.before_request()
+
+    # Only one trial request goes through while half-open
+    with pytest.raises(APIError):
+        breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_request()
+
+
+def test_failed_trial_reopens_the_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure(transient())
+    clock.now += 10
+    breaker.before_request()
+    breaker.record_failure(transient())
+    assert breaker.state == 'open'
+    assert breaker.retry_in() == 10
+
+
+def test_non_transient_error_resets_the_count():
+    breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+    breaker.record_failure(transient())
+    breaker.record_failure(APIError("Bad request", kind='bad_request', status=400))
+    breaker.record_failure(transient())
+    assert breaker.state == 'closed'
+
+
+def test_call_with_retries_retries_until_success():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise transient()
+        return "ok"
+
+    policy = RetryPolicy(max_attempts=4, base_delay=0, max_delay=0)
+    assert call_with_retries(flaky, policy, CircuitBreaker(), sleep=lambda seconds: None) == "ok"
+    assert len(calls) == 3
+
+
+def test_call_with_retries_gives_up_with_attempt_count():
+    def failing():
+        raise transient()
+
+    policy = RetryPolicy(max_attempts=2, base_delay=0, max_delay=0)
+    with pytest.raises(APIError) as raised:
+        call_with_retries(failing, policy, sleep=lambda seconds: None)
+    assert raised.value.kind == 'server'
+    assert raised.value.attempts == 2
+
+
+def test_call_with_retries_stops_when_cancelled():
+    def failing():
+        raise transient()
+
+    policy = RetryPolicy(max_attempts=4, base_delay=10, max_delay=10, rng=random.Random(3))
+    with pytest.raises(APIError) as raised:
+        call_with_retries(failing, policy, should_cancel=lambda: True, sleep=lambda seconds: None)
+    assert raised.value.kind == 'cancelled'
+
+
+def test_interrupted_trial_lets_another_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure(transient())
+    clock.now += 10
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        call_with_retries(interrupted, RetryPolicy(), breaker)
+    assert breaker.before_request() is True
+
+
+def test_response_without_choices_is_an_api_error(monkeypatch):
+    from types import SimpleNamespace
+    from openai_api import OpenAIAPI
+    from analysis_result import AnalysisResult
+    completions = SimpleNamespace(create=lambda **kwargs: SimpleNamespace(choices=[], usage=None))
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    api = OpenAIAPI(api_key="test", retry_policy=RetryPolicy(max_attempts=2, base_delay=0, max_delay=0))
+    monkeypatch.setattr(api, "require_client", lambda: client)
+    result = AnalysisResult()
+    success, message = api.analyze_rewrite("Excerpt", "Rewrite", "{excerpt} {rewrite}", result=result)
+    assert not success
+    assert result.error.kind == 'server' and result.error.attempts == 2
+    assert "no choices" in message
@@ -0,0 +1,249 @@
+# This Python file uses the following encoding: utf-8
+"""Local stand-in for the OpenAI file and batch endpoints
+
+Keeps uploaded files and batches in memory and answers every request
+locally, so batch jobs can be exercised without an API key or network
+access. A batch moves from validating to in_progress to completed as it
+is polled; requests whose prompt contains FAIL end up in the error file.
+
+    python tools/batch_stand_in_server.py --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=test python -m rewrites jobs submit
+"""
+import re
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StandInState:
+    """Files and batches held by the server"""
+
+    def __init__(self, polls_per_step=1):
+        """Initialize empty state"""
+        self.polls_per_step = max(1, polls_per_step)
+        self.lock = threading.Lock()
+        self.files = {}
+        self.batches = {}
+
+    def add_file(self, filename, purpose, content):
+        """Store a file and return its file object"""
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with self.lock:
+            self.files[file_id] = {
+                'id': file_id, 'object': "file", 'bytes': len(content), 'created_at': int(time.time()),
+                'filename': filename, 'purpose': purpose, 'status': "processed", 'content': content,
+            }
+            return self.public_file(self.files[file_id])
+
+    @staticmethod
+    def public_file(file):
+        """Return a file object without its content"""
+        return {key: value for key, value in file.items() if key != 'content'}
+
+    def create_batch(self, body):
+        """Create a batch for an uploaded input file"""
+        with self.lock:
+            if body.get('input_file_id') not in self.files:
+                return None
+            batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+            lines = self.files[body['input_file_id']]['content'].decode("utf-8").splitlines()
+            self.batches[batch_id] = {
+                'id': batch_id, 'object': "batch", 'endpoint': body.get('endpoint'),
+                'input_file_id': body['input_file_id'], 'completion_window': body.get('completion_window'),
+                'status': "validating", 'output_file_id': None, 'error_file_id': None,
+                'created_at': int(time.time()), 'metadata': body.get('metadata'), 'errors': None,
+                'request_counts': {'total': len([line for line in lines if line.strip()]), 'completed': 0,
+                                   'failed': 0},
+                'polls': 0,
+            }
+            return self.public_batch(self.batches[batch_id])
+
+    @staticmethod
+    def public_batch(batch):
+        """Return a batch object without the server's bookkeeping"""
+        return {key: value for key, value in batch.items() if key != 'polls'}
+
+    def retrieve_batch(self, batch_id):
+        """Return a batch, advancing its state every polls_per_step retrievals"""
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            batch['polls'] += 1
+            if batch['polls'] % self.polls_per_step == 0:
+                if batch['status'] == "validating":
+                    batch['status'] = "in_progress"
+                elif batch['status'] == "in_progress":
+                    self.finish_batch(batch, "completed")
+                elif batch['status'] == "cancelling":
+                    self.finish_batch(batch, "cancelled", run=False)
+            return self.public_batch(batch)
+
+    def cancel_batch(self, batch_id):
+        """Start cancelling a batch"""
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            if batch['status'] in ("validating", "in_progress"):
+                batch['status'] = "cancelling"
+            return self.public_batch(batch)
+
+    def finish_batch(self, batch, status, run=True):
+        """Answer every request of a batch and write its output and error files"""
+        outputs = []
+        errors = []
+        if run:
+            for line in self.files[batch['input_file_id']]['content'].decode("utf-8").splitlines():
+                if line.strip():
+                    request = json.loads(line)
+                    (errors if "FAIL" in json.dumps(request['body']) else outputs).append(answer(request))
+        for name, records in (('output_file_id', outputs), ('error_file_id', errors)):
+            if records:
+                content = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+                file_id = f"file-{uuid.uuid4().hex[:24]}"
+                self.files[file_id] = {
+                    'id': file_id, 'object': "file", 'bytes': len(content), 'created_at': int(time.time()),
+                    'filename': f"{batch['id']}_{name[:-8]}.jsonl", 'purpose': "batch_output",
+                    'status': "processed", 'content': content,
+                }
+                batch[name] = file_id
+        batch['status'] = status
+        batch['request_counts'].update(completed=len(outputs), failed=len(errors))
+
+
+def answer(request):
+    """Return the output record for one batch request"""
+    prompt = request['body']['messages'][-1]['content']
+    if "FAIL" in prompt:
+        return {'id': f"batch_req_{uuid.uuid4().hex[:12]}", 'custom_id': request['custom_id'],
+                'response': {'status_code': 400, 'request_id': uuid.uuid4().hex,
+                             'body': {'error': {'message': "Stand-in failure requested by the prompt",
+                                                'type': "invalid_request_error"}}},
+                'error': None}
+    words = len(prompt.split())
+    return {'id': f"batch_req_{uuid.uuid4().hex[:12]}", 'custom_id': request['custom_id'],
+            'response': {'status_code': 200, 'request_id': uuid.uuid4().hex, 'body': {
+                'id': f"chatcmpl-{uuid.uuid4().hex[:12]}", 'object': "chat.completion",
+                'created': int(time.time()), 'model': request['body']['model'],
+                'choices': [{'index': 0, 'finish_reason': "stop", 'message': {
+                    'role': "assistant", 'content': f"Stand-in analysis of a {words}-word prompt."}}],
+                'usage': {'prompt_tokens': words, 'completion_tokens': 7, 'total_tokens': words + 7}}},
+            'error': None}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Routes the file and batch endpoints to the shared StandInState"""
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        """Log requests only with --verbose"""
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body):
+        """Send a JSON response"""
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def not_found(self):
+        """Send an OpenAI-style 404"""
+        self.send_json(404, {'error': {'message': f"No such resource: {self.path}", 'type': "invalid_request_error"}})
+
+    def read_body(self):
+        """Read the request body"""
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_POST(self):
+        """Handle file uploads, batch creation and cancellation"""
+        path = self.path.split("?")[0]
+        body = self.read_body()
+        if path == "/v1/files":
+            # Parse the multipart form by handing it to the email parser with its content type
+            message = BytesParser(policy=HTTP).parsebytes(
+                b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+            fields = {}
+            for part in message.iter_parts():
+                fields[part.get_param("name", header="content-disposition")] = (
+                    part.get_filename(), part.get_payload(decode=True))
+            if 'file' not in fields:
+                self.send_json(400, {'error': {'message': "Missing file", 'type': "invalid_request_error"}})
+                return
+            filename, content = fields['file']
+            purpose = fields.get('purpose', (None, b""))[1].decode()
+            self.send_json(200, self.state.add_file(filename, purpose, content))
+        elif path == "/v1/batches":
+            batch = self.state.create_batch(json.loads(body or b"{}"))
+            if batch is None:
+                self.send_json(400, {'error': {'message': "Unknown input file", 'type': "invalid_request_error"}})
+            else:
+                self.send_json(200, batch)
+        elif match := re.fullmatch(r"/v1/batches/([\w-]+)/cancel", path):
+            batch = self.state.cancel_batch(match.group(1))
+            self.send_json(200, batch) if batch else self.not_found()
+        else:
+            self.not_found()
+
+    def do_GET(self):
+        """Handle batch retrieval and file downloads"""
+        path = self.path.split("?")[0]
+        if match := re.fullmatch(r"/v1/batches/([\w-]+)", path):
+            batch = self.state.retrieve_batch(match.group(1))
+            self.send_json(200, batch) if batch else self.not_found()
+        elif match := re.fullmatch(r"/v1/files/([\w-]+)/content", path):
+            file = self.state.files.get(match.group(1))
+            if file is None:
+                self.not_found()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(file['content'])))
+            self.end_headers()
+            self.wfile.write(file['content'])
+        elif match := re.fullmatch(r"/v1/files/([\w-]+)", path):
+            file = self.state.files.get(match.group(1))
+            self.send_json(200, self.state.public_file(file)) if file else self.not_found()
+        else:
+            self.not_found()
+
+
+def serve(port=0, polls_per_step=1, verbose=False):
+    """Start the server on a background thread and return it; server.server_port is the bound port"""
+    handler = type("Handler", (StandInHandler,), {'state': StandInState(polls_per_step)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    """Run the stand-in server until interrupted"""
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI file and batch endpoints")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default 8765)")
+    parser.add_argument("--polls-per-step", type=int, default=1,
+                        help="Retrievals before a batch moves to its next state (default 1)")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args(argv)
+
+    server = serve(args.port, args.polls_per_step, args.verbose)
+    print(f"Stand-in API at http://127.0.0.1:{server.server_port}/v1", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# This Python file uses the following encoding: utf-8
+import threading
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+
+class WorkerSignals(QObject):
+    """Signals emitted by a Worker
+
+    The signals object is created on the thread that builds the worker (the
+    GUI thread), so connected slots on GUI objects are invoked through queued
+    connections and always run on the GUI thread.
+    """
+    result = Signal(object)
+    error = Signal(str)
+    progress = Signal(object)
+    cancelled = Signal()
+    finished = Signal()
+
+
+class Worker(QRunnable):
+    def __init__(self, fn, *args, **kwargs):
+        """Wrap a callable so it can be run on a QThreadPool
+
+        The callable receives the worker as its ``worker`` keyword argument so
+        it can report progress and poll for cancellation.
+        """
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self._cancel_event = threading.Event()
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        """Request cancellation; the result of a cancelled worker is discarded"""
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        """Return True once cancel() has been called"""
+        return self._cancel_event.is_set()
+
+    def report_progress(self, value):
+        """Emit a progress update unless the worker has been cancelled"""
+        if not self.is_cancelled():
+            self.signals.progress.emit(value)
+
+    def run(self):
+        """Run the wrapped callable and emit the outcome"""
+        try:
+            if self.is_cancelled():
+                return
+            result = self.fn(*self.args, worker=self, **self.kwargs)
+            if self.is_cancelled():
+                return
+            self.signals.result.emit(result)
+        except Exception as e:
+            if not self.is_cancelled():
+                self.signals.error.emit(str(e))
+        finally:
+            if self.is_cancelled():
+                self.signals.cancelled.emit()
+            self.signals.finished.emit()
+
+
+class RequestExecutor(QObject):
+    """Runs callables on a QThreadPool and keeps track of in-flight workers"""
+    active_count_changed = Signal(int)
+
+    def __init__(self, max_threads=4, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.workers = set()
+
+    def submit(self, fn, *args, on_result=None, on_error=None, on_progress=None,
+               on_finished=None, **kwargs):
+        """Queue fn(*args, worker=..., **kwargs) and return its Worker"""
+        worker = Worker(fn, *args, **kwargs)
+        if on_result:
+            worker.signals.result.connect(on_result)
+        if on_error:
+            worker.signals.error.connect(on_error)
+        if on_progress:
+            worker.signals.progress.connect(on_progress)
+        if on_finished:
+            worker.signals.finished.connect(on_finished)
+        worker.signals.finished.connect(lambda: self._forget(worker))
+
+        self.workers.add(worker)
+        self.pool.start(worker)
+        self.active_count_changed.emit(len(self.workers))
+        return worker
+
+    def cancel(self, worker):
+        """Cancel a single worker, dropping it from the queue if not yet started"""
+        worker.cancel()
+        if self.pool.tryTake(worker):
+            # The worker never ran, so emit its terminal signals ourselves
+            worker.signals.cancelled.emit()
+            worker.signals.finished.emit()
+
+    def cancel_all(self):
+        """Cancel every in-flight worker"""
+        for worker in list(self.workers):
+            self.cancel(worker)
+
+    def active_count(self):
+        """Return the number of workers that have not finished yet"""
+        return len(self.workers)
+
+    def wait_for_done(self, msecs=-1):
+        """Block until all queued workers have finished"""
+        return self.pool.waitForDone(msecs)
+
+    def _forget(self, worker):
+        """Drop the reference to a finished worker"""
+        self.workers.discard(worker)
+        self.active_count_changed.emit(len(self.workers))